@@ -16,11 +16,12 @@ import json
 import logging
 from time import perf_counter
 import time
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from decouple import config
-from openai import OpenAI
+import httpx
+import openai
+from openai import AsyncOpenAI
 from selectevent import select_calendar_event_by_index
-from weather_utils import get_cancun_weather
 
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from openai.types.chat import ChatCompletionMessageToolCall
@@ -36,23 +37,151 @@ logging.basicConfig(
 logger = logging.getLogger("aiagent")
 
 # ──────────────────────── OPENAI CLIENT ───────────────────────────
+# Cliente async compartido por todas las llamadas: un pool keep-alive de
+# conexiones HTTP/1.1 a api.openai.com (sin handshake TLS por turno). Las
+# peticiones no bloquean el event loop y se cancelan con la tarea GPT.
+OPENAI_TIMEOUT = httpx.Timeout(15.0, connect=3.0)   # por lectura; connect corto
+OPENAI_MAX_CONNECTIONS = config("OPENAI_MAX_CONNECTIONS", default=50, cast=int)
+OPENAI_KEEPALIVE_EXPIRY = 60.0                      # s que vive una conexión ociosa en el pool
+
+
+def make_openai_client(api_key: str, transport: Optional[httpx.AsyncBaseTransport] = None) -> AsyncOpenAI:
+    """AsyncOpenAI sobre un httpx.AsyncClient con pool keep-alive (transport: para pruebas)."""
+    http_client = httpx.AsyncClient(
+        timeout=OPENAI_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        transport=transport,
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client, timeout=OPENAI_TIMEOUT, max_retries=1)
+
+
+client: Optional[AsyncOpenAI] = None
 try:
-    client = OpenAI(api_key=config("CHATGPT_SECRET_KEY"))
+    client = make_openai_client(config("CHATGPT_SECRET_KEY"))
 except Exception as e:
     logger.critical(f"No se pudo inicializar el cliente OpenAI. Verifica CHATGPT_SECRET_KEY: {e}")
 
-# ────────────────── IMPORTS DE TOOLS DE NEGOCIO ───────────────────
-import buscarslot
-from utils import search_calendar_event_by_phone
-from consultarinfo import get_consultorio_data_from_cache
-from crearcita import create_calendar_event
-from editarcita import edit_calendar_event
-from eliminarcita import delete_calendar_event
+
+async def close_openai_client() -> None:
+    """Cierra el pool de conexiones (shutdown de la app)."""
+    if client is not None:
+        await client.close()
+
+# ────────────────── TOOLS DE NEGOCIO (esquemas + funciones) ───────
+from tool_registry import TOOLS
 
 # prompt dinámico (system)
 from prompt import generate_openai_prompt
+from turn_trace import trace_mark
+from metrics import (
+    GPT_CACHED_PROMPT_TOKENS,
+    GPT_HISTORY_TOKENS,
+    GPT_PASS_SECONDS,
+    GPT_PROMPT_TOKENS,
+    RESPONSE_TEMPLATES_USED,
+    TOOL_SECONDS,
+)
+from tool_executor import ToolExecutor
+from response_templates import render_tool_response
+from history_manager import HistoryCompactor, message_tokens, remember_tool_result
+from state_store import session_state
+
+# ══════════════════ EJECUCIÓN DE TOOLS ═════════════════════════════
+# Timeouts (s) por tool; las de calendario hacen varias peticiones a Google
+TOOL_TIMEOUTS_S = {
+    "read_sheet_data": 3.0,          # caché; solo va a Sheets si está vacía
+    "get_cancun_weather": 3.0,
+    "process_appointment_request": 5.0,
+    "search_calendar_event_by_phone": 5.0,
+    "create_calendar_event": 8.0,
+    "edit_calendar_event": 8.0,
+    "delete_calendar_event": 8.0,
+}
+TOOL_EXECUTOR = ToolExecutor(
+    max_workers=config("TOOL_MAX_WORKERS", default=16, cast=int),
+    timeouts=TOOL_TIMEOUTS_S,
+    default_timeout=5.0,
+    # Solo memoria: en línea, sin saltar a un hilo
+    inline=("detect_intent", "set_mode", "end_call"),
+    serial=("create_calendar_event", "edit_calendar_event", "delete_calendar_event"),
+)
 
 # ══════════════════ HELPERS ═══════════════════════════════════════
+# Historial que se manda a GPT: últimos turnos tal cual + resumen, con tope de tokens
+HISTORY = HistoryCompactor(
+    keep_turns=config("HISTORY_KEEP_TURNS", default=6, cast=int),
+    budget_tokens=config("HISTORY_TOKEN_BUDGET", default=1500, cast=int),
+    fold_step=config("HISTORY_FOLD_STEP", default=2, cast=int),
+)
+
+# Plantillas para resultados de tools con forma fija (response_templates.py)
+RESPONSE_TEMPLATES = config("RESPONSE_TEMPLATES", default=False, cast=bool)
+
+
+def _recordar_tool(tc: Any, result: Dict[str, Any], tool_records: Optional[List[Tuple]] = None) -> None:
+    """
+    Datos de la tool para el resumen del historial (history_manager).
+    Con `tool_records` (especulación) solo se anotan; quien acierte la
+    especulación los aplica con remember_tool_result.
+    """
+    try:
+        args = json.loads(tc.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return
+    if tool_records is not None:
+        tool_records.append((tc.function.name, args, result))
+        return
+    remember_tool_result(session_state, tc.function.name, args, result)
+
+
+def _respuesta_por_plantilla(tool_calls: List[Any], results: List[Dict[str, Any]]) -> Optional[str]:
+    """Frase por plantilla si la respuesta pidió UNA tool con resultado renderizable."""
+    if not RESPONSE_TEMPLATES or len(tool_calls) != 1:
+        return None
+    tc, result = tool_calls[0], results[0]
+    try:
+        args = json.loads(tc.function.arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+    texto = render_tool_response(tc.function.name, args, result)
+    if texto:
+        RESPONSE_TEMPLATES_USED.labels(tc.function.name, str(result.get("status", "ok"))).inc()
+    return texto
+
+# Especulación (tw_utils): solo tools sin efectos fuera de la respuesta.
+# Si GPT pide otra, la especulación se aborta y se usa la llamada normal.
+SPECULATIVE_SAFE_TOOLS = frozenset({
+    "read_sheet_data", "get_cancun_weather", "process_appointment_request",
+    "detect_intent", "set_mode",
+})
+SPECULATION_ABORTED = "__SPECULATION_ABORTED__"
+
+
+def _no_mark(stage: str) -> None:
+    """trace_mark para llamadas especulativas: no pertenecen (aún) al turno."""
+
+
+def _add_usage(usage: Optional[Dict[str, int]], chunk: Any, pase: str) -> None:
+    """Registra el chunk final de uso (stream_options.include_usage) y lo suma a `usage`."""
+    u = getattr(chunk, "usage", None)
+    if u is None:
+        return
+    details = getattr(u, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    GPT_PROMPT_TOKENS.labels(pase).inc(u.prompt_tokens or 0)
+    GPT_CACHED_PROMPT_TOKENS.labels(pase).inc(cached)
+    logger.info("🧮 Pase %s: %d tokens de prompt, %d en caché (%.0f%%)",
+                pase, u.prompt_tokens or 0, cached, 100 * cached / max(1, u.prompt_tokens or 0))
+    if usage is None:
+        return
+    usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + (u.prompt_tokens or 0)
+    usage["completion_tokens"] = usage.get("completion_tokens", 0) + (u.completion_tokens or 0)
+
+
 def _t(start: float) -> str:
     """Devuelve el tiempo transcurrido desde *start* en ms formateado."""
     return f"{(perf_counter() - start) * 1_000:6.1f} ms"
@@ -91,201 +220,9 @@ def merge_tool_calls(tool_calls_chunks):
             ))
     return merged
 
-# ══════════════════ UNIFIED TOOLS DEFINITION (COMPLETO) ══════════════════════
-
-# (Tus tools completas tal cual tienes, solo agrupa por modo abajo)
-TOOLS_BASE = [
-    {
-        "type": "function",
-        "function": {
-            "name": "read_sheet_data",
-            "description": "Obtener información general del consultorio como dirección, horarios de atención general, servicios principales, o políticas de cancelación. No usar para verificar disponibilidad de citas."
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_cancun_weather",
-            "description": "Obtener el estado del tiempo actual en Cancún, como temperatura, descripción (soleado, nublado, lluvia), y sensación térmica. Útil si el usuario pregunta específicamente por el clima."
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "detect_intent",
-            "description": "Detecta la intención del usuario cuando no está claro si quiere agendar en un horario 'más tarde' (more_late) o 'más temprano' (more_early) de la hora que le propusimos.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "intention": {
-                        "type": "string",
-                        "enum": ["more_late", "more_early"],
-                        "description": "La intención detectada del usuario."
-                    }
-                },
-                "required": ["intention"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "set_mode",
-            "description": (
-                "Cambia el modo de operación del asistente. "
-                "Úsala cuando detectes una intención clara del usuario de agendar, editar o eliminar una cita. "
-                "Solo cambia el modo si la intención es evidente. Si hay duda, primero pregunta al usuario."
-            ),
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "mode": {
-                        "type": "string",
-                        "enum": ["crear", "editar", "eliminar", "None"],
-                        "description": (
-                            "'crear' para agendar cita nueva, "
-                            "'editar' para modificar, "
-                            "'eliminar' para cancelar cita, "
-                            "'None' para modo informativo/general."
-                        ),
-                    }
-                },
-                "required": ["mode"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "end_call",
-            "description": "Cierra la llamada de manera definitiva. Úsala cuando ya se haya despedido al paciente.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "reason": {
-                        "type": "string",
-                        "description": "Motivo del cierre. Ej: 'user_request', 'task_completed', 'assistant_farewell'."
-                    }
-                },
-                "required": ["reason"]
-            }
-        }
-    },
-]
-TOOLS_CREAR = TOOLS_BASE + [
-    {
-        "type": "function",
-        "function": {
-            "name": "process_appointment_request",
-            "description": (
-                "Procesa la solicitud de agendamiento o consulta de disponibilidad de citas. "
-                "Interpreta la petición de fecha/hora del usuario (ej. 'próxima semana', 'el 15 a las 10', etc.)"
-            ),
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "user_query_for_date_time": {"type": "string"},
-                    "day_param": {"type": "integer"},
-                    "month_param": {"type": ["string", "integer"]},
-                    "year_param": {"type": "integer"},
-                    "fixed_weekday_param": {"type": "string"},
-                    "explicit_time_preference_param": {"type": "string", "enum": ["mañana", "tarde", "mediodia"]},
-                    "is_urgent_param": {"type": "boolean"},
-                    "more_late_param": {"type": "boolean"},
-                    "more_early_param": {"type": "boolean"}
-                },
-                "required": ["user_query_for_date_time"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "create_calendar_event",
-            "description": "Crear una nueva cita médica en el calendario después de que el usuario haya confirmado todo.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "name": {"type": "string"},
-                    "phone": {"type": "string"},
-                    "reason": {"type": "string"},
-                    "start_time": {"type": "string", "format": "date-time"},
-                    "end_time": {"type": "string", "format": "date-time"}
-                },
-                "required": ["name", "phone", "start_time", "end_time"]
-            }
-        }
-    }
-]
-TOOLS_EDITAR = TOOLS_BASE + [
-    {
-        "type": "function",
-        "function": {
-            "name": "search_calendar_event_by_phone",
-            "description": "Buscar citas existentes de un paciente por su número de teléfono."
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "edit_calendar_event",
-            "description": "Modificar una cita existente en el calendario.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "event_id": {"type": "string"},
-                    "new_start_time_iso": {"type": "string", "format": "date-time"},
-                    "new_end_time_iso": {"type": "string", "format": "date-time"},
-                    "new_name": {"type": "string"},
-                    "new_reason": {"type": "string"},
-                    "new_phone_for_description": {"type": "string"}
-                },
-                "required": ["event_id", "new_start_time_iso", "new_end_time_iso"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "process_appointment_request",
-            "description": "Verifica nuevos slots para citas editadas."
-        }
-    }
-]
-TOOLS_ELIMINAR = TOOLS_BASE + [
-    {
-        "type": "function",
-        "function": {
-            "name": "search_calendar_event_by_phone",
-            "description": "Buscar citas existentes de un paciente por su número de teléfono."
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "delete_calendar_event",
-            "description": "Eliminar/Cancelar una cita existente del calendario.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "event_id": {"type": "string"},
-                    "original_start_time_iso": {"type": "string", "format": "date-time"}
-                },
-                "required": ["event_id", "original_start_time_iso"]
-            }
-        }
-    }
-]
-
-TOOLS_BY_MODE = {
-    None: TOOLS_BASE,
-    "crear": TOOLS_CREAR,
-    "editar": TOOLS_EDITAR,
-    "eliminar": TOOLS_ELIMINAR,
-}
-
 # ══════════════════ TOOL EXECUTOR ═════════════════════════════════
-def handle_tool_execution(tc: Any) -> Dict[str, Any]:
+def handle_tool_execution(tc: Any, mode: Optional[str] = None) -> Dict[str, Any]:
+    """Valida los argumentos contra el esquema del modo y ejecuta la tool (tool_registry)."""
     fn_name = tc.function.name
     try:
         args = json.loads(tc.function.arguments or "{}")
@@ -293,52 +230,20 @@ def handle_tool_execution(tc: Any) -> Dict[str, Any]:
         logger.error(f"Error al decodificar argumentos JSON para {fn_name}: {tc.function.arguments}")
         return {"error": f"Argumentos inválidos para {fn_name}"}
 
-    # --- Detecta required_params, aunque no todos los tools lo tienen definido ---
-    all_tools = TOOLS_CREAR + TOOLS_EDITAR + TOOLS_ELIMINAR + TOOLS_BASE
-    required_params = next(
-        (tool["function"].get("parameters", {}).get("required", [])
-         for tool in all_tools if tool["function"]["name"] == fn_name),
-        []
-    )
-    missing = [p for p in required_params if p not in args]
-    if missing:
-        logger.error(f"Faltan parámetros requeridos para {fn_name}: {', '.join(missing)}")
-        return {"error": f"Missing required parameters: {', '.join(missing)}"}
+    error = TOOLS.validate(fn_name, args, mode)
+    if error:
+        logger.error(f"Argumentos rechazados para {fn_name}: {error}")
+        return {"error": error}
 
     logger.debug("🛠️ Ejecutando herramienta: %s con args: %s", fn_name, args)
+    t_tool = perf_counter()
     try:
-        if fn_name == "read_sheet_data":
-            return {"data_consultorio": get_consultorio_data_from_cache()}
-        elif fn_name == "get_cancun_weather":
-            return get_cancun_weather()
-        elif fn_name == "process_appointment_request":
-            return buscarslot.process_appointment_request(**args)
-        elif fn_name == "create_calendar_event":
-            phone = args.get("phone", "")
-            if not (isinstance(phone, str) and phone.isdigit() and len(phone) == 10):
-                logger.warning(f"Teléfono inválido '{phone}' para crear evento. La IA debería haberlo validado.")
-                return {"error": "Teléfono inválido proporcionado para crear la cita. Debe tener 10 dígitos."}
-            return create_calendar_event(**args)
-        elif fn_name == "edit_calendar_event":
-            return edit_calendar_event(**args)
-        elif fn_name == "delete_calendar_event":
-            return delete_calendar_event(**args)
-        elif fn_name == "search_calendar_event_by_phone":
-            return {"search_results": search_calendar_event_by_phone(**args)}
-        elif fn_name == "detect_intent":
-            return {"intent_detected": args.get("intention")}
-        elif fn_name == "end_call":
-            return {"call_ended_reason": args.get("reason", "unknown")}
-        elif fn_name == "set_mode":
-            modo = args.get("mode")
-            logger.info(f"🔁 Tool set_mode llamada: cambiando modo a '{modo}'")
-            return {"new_mode": modo}
-        else:
-            logger.warning(f"Función {fn_name} no reconocida en handle_tool_execution.")
-            return {"error": f"Función desconocida: {fn_name}"}
+        return TOOLS.call(fn_name, args)
     except Exception as e:
         logger.exception("Error crítico durante la ejecución de la herramienta %s", fn_name)
         return {"error": f"Error interno al ejecutar {fn_name}: {str(e)}"}
+    finally:
+        TOOL_SECONDS.labels(fn_name).observe(perf_counter() - t_tool)
 
 
 
@@ -358,10 +263,29 @@ async def generate_openai_response_main(
     modo: Optional[str] = None,
     pending_question: Optional[str] = None,
     model: str = "gpt-4.1-mini",
+    speculative: bool = False,
+    usage: Optional[Dict[str, int]] = None,
+    tool_records: Optional[List[Tuple]] = None,
+    on_text: Optional[Callable[[str], Awaitable[None]]] = None,
 ) -> Tuple[str, Optional[str], Optional[str]]:
     """
     Llama dos veces a GPT y retorna tupla (respuesta, nuevo_modo, nueva_pending)
+
+    speculative=True: sin trazas de turno y sin tools con efectos; si GPT pide
+    una, retorna (SPECULATION_ABORTED, modo, pending) sin ejecutarla.
+    usage: si se pasa un dict, acumula ahí prompt/completion tokens.
+    tool_records: con speculative=True, lista donde quedan (nombre, args,
+    resultado) de las tools en vez de escribir session_state["memoria"].
+    on_text: recibe cada delta de texto según llega (TTS en streaming). En
+    turnos con tools solo se emite el segundo pase (y el texto previo a la
+    tool, si GPT lo escribió antes de pedirla); la respuesta retornada es
+    exactamente la concatenación de lo emitido.
     """
+    mark = _no_mark if speculative else trace_mark
+    if speculative and tool_records is None:
+        tool_records = []          # la especulación nunca escribe la memoria de la sesión
+    # Siempre con uso: da los tokens de prompt cacheados por pase
+    stream_opts = {"stream_options": {"include_usage": True}}
     start_gpt_time = time.perf_counter()
     logger.info("⏱️ [LATENCIA-2] GPT llamada iniciada")
 
@@ -371,6 +295,10 @@ async def generate_openai_response_main(
     final_response = ""
 
     try:
+        # Historial con presupuesto de tokens (se usa igual en los dos pases)
+        history = HISTORY.compact(history, modo=current_mode, memoria=session_state.get("memoria"))
+        GPT_HISTORY_TOKENS.observe(sum(message_tokens(m) for m in history))
+
         # PROMPT PARA PRIMER PASE
         full_conversation_history = generate_openai_prompt(
             list(history),
@@ -391,41 +319,62 @@ async def generate_openai_response_main(
             logger.error("Cliente OpenAI no inicializado.")
             return ("Lo siento, estoy teniendo problemas técnicos para conectarme.", current_mode, current_pending)
 
-        tools_to_use = TOOLS_BY_MODE.get(current_mode, TOOLS_BASE)
-        logger.info("🔧 TOOLS para modo '%s': %s", current_mode, [t['function']['name'] for t in tools_to_use])
+        tools_mode = current_mode   # los argumentos se validan contra los esquemas que vio GPT
+        tools_to_use = TOOLS.tools_for(tools_mode)
+        logger.info("🔧 TOOLS para modo '%s': %s (%d caracteres)", tools_mode,
+                    [t['function']['name'] for t in tools_to_use], len(TOOLS.tools_json(tools_mode)))
 
-        # PRIMERA LLAMADA (streaming, pero SOLO acumula)
-        stream_response = client.chat.completions.create(
+        # PRIMERA LLAMADA (streaming; el texto sale por on_text si no hay tools)
+        mark("gpt_request")
+        t_pass1 = perf_counter()
+        stream_response = await client.chat.completions.create(
             model=model,
             messages=full_conversation_history,
             tools=tools_to_use,
             tool_choice="auto",
             max_tokens=100,
             temperature=0.1,
-            timeout=15,
             stream=True,
+            **stream_opts,
         )
 
         full_content = ""
+        emitted_pase1 = ""           # parte del pase 1 ya entregada a on_text
         tool_calls_chunks: list[Any] = []
-        for chunk in stream_response:
-            if chunk.choices[0].delta.content:
-                full_content += chunk.choices[0].delta.content
-            if chunk.choices[0].delta.tool_calls is not None:
-                for tc in chunk.choices[0].delta.tool_calls:
-                    if not hasattr(tc, "index"):
-                        tc.index = len(tool_calls_chunks)
-                    tool_calls_chunks.append(tc)
-
+        first_token = True
+        async with stream_response:   # cierra la respuesta HTTP también si la tarea se cancela
+            async for chunk in stream_response:
+                if not chunk.choices:
+                    _add_usage(usage, chunk, "1")
+                    continue
+                if first_token:
+                    mark("gpt_first_token")
+                    first_token = False
+                if chunk.choices[0].delta.content:
+                    full_content += chunk.choices[0].delta.content
+                    if on_text and not tool_calls_chunks:
+                        emitted_pase1 += chunk.choices[0].delta.content
+                        await on_text(chunk.choices[0].delta.content)
+                if chunk.choices[0].delta.tool_calls is not None:
+                    for tc in chunk.choices[0].delta.tool_calls:
+                        if not hasattr(tc, "index"):
+                            tc.index = len(tool_calls_chunks)
+                        tool_calls_chunks.append(tc)
+
+        GPT_PASS_SECONDS.labels("1").observe(perf_counter() - t_pass1)
         logger.info("💬 GPT RESPUESTA PASE 1: '%s'", full_content)
 
         # Si no hubo herramientas, termina aquí
         if not tool_calls_chunks:
             logger.info("✅ Respuesta sin herramientas – una sola llamada")
+            mark("gpt_done")
             return (full_content, current_mode, current_pending)
 
         # Ejecutar tools y armar historial para segundo pase
         tool_calls = merge_tool_calls(tool_calls_chunks)
+        if speculative and any(tc.function.name not in SPECULATIVE_SAFE_TOOLS for tc in tool_calls):
+            logger.info("🔮 Especulación abortada: GPT pidió %s", [tc.function.name for tc in tool_calls])
+            return (SPECULATION_ABORTED, current_mode, current_pending)
         response_pase1 = ChatCompletionMessage(
             content=full_content, role="assistant", tool_calls=tool_calls
         )
@@ -433,10 +382,15 @@ async def generate_openai_response_main(
         second_pass_history = list(history)
         second_pass_history.append(response_pase1.model_dump())
 
-        for tc in response_pase1.tool_calls:
+        mark("tools_start")
+        # Todas las tools de la respuesta en paralelo (en hilos); se procesan en orden
+        results = await TOOL_EXECUTOR.run_all(
+            [(tc.function.name, handle_tool_execution, (tc, tools_mode)) for tc in response_pase1.tool_calls]
+        )
+        for tc, result in zip(response_pase1.tool_calls, results):
             tc_id = tc.id
-            result = handle_tool_execution(tc)
             logger.info("📊 RESULTADO %s: %s", tc.function.name, json.dumps(result, ensure_ascii=False)[:200])
+            _recordar_tool(tc, result, tool_records if speculative else None)
 
             # Cambio de modo (set_mode)
             if tc.function.name == "set_mode":
@@ -468,11 +422,31 @@ async def generate_openai_response_main(
         logger.info("📏 Total mensajes pase 2: %d", len(second_pass_history))
         logger.info("=" * 50)
 
-        # SEGUNDO PASE (streaming, pero SOLO acumula)
+        mark("tools_end")
+
+        # Texto del pase 1 ya emitido (p. ej. "Permítame revisar."): la respuesta lo incluye
+        if emitted_pase1.strip():
+            emitted_pase1 += " "
+            await on_text(" ")
+        else:
+            emitted_pase1 = ""
+
+        # Resultado con frase fija (response_templates): sin segundo pase
+        plantilla = _respuesta_por_plantilla(response_pase1.tool_calls, results)
+        if plantilla:
+            logger.info("🧩 Respuesta por plantilla, sin segundo pase: '%s'", plantilla)
+            if on_text:
+                await on_text(plantilla)
+            mark("gpt_done")
+            return (emitted_pase1 + plantilla, current_mode, current_pending)
+
+        # SEGUNDO PASE (streaming; el texto sale por on_text)
+        mark("second_pass")
         fast_model = "gpt-4.1-mini"
         logger.info("🏃 Segunda llamada con modelo rápido: %s", fast_model)
 
-        stream_response_2 = client.chat.completions.create(
+        t_pass2 = perf_counter()
+        stream_response_2 = await client.chat.completions.create(
             model=fast_model,
             messages=generate_openai_prompt(
                 second_pass_history,
@@ -482,16 +456,34 @@ async def generate_openai_response_main(
             max_tokens=100,
             temperature=0.2,
             stream=True,
+            **stream_opts,
         )
 
-        for chunk in stream_response_2:
-            if chunk.choices[0].delta.content:
-                final_response += chunk.choices[0].delta.content
-
+        async with stream_response_2:   # cierra la respuesta HTTP también si la tarea se cancela
+            async for chunk in stream_response_2:
+                if not chunk.choices:
+                    _add_usage(usage, chunk, "2")
+                    continue
+                if chunk.choices[0].delta.content:
+                    final_response += chunk.choices[0].delta.content
+                    if on_text:
+                        await on_text(chunk.choices[0].delta.content)
+
+        GPT_PASS_SECONDS.labels("2").observe(perf_counter() - t_pass2)
         logger.info("💬 GPT RESPUESTA FINAL: '%s'", final_response)
+        mark("gpt_done")
 
-        return (final_response, current_mode, current_pending)
+        return (emitted_pase1 + final_response, current_mode, current_pending)
 
+    except asyncio.CancelledError:
+        # Nuevo turno / barge-in / shutdown: la petición HTTP ya se abortó
+        logger.info("🚫 GPT cancelado (%.0f ms)", (time.perf_counter() - start_gpt_time) * 1000)
+        raise
     except Exception as e:
-        logger.exception("generate_openai_response_main falló")
+        if isinstance(e, openai.APITimeoutError):
+            logger.error("⏰ GPT no respondió en %.0f s", OPENAI_TIMEOUT.read)
+        else:
+            logger.exception("generate_openai_response_main falló")
+        if speculative:
+            return (SPECULATION_ABORTED, modo, pending_question)
         return ("Lo siento, estoy experimentando un problema técnico.", modo, pending_question)
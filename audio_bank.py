@@ -0,0 +1,178 @@
+# audio_bank.py
+# -*- coding: utf-8 -*-
+"""
+Banco de audios pregrabados (audio/*.wav) compartido por todas las llamadas
+──────────────────────────────────────────────────────────────────────────
+• Se carga UNA vez por proceso (startup de FastAPI o primer uso).
+• Lee la cabecera RIFF de verdad (chunks fmt/fact/LIST/data); nada de
+  "quitar 44 bytes".
+• Convierte a μ-law 8 kHz mono si el archivo viene en PCM, A-law, estéreo
+  u otra frecuencia de muestreo.
+• Cada clip queda partido en paquetes de GROUP_FRAMES×160 bytes ya en
+  base64, listos para el planificador de salida → reproducir un clip no
+  cuesta ni disco ni codificación por llamada.
+"""
+
+from __future__ import annotations
+
+import base64
+import glob
+import logging
+import os
+import struct
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import audioop  # type: ignore
+
+from twilio_outbound import FRAME_BYTES, FRAME_MS, GROUP_FRAMES, SILENCE
+
+logger = logging.getLogger("audio_bank")
+
+AUDIO_DIR = "audio"
+TARGET_RATE = 8000
+
+# Códigos de formato WAVE
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_ALAW = 0x0006
+_WAVE_FORMAT_MULAW = 0x0007
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioClip(NamedTuple):
+    """Clip listo para enviar a Twilio."""
+    name: str
+    mulaw: bytes                      # μ-law 8 kHz mono, sin cabecera
+    payloads: Tuple[str, ...]         # paquetes base64 de ≤ GROUP_FRAMES frames
+    frames: int                       # frames de 20 ms (el último con relleno)
+
+    @property
+    def duration_ms(self) -> int:
+        return self.frames * FRAME_MS
+
+
+def _parse_wav(raw: bytes) -> Tuple[int, int, int, int, bytes]:
+    """
+    Devuelve (formato, canales, frecuencia, bits_por_muestra, datos).
+    Lanza ValueError si el archivo no es un WAVE válido.
+    """
+    if len(raw) < 12 or raw[:4] != b"RIFF" or raw[8:12] != b"WAVE":
+        raise ValueError("no es un archivo RIFF/WAVE")
+
+    fmt = None
+    data = None
+    pos = 12
+    while pos + 8 <= len(raw):
+        chunk_id = raw[pos:pos + 4]
+        (size,) = struct.unpack_from("<I", raw, pos + 4)
+        body = raw[pos + 8:pos + 8 + size]
+        if chunk_id == b"fmt ":
+            if size < 16:
+                raise ValueError("chunk fmt demasiado corto")
+            fmt = struct.unpack_from("<HHIIHH", body)
+            if fmt[0] == _WAVE_FORMAT_EXTENSIBLE and size >= 26:
+                # El subformato real son los 2 primeros bytes del GUID
+                (sub,) = struct.unpack_from("<H", body, 24)
+                fmt = (sub,) + fmt[1:]
+        elif chunk_id == b"data":
+            data = body
+            break
+        pos += 8 + size + (size & 1)   # los chunks van alineados a 2 bytes
+
+    if fmt is None or data is None:
+        raise ValueError("faltan los chunks fmt o data")
+    audio_format, channels, rate, _byte_rate, _align, bits = fmt
+    return audio_format, channels, rate, bits, data
+
+
+def _to_mulaw_8k(audio_format: int, channels: int, rate: int, bits: int, data: bytes) -> bytes:
+    """Convierte los datos del WAV a μ-law 8 kHz mono."""
+    if audio_format == _WAVE_FORMAT_MULAW and channels == 1 and rate == TARGET_RATE:
+        return data
+
+    if audio_format == _WAVE_FORMAT_MULAW:
+        pcm, width = audioop.ulaw2lin(data, 2), 2
+    elif audio_format == _WAVE_FORMAT_ALAW:
+        pcm, width = audioop.alaw2lin(data, 2), 2
+    elif audio_format == _WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+        width = bits // 8
+        pcm = audioop.bias(data, 1, -128) if width == 1 else data   # PCM 8 bits es sin signo
+    else:
+        raise ValueError(f"formato WAV no soportado (tag={audio_format}, bits={bits})")
+
+    pcm = pcm[:len(pcm) - len(pcm) % (width * channels)]
+    if channels == 2:
+        pcm = audioop.tomono(pcm, width, 0.5, 0.5)
+    elif channels != 1:
+        raise ValueError(f"{channels} canales no soportados")
+    if width != 2:
+        pcm, width = audioop.lin2lin(pcm, width, 2), 2
+    if rate != TARGET_RATE:
+        pcm, _ = audioop.ratecv(pcm, 2, 1, rate, TARGET_RATE, None)
+    return audioop.lin2ulaw(pcm, 2)
+
+
+def build_clip(name: str, mulaw: bytes, group_frames: int = GROUP_FRAMES) -> AudioClip:
+    """Parte el audio en paquetes de Twilio y los codifica en base64."""
+    pad = (-len(mulaw)) % FRAME_BYTES
+    padded = mulaw + SILENCE * pad
+    step = FRAME_BYTES * group_frames
+    view = memoryview(padded)
+    payloads = tuple(
+        base64.b64encode(view[i:i + step]).decode("ascii")
+        for i in range(0, len(padded), step)
+    )
+    return AudioClip(name, mulaw, payloads, len(padded) // FRAME_BYTES)
+
+
+class AudioBank:
+    """Clips indexados por nombre de archivo sin extensión (p.ej. "espera_1")."""
+
+    def __init__(self, directory: str = AUDIO_DIR) -> None:
+        self.directory = directory
+        self._clips: Dict[str, AudioClip] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        """Lee y codifica todos los *.wav del directorio. Devuelve cuántos cargó."""
+        with self._lock:
+            clips: Dict[str, AudioClip] = {}
+            for path in sorted(glob.glob(os.path.join(self.directory, "*.wav"))):
+                name = os.path.splitext(os.path.basename(path))[0]
+                try:
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                    mulaw = _to_mulaw_8k(*_parse_wav(raw))
+                    if not mulaw:
+                        logger.warning(f"⚠️ Audio '{path}' vacío; se omite.")
+                        continue
+                    clips[name] = build_clip(name, mulaw)
+                except Exception as e:
+                    logger.error(f"❌ No se pudo cargar '{path}': {e}")
+            self._clips = clips
+            self._loaded = True
+
+        total_ms = sum(c.duration_ms for c in clips.values())
+        logger.info(f"🔈 Banco de audio cargado: {len(clips)} clips ({total_ms / 1000:.1f}s) desde '{self.directory}'.")
+        return len(clips)
+
+    def get(self, name: str) -> Optional[AudioClip]:
+        """Devuelve el clip o None si no existe (carga el banco si hace falta)."""
+        if not self._loaded:
+            self.load()
+        return self._clips.get(name)
+
+    def names(self) -> Tuple[str, ...]:
+        if not self._loaded:
+            self.load()
+        return tuple(self._clips)
+
+
+# Instancia única del proceso
+AUDIO_BANK = AudioBank()
+
+
+def load_audio_bank() -> int:
+    """Carga (o recarga) el banco global. Pensado para el startup de la app."""
+    return AUDIO_BANK.load()
@@ -0,0 +1,114 @@
+# audio_ring_buffer.py
+# -*- coding: utf-8 -*-
+"""
+Ring buffer de capacidad fija para audio μ-law 8 kHz
+────────────────────────────────────────────────────
+• Guarda los últimos N ms de audio del llamante (política drop-oldest).
+• append() es O(1) respecto al contenido: solo copia el chunk nuevo.
+• peek()/consume() permiten vaciar el buffer sin copiar: se entregan
+  memoryviews sobre el bytearray interno.
+  ⚠️ Una vista es válida solo hasta el siguiente append()/clear().
+"""
+
+from __future__ import annotations
+
+from typing import List
+
+BYTES_PER_MS = 8  # μ-law 8 kHz mono → 8 bytes por milisegundo
+
+
+class MulawRingBuffer:
+    """Buffer circular sobre un bytearray preasignado."""
+
+    __slots__ = ("_buf", "_view", "_capacity", "_start", "_size", "dropped_bytes")
+
+    def __init__(self, capacity_ms: int = 5000) -> None:
+        self._capacity = max(1, int(capacity_ms * BYTES_PER_MS))
+        self._buf = bytearray(self._capacity)
+        self._view = memoryview(self._buf)
+        self._start = 0      # índice del byte más antiguo
+        self._size = 0       # bytes válidos
+        self.dropped_bytes = 0
+
+    # ───────────────────────── propiedades ─────────────────────────
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    @property
+    def duration_ms(self) -> float:
+        return self._size / BYTES_PER_MS
+
+    # ───────────────────────── escritura ───────────────────────────
+    def append(self, chunk) -> None:
+        """Agrega audio; si no cabe, descarta lo más antiguo."""
+        n = len(chunk)
+        if n == 0:
+            return
+        cap = self._capacity
+        if n >= cap:
+            # El chunk por sí solo llena el buffer: nos quedamos con su cola.
+            self.dropped_bytes += self._size + (n - cap)
+            self._view[:] = memoryview(chunk)[n - cap:]
+            self._start = 0
+            self._size = cap
+            return
+
+        chunk = memoryview(chunk)
+        overflow = self._size + n - cap
+        if overflow > 0:
+            self._start = (self._start + overflow) % cap
+            self._size -= overflow
+            self.dropped_bytes += overflow
+
+        end = (self._start + self._size) % cap
+        first = min(n, cap - end)
+        self._view[end:end + first] = chunk[:first]
+        if first < n:
+            self._view[:n - first] = chunk[first:]
+        self._size += n
+
+    # ───────────────────────── lectura ─────────────────────────────
+    def peek(self, max_bytes: int = -1) -> memoryview:
+        """
+        Devuelve una vista contigua con los bytes más antiguos (sin copiar).
+        Si los datos dan la vuelta al buffer, solo se devuelve el primer tramo;
+        llamar de nuevo tras consume() entrega el resto.
+        """
+        if not self._size:
+            return self._view[0:0]
+        contiguous = min(self._size, self._capacity - self._start)
+        if max_bytes >= 0:
+            contiguous = min(contiguous, max_bytes)
+        return self._view[self._start:self._start + contiguous]
+
+    def views(self) -> List[memoryview]:
+        """Todo el contenido como 1 o 2 vistas, del más antiguo al más nuevo."""
+        if not self._size:
+            return []
+        first = min(self._size, self._capacity - self._start)
+        out = [self._view[self._start:self._start + first]]
+        if first < self._size:
+            out.append(self._view[:self._size - first])
+        return out
+
+    def consume(self, n: int) -> None:
+        """Marca como leídos los n bytes más antiguos."""
+        n = min(n, self._size)
+        self._start = (self._start + n) % self._capacity
+        self._size -= n
+        if not self._size:
+            self._start = 0
+
+    def clear(self) -> int:
+        """Vacía el buffer y devuelve cuántos bytes se descartaron."""
+        discarded = self._size
+        self._start = 0
+        self._size = 0
+        return discarded
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# bench_openai_concurrency.py
+# --------------------------------------------------
+# ¿Una llamada esperando a GPT congela a las demás?
+# Simula N llamadas con su bucle de media de 20 ms (lo que
+# hacen Twilio/Deepgram/TTS) mientras varias de ellas piden
+# respuestas a GPT en streaming contra un servidor OpenAI
+# simulado (httpx.MockTransport: TTFT + 1 token cada X ms).
+#
+#   • sync : cliente OpenAI síncrono iterado en el loop (antes)
+#   • async: aiagent.generate_openai_response_main (AsyncOpenAI)
+#
+# Reporta el retraso de los ticks de 20 ms (p50/p99/máx) y,
+# al final, que cancelar la tarea GPT cierra el stream HTTP.
+#
+#   python bench_openai_concurrency.py [llamadas] [turnos_gpt_simultáneos] [segundos]
+# --------------------------------------------------
+
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import httpx
+from openai import OpenAI
+
+import aiagent
+
+# ======= CONFIG RÁPIDA ==============
+TICK = 0.020                  # bucle de media de Twilio
+TTFT = 0.30                   # primer token de GPT
+TOKEN_INTERVAL = 0.02         # entre tokens
+TOKENS = 25
+# ====================================
+
+_closed_streams = 0
+
+
+def _chunk(content: str) -> bytes:
+    data = {
+        "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+        "model": "gpt-4.1-mini",
+        "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(data)}\n\n".encode()
+
+
+async def _sse_async():
+    global _closed_streams
+    try:
+        await asyncio.sleep(TTFT)
+        for i in range(TOKENS):
+            yield _chunk(f"tok{i} ")
+            await asyncio.sleep(TOKEN_INTERVAL)
+        yield b"data: [DONE]\n\n"
+    finally:
+        _closed_streams += 1
+
+
+def _sse_sync():
+    time.sleep(TTFT)
+    for i in range(TOKENS):
+        yield _chunk(f"tok{i} ")
+        time.sleep(TOKEN_INTERVAL)
+    yield b"data: [DONE]\n\n"
+
+
+async def _handler_async(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse_async())
+
+
+def _handler_sync(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_sse_sync())
+
+
+SYNC_CLIENT = OpenAI(api_key="bench", http_client=httpx.Client(transport=httpx.MockTransport(_handler_sync)))
+HISTORY = [{"role": "user", "content": "¿Qué horarios tienen?"}]
+
+
+async def _gpt_sync() -> str:
+    """El camino anterior: async de nombre, pero itera el stream bloqueando el loop."""
+    stream = SYNC_CLIENT.chat.completions.create(model="gpt-4.1-mini", messages=HISTORY, stream=True)
+    return "".join(c.choices[0].delta.content or "" for c in stream)
+
+
+async def _gpt_async() -> str:
+    respuesta, _, _ = await aiagent.generate_openai_response_main(history=list(HISTORY))
+    return respuesta
+
+
+async def _media_loop(stop: asyncio.Event, lags: list) -> None:
+    """Tick de 20 ms: cuánto tarde despierta respecto a lo pedido (como LOOP_LAG_SECONDS)."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - t0 - TICK))
+
+
+async def _gpt_worker(stop: asyncio.Event, fn, done: list) -> None:
+    while not stop.is_set():
+        await fn()
+        done.append(1)
+        await asyncio.sleep(0)   # el camino sync no cede el loop por sí solo
+
+
+async def _run(fn, calls: int, gpt_workers: int, seconds: float) -> dict:
+    stop = asyncio.Event()
+    lags: list = []
+    done: list = []
+    tasks = [asyncio.create_task(_media_loop(stop, lags)) for _ in range(calls)]
+    tasks += [asyncio.create_task(_gpt_worker(stop, fn, done)) for _ in range(gpt_workers)]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    lags.sort()
+    return {
+        "p50_ms": statistics.median(lags) * 1000,
+        "p99_ms": lags[int(0.99 * (len(lags) - 1))] * 1000,
+        "max_ms": lags[-1] * 1000,
+        "gpt_turns": len(done),
+    }
+
+
+async def _cancel_check(n: int) -> int:
+    """Lanza n turnos GPT y los cancela a mitad: ¿se cerraron sus streams HTTP?"""
+    before = _closed_streams
+    tasks = [asyncio.create_task(_gpt_async()) for _ in range(n)]
+    await asyncio.sleep(TTFT + 5 * TOKEN_INTERVAL)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.sleep(0.05)
+    return _closed_streams - before
+
+
+async def main() -> None:
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    gpt_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 5.0
+
+    aiagent.client = aiagent.make_openai_client("bench", transport=httpx.MockTransport(_handler_async))
+    aiagent.logger.disabled = True
+
+    print(f"{calls} llamadas con media cada {TICK * 1000:.0f} ms, {gpt_workers} turnos GPT simultáneos, {seconds:.0f} s")
+    print(f"{'cliente':<8} {'p50':>8} {'p99':>8} {'máx':>8} {'turnos GPT':>11}")
+    for name, fn in (("sync", _gpt_sync), ("async", _gpt_async)):
+        r = await _run(fn, calls, gpt_workers, seconds)
+        print(f"{name:<8} {r['p50_ms']:7.1f}ms {r['p99_ms']:7.1f}ms {r['max_ms']:7.1f}ms {r['gpt_turns']:>11}")
+
+    closed = await _cancel_check(gpt_workers)
+    print(f"\nCancelación: {closed}/{gpt_workers} streams HTTP cerrados al cancelar la tarea GPT")
+    await aiagent.close_openai_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# bench_slot_search.py
+# --------------------------------------------------
+# Micro-benchmark de la búsqueda de horarios en un horizonte de 120 días.
+# Compara el recorrido original de process_appointment_request (copia
+# de la lista del día + strptime por "HH:MM" en cada franja y en la
+# regla de las 6 h) contra el índice en bits de slot_bitmap.py. También
+# mide process_appointment_request completo (con el índice) y el costo
+# de rearmar el índice cuando cambia la caché.
+#
+# Antes de medir verifica que ambos caminos den el mismo resultado en
+# todas las consultas generadas.
+#
+#   python bench_slot_search.py [consultas] [ocupacion_0_a_1]
+# --------------------------------------------------
+
+import random
+import sys
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+import buscarslot
+from buscarslot import MIN_ADVANCE_BOOKING_HOURS, SLOT_TIMES, _slots_for_franja
+from slot_bitmap import SlotBitmap
+
+# ======= CONFIG RÁPIDA ==============
+CACHE_DAYS  = 90              # días en la caché (como load_free_slots_to_cache)
+HORIZON     = 120             # días que recorre la búsqueda
+OCUPACION   = 0.97            # fracción de slots ocupados (alta = búsquedas largas)
+CONSULTAS   = 2000
+SEED        = 7
+# ====================================
+
+FRANJAS = (None, "mañana", "mediodia", "tarde")
+
+
+def _build_cache(today: date, ocupacion: float) -> dict:
+    rnd = random.Random(SEED)
+    cache = {}
+    for offset in range(CACHE_DAYS + 1):
+        d = today + timedelta(days=offset)
+        key = d.strftime("%Y-%m-%d")
+        cache[key] = [] if d.weekday() == 6 else [
+            s["start"] for s in SLOT_TIMES if rnd.random() >= ocupacion
+        ]
+    return cache
+
+
+def _queries(today: date, n: int) -> list:
+    rnd = random.Random(SEED + 1)
+    return [
+        (today + timedelta(days=rnd.randrange(0, 30)), rnd.choice(FRANJAS),
+         rnd.random() < 0.2, rnd.random() < 0.2)
+        for _ in range(n)
+    ]
+
+
+def _legacy(cache, target_date, today, now, pref, more_late, more_early):
+    """Recorrido día por día de la versión anterior (solo la búsqueda)."""
+    def regla_hoy(chk_date, slots):
+        if chk_date == today:
+            future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+            if future_dt.date() != today or now.time() >= dt_time(14, 0):
+                return []
+            limit = future_dt.time()
+            return [s for s in slots if datetime.strptime(s, "%H:%M").time() >= limit]
+        return slots
+
+    for day_offset in range(0, HORIZON):
+        chk_date = target_date + timedelta(days=day_offset)
+        if chk_date.weekday() == 6:
+            continue
+        free = cache.get(chk_date.strftime("%Y-%m-%d"), []).copy()
+        franja = pref
+        if pref:
+            current = regla_hoy(chk_date, _slots_for_franja(free, pref))
+            if current and (more_late or more_early):
+                if more_late:
+                    current = current[1:5]
+                if more_early:
+                    current = current[-5:-1]
+                if not current:
+                    continue
+        else:
+            current = regla_hoy(chk_date, free.copy())
+        if not current and pref:
+            for alt in ["mañana", "mediodia", "tarde"]:
+                if alt == pref:
+                    continue
+                alt_slots = regla_hoy(chk_date, _slots_for_franja(free, alt))
+                if alt_slots:
+                    current, franja = alt_slots, alt
+                    break
+        if current:
+            return chk_date, current, franja
+    return None
+
+
+def _today_mask(index, now, today):
+    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+    if future_dt.date() != today or now.time() >= dt_time(14, 0):
+        return 0
+    return index.mask_from(future_dt.time())
+
+
+def _timeit(fn, queries) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(*q)
+    return (time.perf_counter() - t0) / len(queries) * 1e6   # µs por consulta
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else CONSULTAS
+    ocupacion = float(sys.argv[2]) if len(sys.argv) > 2 else OCUPACION
+    now = datetime.combine(date.today(), dt_time(7, 0))
+    today = now.date()
+    cache = _build_cache(today, ocupacion)
+    queries = _queries(today, n)
+    slot_starts = [s["start"] for s in SLOT_TIMES]
+
+    index = SlotBitmap.from_cache(cache, slot_starts)      # la primera arma también las tablas por slot
+    t0 = time.perf_counter()
+    for _ in range(20):
+        index = SlotBitmap.from_cache(cache, slot_starts)
+    build_us = (time.perf_counter() - t0) / 20 * 1e6
+    mask = _today_mask(index, now, today)
+
+    legacy = lambda d, p, l, e: _legacy(cache, d, today, now, p, l, e)
+    bitmap = lambda d, p, l, e: index.search(d, HORIZON, today=today, today_mask=mask,
+                                             pref=p, more_late=l, more_early=e)
+
+    distintos = sum(1 for q in queries if legacy(*q) != bitmap(*q))
+    if distintos:
+        raise SystemExit(f"❌ {distintos} consultas con resultado distinto entre legacy y bitmap")
+
+    sin_hueco = sum(1 for q in queries if bitmap(*q) is None)
+    us_legacy = _timeit(legacy, queries)
+    us_bitmap = _timeit(bitmap, queries)
+
+    # process_appointment_request completo, con la caché sintética ya "fresca"
+    buscarslot.free_slots_cache.clear()
+    buscarslot.free_slots_cache.update(cache)
+    buscarslot.last_cache_update = buscarslot.get_cancun_time()
+    e2e = lambda d, p, l, e: buscarslot.process_appointment_request(
+        "", day_param=d.day, month_param=d.month, year_param=d.year,
+        explicit_time_preference_param=p, more_late_param=l, more_early_param=e)
+    us_e2e = _timeit(e2e, queries[: max(1, n // 4)])
+
+    print(f"Caché: {CACHE_DAYS} días, ocupación {ocupacion:.0%} | horizonte {HORIZON} días | "
+          f"{n} consultas ({sin_hueco} sin hueco) | resultados idénticos ✅")
+    print(f"  Índice en bits (rearmado)         : {build_us:9.1f} µs")
+    print(f"  Búsqueda legacy (día por día)     : {us_legacy:9.1f} µs/consulta")
+    print(f"  Búsqueda SlotBitmap               : {us_bitmap:9.1f} µs/consulta "
+          f"(x{us_legacy / us_bitmap:.1f})")
+    print(f"  process_appointment_request (e2e) : {us_e2e:9.1f} µs/consulta")
+
+
+if __name__ == "__main__":
+    main()
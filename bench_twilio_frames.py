@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# bench_twilio_frames.py
+# --------------------------------------------------
+# Micro-benchmark del decodificador de frames de Twilio.
+# Compara el camino original (json.loads + dict + b64decode)
+# contra TwilioFrameDecoder y reporta el costo de CPU por
+# llamada (50 frames/s) y cuántas llamadas caben por núcleo.
+#
+#   python bench_twilio_frames.py [segundos_de_audio] [llamadas]
+# --------------------------------------------------
+
+import base64
+import json
+import os
+import sys
+import time
+
+from twilio_frames import TwilioFrameDecoder
+
+# ======= CONFIG RÁPIDA ==============
+FRAMES_PER_SECOND = 50        # Twilio: 1 frame de 20 ms
+FRAME_BYTES       = 160       # 20 ms @ 8 kHz μ-law
+STREAM_SID        = "MZ18ad3ab5a668481ce02b83e7395059f0"
+# ====================================
+
+
+def _build_frames(n: int) -> list:
+    """Genera n mensajes "media" con la forma exacta que manda Twilio."""
+    frames = []
+    for i in range(n):
+        payload = base64.b64encode(os.urandom(FRAME_BYTES)).decode()
+        frames.append(json.dumps({
+            "event": "media",
+            "sequenceNumber": str(i + 2),
+            "media": {
+                "track": "inbound",
+                "chunk": str(i + 1),
+                "timestamp": str(i * 20),
+                "payload": payload,
+            },
+            "streamSid": STREAM_SID,
+        }, separators=(",", ":")))
+    return frames
+
+
+def _legacy(frames: list) -> int:
+    total = 0
+    for raw in frames:
+        data = json.loads(raw)
+        if data.get("event") == "media":
+            payload_b64 = data.get("media", {}).get("payload")
+            if payload_b64:
+                total += len(base64.b64decode(payload_b64))
+    return total
+
+
+def _fast(frames: list) -> int:
+    decoder = TwilioFrameDecoder()
+    total = 0
+    for raw in frames:
+        frame = decoder.decode(raw)
+        if frame.event == "media" and frame.payload:
+            total += len(frame.payload)
+    return total
+
+
+def _timeit(fn, frames: list, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.process_time()
+        fn(frames)
+        best = min(best, time.process_time() - t0)
+    return best
+
+
+def main() -> None:
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    frames = _build_frames(seconds * FRAMES_PER_SECOND)
+
+    assert _legacy(frames) == _fast(frames), "Los dos caminos deben decodificar lo mismo"
+
+    t_legacy = _timeit(_legacy, frames)
+    t_fast = _timeit(_fast, frames)
+
+    per_call_legacy_ms = t_legacy / seconds * 1000   # ms de CPU por segundo de llamada
+    per_call_fast_ms = t_fast / seconds * 1000
+
+    print(f"Frames: {len(frames):,} ({seconds}s de audio por llamada)")
+    print(f"json.loads + b64decode : {t_legacy * 1e6 / len(frames):6.2f} µs/frame → "
+          f"{per_call_legacy_ms:6.3f} ms CPU por segundo de llamada")
+    print(f"TwilioFrameDecoder     : {t_fast * 1e6 / len(frames):6.2f} µs/frame → "
+          f"{per_call_fast_ms:6.3f} ms CPU por segundo de llamada")
+    print(f"Aceleración            : x{t_legacy / t_fast:.1f}")
+    print(f"{calls} llamadas concurrentes: {per_call_legacy_ms * calls / 10:.2f}% → "
+          f"{per_call_fast_ms * calls / 10:.2f}% de un núcleo solo en decodificar")
+
+
+if __name__ == "__main__":
+    main()
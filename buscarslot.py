@@ -6,7 +6,9 @@ Reemplaza íntegramente tu archivo original por este.
 """
 
 import logging
+import math
 import re
+import time
 from datetime import datetime, timedelta, time as dt_time, date
 from typing import Dict, Optional, Tuple, Union, List
 from dateutil.relativedelta import relativedelta as rd
@@ -20,6 +22,8 @@ from utils import (
     GOOGLE_CALENDAR_ID,
     convertir_hora_a_palabras,
 )
+from metrics import SLOT_CACHE_AGE_SECONDS, SLOT_CACHE_RELOAD_SECONDS
+from slot_bitmap import SlotBitmap
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +81,18 @@ MIN_ADVANCE_BOOKING_HOURS = 6
 free_slots_cache: Dict[str, List[str]] = {}
 last_cache_update: Optional[datetime] = None
 CACHE_VALID_MINUTES = 15
+_slot_index: Optional[SlotBitmap] = None            # free_slots_cache en bits (slot_bitmap.py)
+_slot_index_stamp: Optional[datetime] = None        # last_cache_update con que se armó
+
+
+def _cache_age_s() -> float:
+    """Segundos desde la última recarga (NaN si nunca se cargó)."""
+    if last_cache_update is None:
+        return math.nan
+    return (get_cancun_time() - last_cache_update).total_seconds()
+
+
+SLOT_CACHE_AGE_SECONDS.set_function(_cache_age_s)
 
 # ──────────── HELPERS ─────────────────────────────────────────────────────
 
@@ -172,6 +188,7 @@ def load_free_slots_to_cache(days_ahead: int = 90) -> None:
     global free_slots_cache, last_cache_update
     with cache_lock:
         logger.info("⏳ Cargando slots libres desde Google Calendar…")
+        t_reload = time.perf_counter()
         free_slots_cache.clear()
 
         service = initialize_google_calendar()
@@ -211,6 +228,7 @@ def load_free_slots_to_cache(days_ahead: int = 90) -> None:
             free_slots_cache[key] = _build_free_slots_for_day(d, busy_intervals)
 
         last_cache_update = get_cancun_time()
+        SLOT_CACHE_RELOAD_SECONDS.observe(time.perf_counter() - t_reload)
         logger.info(f"✅ Slots libres precargados ({days_ahead} días)")
 
 
@@ -235,8 +253,15 @@ def _build_free_slots_for_day(
 
 
 def ensure_cache_is_fresh() -> None:
-    """Recarga la caché si lleva más de CACHE_VALID_MINUTES sin actualizarse."""
-    global last_cache_update
+    """Recarga la caché si lleva más de CACHE_VALID_MINUTES sin actualizarse.
+
+    Con la sincronización de fondo activa (calendar_sync) no recarga: se sirve
+    la caché actual y, si está vieja, se pide una sincronización. Solo si la
+    sincronización aún no tiene su primer listado se recarga aquí.
+    """
+    from calendar_sync import SYNC
+    if SYNC is not None and SYNC.serve_stale():
+        return
     if (
         last_cache_update is None
         or (get_cancun_time() - last_cache_update).total_seconds() > CACHE_VALID_MINUTES * 60
@@ -245,6 +270,17 @@ def ensure_cache_is_fresh() -> None:
 
 
 
+def availability_index() -> SlotBitmap:
+    """Índice en bits de free_slots_cache; se rearma cuando la caché cambia."""
+    global _slot_index, _slot_index_stamp
+    if _slot_index is None or _slot_index_stamp is not last_cache_update:
+        with cache_lock:
+            _slot_index = SlotBitmap.from_cache(free_slots_cache, [s["start"] for s in SLOT_TIMES])
+            _slot_index_stamp = last_cache_update
+    return _slot_index
+
+
+
 def _slots_for_franja(slots_del_dia: list[str], franja: str) -> list[str]: # (Se queda, con tu lógica preferida)
     if franja == "mañana":
         return [s for s in slots_del_dia if datetime.strptime(s, "%H:%M").time() <= dt_time(11, 45)]
@@ -411,98 +447,28 @@ def process_appointment_request(
     # Guardar la preferencia original de la franja del usuario
     original_time_preference = explicit_time_preference_param
 
-    for day_offset in range(0, 120):
-        chk_date = target_date + timedelta(days=day_offset)
-        if chk_date.weekday() == 6:  # domingo
-            continue
-
-        day_key = chk_date.strftime("%Y-%m-%d")
-        free_slots_for_day = free_slots_cache.get(day_key, []).copy()
-
-        # Reiniciar la franja de búsqueda para cada nuevo día al inicio de la iteración
-        # Esto asegura que siempre se intente la preferencia original primero en un nuevo día.
-        current_time_preference_for_search = original_time_preference
-        
-        # Lista para guardar los slots encontrados en el día actual
-        current_day_available_slots: List[str] = []
-
-        # --- Intento 1: Buscar en la franja original del usuario (si la hay) ---
-        if current_time_preference_for_search:
-            slots_in_preferred_franja = _slots_for_franja(free_slots_for_day, current_time_preference_for_search)
-            
-            # Aplicar regla de "6 h antes" y cierre diario
-            if chk_date == today:
-                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                    slots_in_preferred_franja = []
-                else:
-                    limit = future_dt.time()
-                    slots_in_preferred_franja = [
-                        s for s in slots_in_preferred_franja
-                        if datetime.strptime(s, "%H:%M").time() >= limit
-                    ]
-            
-            current_day_available_slots = slots_in_preferred_franja
-            
-            # Regla “más tarde / más temprano” solo para la primera franja intentada
-            if current_day_available_slots and (more_late_param or more_early_param):
-                if more_late_param:
-                    current_day_available_slots = current_day_available_slots[1:5] # siguientes 4
-                if more_early_param:
-                    current_day_available_slots = current_day_available_slots[-5:-1] # anteriores 4
-                if not current_day_available_slots:
-                    # Si no hay más slots en la dirección pedida en la franja preferida,
-                    # y el usuario pidió 'más tarde'/'más temprano', no intentamos otras franjas para ESE día.
-                    # Pasamos directamente al siguiente día.
-                    continue # Continúa al siguiente día en el bucle principal.
-
-        else: # Si no hay preferencia de franja original, todos los slots libres del día son el primer intento
-            current_day_available_slots = free_slots_for_day.copy()
-            # Aplicar regla de "6 h antes" y cierre diario (replicado para este caso)
-            if chk_date == today:
-                future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                    current_day_available_slots = []
-                else:
-                    limit = future_dt.time()
-                    current_day_available_slots = [
-                        s for s in current_day_available_slots
-                        if datetime.strptime(s, "%H:%M").time() >= limit
-                    ]
-
-
-        # --- Intento 2: Si no hay slots en la franja preferida, buscar en las otras del mismo día ---
-        found_alternative_franja = False
-        if not current_day_available_slots and original_time_preference: # Solo si hubo una preferencia original y no se encontró
-            logger.info(f"No hay slots en la franja original '{original_time_preference}' para {day_key}. Buscando en otras franjas del mismo día.")
-            all_franjas = ["mañana", "mediodia", "tarde"]
-            alternative_franjas = [f for f in all_franjas if f != original_time_preference]
-
-            for alt_franja in alternative_franjas:
-                slots_in_alt_franja = _slots_for_franja(free_slots_for_day, alt_franja)
-                
-                # Aplicar regla de "6 h antes" y cierre diario (necesario replicar aquí)
-                if chk_date == today:
-                    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
-                    if future_dt.date() != today or now.time() >= dt_time(14, 0):
-                        slots_in_alt_franja = []
-                    else:
-                        limit = future_dt.time()
-                        slots_in_alt_franja = [
-                            s for s in slots_in_alt_franja
-                            if datetime.strptime(s, "%H:%M").time() >= limit
-                        ]
-
-                if slots_in_alt_franja:
-                    current_day_available_slots = slots_in_alt_franja # Encontramos slots en una franja alternativa
-                    current_time_preference_for_search = alt_franja # Actualizamos la franja para el mensaje
-                    found_alternative_franja = True
-                    break # Salimos del bucle de franjas alternativas
-
-        # Si aún después de todos los intentos para el día actual no hay slots,
-        # o si la preferencia 'más tarde/temprano' agotó los slots, pasamos al siguiente día.
-        if not current_day_available_slots:
-            continue
+    # Índice en bits de la caché (slot_bitmap): el primer día útil sale del índice de salto
+    index = availability_index()
+    future_dt = now + timedelta(hours=MIN_ADVANCE_BOOKING_HOURS)
+    if future_dt.date() != today or now.time() >= dt_time(14, 0):
+        today_mask = 0          # regla de "6 h antes" y cierre diario
+    else:
+        today_mask = index.mask_from(future_dt.time())
+
+    found = index.search(
+        target_date, 120,
+        today=today,
+        today_mask=today_mask,
+        pref=original_time_preference,
+        more_late=more_late_param,
+        more_early=more_early_param,
+    )
+    if found is not None:
+        chk_date, current_day_available_slots, current_time_preference_for_search = found
+        day_offset = (chk_date - target_date).days
+        if original_time_preference and current_time_preference_for_search != original_time_preference:
+            logger.info(f"No hay slots en la franja original '{original_time_preference}' para {chk_date}. "
+                        f"Se ofrece la franja '{current_time_preference_for_search}'.")
 
         # ─ Si la consulta era “esta semana” y el hueco es > sábado, avisa ──
         if is_this_week and day_offset > days_until_saturday:
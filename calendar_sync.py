@@ -0,0 +1,279 @@
+# calendar_sync.py
+# -*- coding: utf-8 -*-
+"""
+Sincronización incremental de Google Calendar → caché de slots libres
+─────────────────────────────────────────────────────────────────────
+• Antes, buscarslot.load_free_slots_to_cache vaciaba la caché y volvía a
+  pedir 90 días de freebusy. Lo hacía al empezar cada llamada y cada vez
+  que ensure_cache_is_fresh la veía con más de 15 min, en ese caso DENTRO
+  de process_appointment_request, a mitad del turno del llamante.
+• CalendarSync sincroniza en segundo plano con events.list + syncToken:
+    – la primera vez, un listado completo desde hoy (singleEvents), que deja
+      el nextSyncToken;
+    – después cada CALENDAR_SYNC_INTERVAL_S (o al pedirlo request_sync),
+      solo los eventos que cambiaron. Si Google responde 410 (token vencido),
+      se hace otra vez el listado completo.
+• Cada evento guarda su intervalo ocupado, indexado por cada día que toca.
+  Un cambio recalcula los slots solo de los días afectados (los del
+  intervalo anterior y los del nuevo), dentro de la ventana de WINDOW_DAYS.
+  Al cambiar de día se agregan los días nuevos y se quitan los pasados.
+• Ocupado = como freebusy: eventos no cancelados y no marcados "libre"
+  (transparency=transparent). Los eventos de día completo ocupan el día.
+• Se sirve lo viejo mientras se revalida: ensure_cache_is_fresh nunca
+  recarga. Solo una consulta anterior al primer listado espera (hasta
+  FIRST_SYNC_WAIT_S, bastante menos que el timeout de la tool); si el
+  listado no llega, se usa la recarga de siempre (freebusy) en vez de
+  responder con la caché vacía.
+• Métricas: calendar_syncs{kind}, calendar_sync_days_recomputed; los
+  listados completos también en slot_cache_reload_seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, time as dt_time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pytz
+from googleapiclient.errors import HttpError
+
+import buscarslot
+from metrics import CALENDAR_SYNC_DAYS, CALENDAR_SYNCS, SLOT_CACHE_RELOAD_SECONDS
+from utils import GOOGLE_CALENDAR_ID, cache_lock, convert_utc_to_cancun, get_cancun_time, initialize_google_calendar
+
+logger = logging.getLogger("calendar_sync")
+
+WINDOW_DAYS = 90
+SYNC_INTERVAL_S = float(os.getenv("CALENDAR_SYNC_INTERVAL_S", "60"))
+FIRST_SYNC_WAIT_S = 2.0       # sin listado inicial: cuánto esperarlo (timeout de process_appointment_request: 5 s)
+ERROR_RETRY_S = 15.0          # tras un fallo, reintentar antes del intervalo normal
+TZ = pytz.timezone("America/Cancun")
+
+Interval = Tuple[datetime, datetime]
+
+
+def _busy_interval(evt: Dict[str, Any]) -> Optional[Interval]:
+    """Intervalo que el evento ocupa (hora de Cancún) o None si no ocupa."""
+    if evt.get("status") == "cancelled" or evt.get("transparency") == "transparent":
+        return None
+    start, end = evt.get("start") or {}, evt.get("end") or {}
+    if "dateTime" in start and "dateTime" in end:
+        return convert_utc_to_cancun(start["dateTime"]), convert_utc_to_cancun(end["dateTime"])
+    if "date" in start and "date" in end:      # día completo
+        return (TZ.localize(datetime.combine(date.fromisoformat(start["date"]), dt_time.min)),
+                TZ.localize(datetime.combine(date.fromisoformat(end["date"]), dt_time.min)))
+    return None
+
+
+def _days(interval: Optional[Interval]) -> Set[str]:
+    """Días ('YYYY-MM-DD') que toca un intervalo."""
+    if interval is None:
+        return set()
+    start, end = interval
+    d, last = start.date(), (end - timedelta(microseconds=1)).date()
+    days = set()
+    while d <= last:
+        days.add(d.strftime("%Y-%m-%d"))
+        d += timedelta(days=1)
+    return days
+
+
+class CalendarSync:
+    """Intervalos ocupados por evento + syncToken; mantiene buscarslot.free_slots_cache."""
+
+    def __init__(self) -> None:
+        self._intervals: Dict[str, Interval] = {}            # event_id → ocupado
+        self._by_day: Dict[str, Dict[str, Interval]] = {}    # día → {event_id: ocupado}
+        self._sync_token: Optional[str] = None
+        self._service = None
+        self._loaded = threading.Event()                     # primer listado completo hecho
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ─────────────────────── Servicio de fondo ───────────────────────
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="CalendarSync")
+
+    async def _run(self) -> None:
+        while True:
+            ok = await asyncio.to_thread(self.sync_once)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=SYNC_INTERVAL_S if ok else ERROR_RETRY_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def request_sync(self) -> None:
+        """Pide una sincronización ya (seguro desde hilos: tools, to_thread)."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def serve_stale(self) -> bool:
+        """
+        Lo que antes hacía ensure_cache_is_fresh, sin recargar en el turno.
+        False si todavía no hubo un listado completo: el llamador recarga como antes.
+        """
+        if not self._loaded.is_set():
+            if buscarslot.last_cache_update is not None:
+                return False       # ya hay datos de una recarga anterior: no volver a esperar
+            if not self._loaded.wait(FIRST_SYNC_WAIT_S):
+                logger.warning("⚠️ Sin listado inicial de Google Calendar: se recarga con freebusy")
+                return False
+        if buscarslot._cache_age_s() > buscarslot.CACHE_VALID_MINUTES * 60:
+            self.request_sync()
+        return True
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # ─────────────────────── Sincronización ───────────────────────
+
+    def sync_once(self) -> bool:
+        """Un ciclo (completo o incremental). Corre en un hilo; True si salió bien."""
+        try:
+            if self._service is None:
+                self._service = initialize_google_calendar()
+            if self._sync_token is None:
+                self._full_sync()
+                return True
+            try:
+                self._incremental_sync()
+            except HttpError as e:
+                if getattr(e.resp, "status", None) != 410:
+                    raise
+                logger.warning("⚠️ syncToken vencido (410): listado completo")
+                self._sync_token = None
+                self._full_sync()
+            return True
+        except Exception as e:
+            CALENDAR_SYNCS.labels("error").inc()
+            logger.error(f"❌ Sincronización de calendario falló: {e}")
+            return False
+
+    def _list(self, **params) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """events.list paginado → (eventos, nextSyncToken)."""
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            result = self._service.events().list(
+                calendarId=GOOGLE_CALENDAR_ID, singleEvents=True, maxResults=2500,
+                pageToken=page_token, **params,
+            ).execute()
+            items.extend(result.get("items", []))
+            page_token = result.get("nextPageToken")
+            if not page_token:
+                return items, result.get("nextSyncToken")
+
+    def _full_sync(self) -> None:
+        t0 = time.perf_counter()
+        today = get_cancun_time().date()
+        time_min = TZ.localize(datetime.combine(today, dt_time.min)).isoformat()
+        items, token = self._list(timeMin=time_min)
+
+        self._intervals.clear()
+        self._by_day.clear()
+        for evt in items:
+            self._store(evt["id"], _busy_interval(evt))
+        self._sync_token = token
+        self._publish(None)
+
+        CALENDAR_SYNCS.labels("full").inc()
+        SLOT_CACHE_RELOAD_SECONDS.observe(time.perf_counter() - t0)
+        self._loaded.set()
+        logger.info(f"✅ Calendario sincronizado completo: {len(items)} eventos "
+                    f"⏱️ DUR:[{(time.perf_counter() - t0) * 1000:.0f}ms]")
+
+    def _incremental_sync(self) -> None:
+        items, token = self._list(syncToken=self._sync_token)
+        affected: Set[str] = set()
+        for evt in items:
+            old = self._intervals.get(evt["id"])
+            new = _busy_interval(evt)
+            if old == new:
+                continue
+            affected |= _days(old) | _days(new)
+            self._store(evt["id"], new)
+        self._sync_token = token or self._sync_token
+        self._publish(affected)
+        CALENDAR_SYNCS.labels("incremental").inc()
+        if items:
+            logger.info(f"🔄 Calendario: {len(items)} eventos cambiados → {len(affected)} días recalculados")
+
+    def _store(self, event_id: str, interval: Optional[Interval]) -> None:
+        """Reemplaza el intervalo de un evento (None = ya no ocupa)."""
+        old = self._intervals.pop(event_id, None)
+        for day in _days(old):
+            bucket = self._by_day.get(day)
+            if bucket is not None:
+                bucket.pop(event_id, None)
+                if not bucket:
+                    del self._by_day[day]
+        if interval is None:
+            return
+        self._intervals[event_id] = interval
+        for day in _days(interval):
+            self._by_day.setdefault(day, {})[event_id] = interval
+
+    # ─────────────────────── Caché de slots ───────────────────────
+
+    def _free_slots(self, d: date) -> List[str]:
+        if d.weekday() == 6:            # Domingo sin citas
+            return []
+        key = d.strftime("%Y-%m-%d")
+        return buscarslot._build_free_slots_for_day(d, list(self._by_day.get(key, {}).values()))
+
+    def _publish(self, affected: Optional[Iterable[str]]) -> None:
+        """Recalcula en free_slots_cache los días `affected` (None = todos) y los días nuevos de la ventana."""
+        today = get_cancun_time().date()
+        window = {(today + timedelta(days=i)).strftime("%Y-%m-%d"): today + timedelta(days=i)
+                  for i in range(WINDOW_DAYS + 1)}
+        cache = buscarslot.free_slots_cache
+        todo = set(window) if affected is None else {k for k in affected if k in window}
+        todo |= set(window) - set(cache)
+
+        with cache_lock:
+            for key in todo:
+                cache[key] = self._free_slots(window[key])      # reemplazo por día: las lecturas nunca ven la caché vacía
+            for key in [k for k in cache if k not in window]:
+                del cache[key]
+            buscarslot.last_cache_update = get_cancun_time()
+        midnight = TZ.localize(datetime.combine(today, dt_time.min))
+        for event_id in [e for e, (_, end) in self._intervals.items() if end <= midnight]:
+            self._store(event_id, None)     # ya terminó: no vuelve a afectar la ventana
+        CALENDAR_SYNC_DAYS.inc(len(todo))
+
+
+SYNC: Optional[CalendarSync] = None
+
+
+def start_sync() -> None:
+    """Arranca la sincronización de fondo (startup de la app). CALENDAR_SYNC=0 la desactiva."""
+    global SYNC
+    if SYNC is not None or os.getenv("CALENDAR_SYNC", "1") == "0":
+        return
+    SYNC = CalendarSync()
+    SYNC.start()
+    logger.info(f"🗓️ Sincronización de calendario cada {SYNC_INTERVAL_S:.0f} s (syncToken)")
+
+
+async def close_sync() -> None:
+    global SYNC
+    if SYNC is not None:
+        await SYNC.close()
+        SYNC = None
+
+
+def request_sync() -> None:
+    """Sincronizar ya (tras crear / modificar / eliminar una cita)."""
+    if SYNC is not None:
+        SYNC.request_sync()
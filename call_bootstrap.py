@@ -0,0 +1,96 @@
+# call_bootstrap.py
+# -*- coding: utf-8 -*-
+"""
+Arranque de la llamada sin etapas en serie
+──────────────────────────────────────────
+• Antes, handle_twilio_websocket hacía accept → cliente TTS → precarga
+  (freebusy de 90 días + Google Sheets, en CADA llamada) → Deepgram → bucle
+  de recepción, y el saludo esperaba a que terminara todo eso.
+• Ahora el bucle de recepción arranca justo tras el accept. Deepgram se
+  inicia en su propia tarea (el audio espera en audio_buffer_twilio y se
+  re-inyecta después) y el saludo sale en cuanto llega el evento "start".
+• Las precargas ya no están en el camino crítico. refresh_shared_caches()
+  refresca en segundo plano las cachés del proceso (slots y consultorio),
+  solo si están vencidas y una sola vez aunque entren varias llamadas a la
+  vez. main.py las calienta al arrancar.
+• BootstrapTimer mide cada etapa:
+    – call_bootstrap_stage_seconds{stage};
+    – accept → primer frame del saludo en greeting_first_audio_seconds.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import buscarslot
+import consultarinfo
+from metrics import CALL_BOOTSTRAP_STAGE_SECONDS, GREETING_FIRST_AUDIO_SECONDS
+
+logger = logging.getLogger("call_bootstrap")
+
+CONSULTORIO_VALID_MINUTES = 15   # misma vigencia que la caché de slots (buscarslot.CACHE_VALID_MINUTES)
+
+_refresh_task: Optional[asyncio.Task] = None
+
+
+# ──────────────────────── Cachés compartidas ────────────────────────
+
+def _consultorio_vencido() -> bool:
+    last = consultarinfo.consultorio_data_last_update
+    return (
+        not consultarinfo.consultorio_data_cache
+        or last is None
+        or (datetime.now() - last).total_seconds() > CONSULTORIO_VALID_MINUTES * 60
+    )
+
+
+def _refresh_sync() -> None:
+    t0 = time.perf_counter()
+    buscarslot.ensure_cache_is_fresh()
+    if _consultorio_vencido():
+        consultarinfo.load_consultorio_data_to_cache()
+    CALL_BOOTSTRAP_STAGE_SECONDS.labels("caches").observe(time.perf_counter() - t0)
+
+
+async def _refresh() -> None:
+    try:
+        await asyncio.to_thread(_refresh_sync)
+    except Exception as e:
+        logger.warning(f"⚠️ Refresco de cachés falló: {e}")
+
+
+def refresh_shared_caches() -> asyncio.Task:
+    """Refresca slots y consultorio en segundo plano (una tarea a la vez por proceso)."""
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh(), name="CacheRefresh")
+    return _refresh_task
+
+
+# ──────────────────────── Tiempos del arranque ────────────────────────
+
+class BootstrapTimer:
+    """Etapas del arranque de una llamada, medidas desde el accept."""
+
+    def __init__(self) -> None:
+        self.t_accept = time.perf_counter()
+        self.stages: Dict[str, float] = {}    # etapa → ms
+
+    def done(self, stage: str, started: Optional[float] = None) -> float:
+        """Registra `stage` (desde `started`, o desde el accept) y devuelve los ms."""
+        ms = (time.perf_counter() - (started or self.t_accept)) * 1000
+        self.stages[stage] = ms
+        CALL_BOOTSTRAP_STAGE_SECONDS.labels(stage).observe(ms / 1000)
+        return ms
+
+    def greeting_audio(self) -> None:
+        """Primer frame del saludo enviado a Twilio."""
+        if "greeting_audio" in self.stages:
+            return
+        ms = self.done("greeting_audio")
+        GREETING_FIRST_AUDIO_SECONDS.observe(ms / 1000)
+        logger.info("🚀 Arranque: " + " · ".join(f"{k}={v:.0f}ms" for k, v in self.stages.items()))
@@ -0,0 +1,87 @@
+# call_context.py
+# -*- coding: utf-8 -*-
+"""
+Contexto por llamada (varias llamadas simultáneas en un mismo proceso)
+──────────────────────────────────────────────────────────────────────
+• Cada WebSocket de Twilio abre un CallContext con su propio estado de
+  sesión (citas encontradas, cita seleccionada, …).
+• El contexto vive en un ContextVar: las tareas creadas con
+  asyncio.create_task() y asyncio.to_thread() lo heredan solas, así que las
+  tools (selectevent, editarcita, eliminarcita, utils) ven SIEMPRE el de su
+  llamada sin recibirlo como parámetro.
+  ⚠️ loop.run_in_executor() NO copia el contexto: usar run_in_call_context().
+• Registro de llamadas activas para diagnóstico (/metrics, logs).
+"""
+
+from __future__ import annotations
+
+import contextvars
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+_call_ids = itertools.count(1)
+
+
+def new_session_state() -> Dict[str, Any]:
+    """Estado de sesión inicial de una llamada."""
+    return {
+        "events_found": [],       # lista completa de citas encontradas
+        "current_event_id": None, # la cita que el usuario confirmó
+        "memoria": {},            # datos de tools para el resumen del historial
+    }
+
+
+@dataclass
+class CallContext:
+    """Todo lo que pertenece a UNA llamada."""
+    call_id: int
+    manager: Any = None
+    call_sid: str = ""
+    state: Dict[str, Any] = field(default_factory=new_session_state)
+    tracer: Any = None            # turn_trace.CallTracer de la llamada
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def age_s(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+_current_call: contextvars.ContextVar[Optional[CallContext]] = contextvars.ContextVar(
+    "current_call", default=None
+)
+_active_calls: Dict[int, CallContext] = {}
+
+
+def begin_call(manager: Any = None) -> CallContext:
+    """Crea el contexto de una llamada, lo registra y lo activa en la tarea actual."""
+    ctx = CallContext(call_id=next(_call_ids), manager=manager)
+    _active_calls[ctx.call_id] = ctx
+    _current_call.set(ctx)
+    return ctx
+
+
+def end_call(ctx: CallContext) -> None:
+    """Quita la llamada del registro (su estado se libera con ella)."""
+    _active_calls.pop(ctx.call_id, None)
+    if _current_call.get() is ctx:
+        _current_call.set(None)
+
+
+def current_call() -> Optional[CallContext]:
+    """Contexto de la llamada en curso o None (p.ej. peticiones HTTP de n8n)."""
+    return _current_call.get()
+
+
+def active_calls() -> List[CallContext]:
+    return list(_active_calls.values())
+
+
+def run_in_call_context(fn: Callable[..., Any], *args: Any) -> Callable[[], Any]:
+    """
+    Envuelve fn para ejecutarla en un hilo con el contexto actual:
+        loop.run_in_executor(pool, run_in_call_context(fn, a, b))
+    """
+    ctx = contextvars.copy_context()
+    return lambda: ctx.run(fn, *args)
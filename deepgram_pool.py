@@ -0,0 +1,172 @@
+# deepgram_pool.py
+# -*- coding: utf-8 -*-
+"""
+Pool de conexiones Deepgram abiertas de antemano
+────────────────────────────────────────────────
+• DeepgramSTTStreamer.start_streaming() abría la conexión en vivo cuando la
+  llamada ya estaba en curso; hasta el evento Open el audio del llamante
+  esperaba en audio_buffer_twilio (o se perdía).
+• El pool mantiene DG_POOL_SIZE conexiones ya abiertas con las mismas
+  opciones (live_options: nova-2, es, μ-law 8 kHz) y el keepalive del SDK.
+  claim_connection() entrega una al instante y el pool repone otra en
+  segundo plano.
+• Cada conexión se abre con sus eventos apuntando a un despachador: mientras
+  está libre no va a nadie (si se cae, el pool la descarta); al reclamarla
+  los eventos van a los métodos _on_* del streamer dueño, dentro del
+  contexto (call_context) de la llamada que la reclamó.
+• Las conexiones libres se renuevan tras DG_POOL_MAX_AGE_S. Una conexión
+  usada no vuelve al pool: trae el estado de su llamada.
+• Métricas: deepgram_claim_seconds{source}, deepgram_pool_exhausted y
+  deepgram_pool_idle_connections.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, List, Optional
+
+from deepgram_stt_streamer import DEEPGRAM_KEY, EVENT_HANDLERS, live_options, make_deepgram_client
+from metrics import DG_POOL_EXHAUSTED, DG_POOL_IDLE
+
+logger = logging.getLogger("deepgram_pool")
+
+POOL_SIZE = int(os.getenv("DG_POOL_SIZE", "2"))
+MAX_AGE_S = float(os.getenv("DG_POOL_MAX_AGE_S", "300"))
+REFILL_RETRY_S = 5.0          # tras un fallo al abrir, esperar antes de reintentar
+
+
+class _PooledConnection:
+    """Conexión en vivo del SDK + a qué streamer van sus eventos."""
+
+    def __init__(self, connection: Any) -> None:
+        self.connection = connection
+        self.owner = None
+        self.context: Optional[contextvars.Context] = None   # contexto de la llamada que la reclamó
+        self.alive = True
+        self.opened_at = time.monotonic()
+        for event, handler in EVENT_HANDLERS.items():
+            connection.on(event, self._dispatcher(event, handler))
+
+    def _dispatcher(self, event, handler: str):
+        async def dispatch(conn, *args, **kwargs):
+            if self.owner is not None:
+                # El SDK crea las tareas de eventos en el contexto de quien abrió la conexión
+                # (la tarea del pool): el handler corre en el de la llamada dueña.
+                await asyncio.create_task(getattr(self.owner, handler)(conn, *args, **kwargs),
+                                          context=self.context)
+            elif handler in ("_on_close", "_on_error"):
+                self.alive = False     # se cayó estando libre: el pool la reemplaza
+                logger.warning(f"🔒 Conexión Deepgram libre cerrada ({event})")
+        return dispatch
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.opened_at > MAX_AGE_S
+
+    async def finish(self) -> None:
+        try:
+            await asyncio.wait_for(self.connection.finish(), timeout=2.0)
+        except Exception as e:
+            logger.debug(f"finish() de conexión libre falló: {e}")
+
+
+class DeepgramConnectionPool:
+    """Conexiones abiertas listas para reclamar; se reponen en segundo plano."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._client = make_deepgram_client()
+        self._idle: List[_PooledConnection] = []
+        self._refill = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._refill.set()
+        self._task = asyncio.create_task(self._maintain(), name="DeepgramPool_maintain")
+
+    def idle_count(self) -> int:
+        return sum(1 for c in self._idle if c.alive)
+
+    def claim(self, owner) -> Optional[Any]:
+        """Conexión abierta para `owner` (DeepgramSTTStreamer) o None si no hay."""
+        while self._idle:
+            pooled = self._idle.pop(0)
+            if pooled.alive and not pooled.expired:
+                pooled.context = contextvars.copy_context()
+                pooled.owner = owner
+                self._refill.set()
+                return pooled.connection
+            asyncio.create_task(pooled.finish())
+        DG_POOL_EXHAUSTED.inc()
+        logger.warning("⚠️ Pool de Deepgram vacío: conexión en frío")
+        self._refill.set()
+        return None
+
+    async def _open_one(self) -> Optional[_PooledConnection]:
+        t0 = time.perf_counter()
+        pooled = _PooledConnection(self._client.listen.asynclive.v("1"))
+        if await pooled.connection.start(live_options()) is False:
+            return None
+        logger.info(f"🟢 Conexión Deepgram precalentada en {(time.perf_counter() - t0) * 1000:.0f} ms")
+        return pooled
+
+    async def _maintain(self) -> None:
+        """Descarta conexiones caídas o viejas y abre las que falten."""
+        while True:
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=MAX_AGE_S / 2)
+            except asyncio.TimeoutError:
+                pass                   # revisión periódica: renovar las que envejecieron
+            self._refill.clear()
+            for pooled in [c for c in self._idle if not c.alive or c.expired]:
+                self._idle.remove(pooled)
+                await pooled.finish()
+            faltan = self.size - len(self._idle)
+            if faltan <= 0:
+                continue
+            try:
+                abiertas = await asyncio.gather(*(self._open_one() for _ in range(faltan)))
+            except Exception as e:
+                abiertas = []
+                logger.error(f"❌ Pool de Deepgram: no se pudo abrir conexión: {e}")
+            self._idle.extend(c for c in abiertas if c is not None)
+            if len(self._idle) < self.size:
+                await asyncio.sleep(REFILL_RETRY_S)
+                self._refill.set()
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(c.finish() for c in idle), return_exceptions=True)
+
+
+POOL: Optional[DeepgramConnectionPool] = None
+DG_POOL_IDLE.set_function(lambda: POOL.idle_count() if POOL else 0)
+
+
+def start_pool() -> None:
+    """Arranca el pool (startup de la app). DG_POOL_SIZE=0 lo desactiva."""
+    global POOL
+    if POOL is not None or POOL_SIZE <= 0 or not DEEPGRAM_KEY:
+        return
+    POOL = DeepgramConnectionPool(POOL_SIZE)
+    POOL.start()
+    logger.info(f"🔌 Pool Deepgram: {POOL_SIZE} conexiones precalentadas")
+
+
+async def close_pool() -> None:
+    global POOL
+    if POOL is not None:
+        await POOL.close()
+        POOL = None
+
+
+def claim_connection(owner) -> Optional[Any]:
+    """Conexión del pool para el streamer `owner`, o None (pool apagado o vacío)."""
+    return POOL.claim(owner) if POOL else None
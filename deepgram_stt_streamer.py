@@ -3,10 +3,13 @@ import os
 import json
 import asyncio
 import logging
+import time
 import warnings
 from deepgram import DeepgramClient, LiveTranscriptionEvents, LiveOptions, DeepgramClientOptions # <--- ASEGÚRATE QUE ESTÉ ASÍ
 # from fastapi.websockets import WebSocketState # No se usa directamente aquí
 
+from metrics import DG_CLAIM_SECONDS
+
 logger = logging.getLogger("deepgram_stt_streamer")
 # logger.setLevel(logging.INFO) # Puedes ajustar el nivel de log como necesites
 
@@ -23,19 +26,59 @@ if not DEEPGRAM_KEY:
     # raise ValueError("❌ Variable DEEPGRAM_KEY no encontrada") # Descomentar si quieres que falle fuerte
 
 
+# Endpointing de Deepgram (ms de silencio para marcar speech_final); 0 = desactivado
+DG_ENDPOINTING_MS = int(os.getenv("DG_ENDPOINTING_MS", "300"))
+
+# Evento del SDK → método de DeepgramSTTStreamer que lo atiende (también lo usa deepgram_pool)
+EVENT_HANDLERS = {
+    LiveTranscriptionEvents.Open: "_on_open",
+    LiveTranscriptionEvents.Transcript: "_on_transcript",
+    LiveTranscriptionEvents.Close: "_on_close",
+    LiveTranscriptionEvents.Error: "_on_error",
+    LiveTranscriptionEvents.Unhandled: "_on_unhandled",
+    LiveTranscriptionEvents.Metadata: "_on_metadata",
+    LiveTranscriptionEvents.UtteranceEnd: "_on_utterance_end",
+    LiveTranscriptionEvents.SpeechStarted: "_on_speech_started",
+}
+
+
+def make_deepgram_client() -> DeepgramClient:
+    """Cliente con keepalive del SDK (la conexión sobrevive a los silencios)."""
+    config = DeepgramClientOptions(options={"keepalive": "true"})
+    return DeepgramClient(DEEPGRAM_KEY, config)
+
+
+def live_options() -> LiveOptions:
+    """Opciones de la conexión en vivo: μ-law 8 kHz de Twilio, nova-2 en español."""
+    return LiveOptions(
+        model="nova-2",
+        language="es",
+        encoding="mulaw",
+        sample_rate=8000,
+        channels=1,
+        smart_format=True,
+        interim_results=True, 
+        endpointing=DG_ENDPOINTING_MS or False, 
+        utterance_end_ms="1200", 
+        vad_events=True, 
+    )
+
+
 class DeepgramSTTStreamer:
-    def __init__(self, callback, on_disconnect_callback=None): 
+    def __init__(self, callback, on_disconnect_callback=None, on_turn_event=None): 
         """
         callback: función que recibe transcript (str) e is_final (bool)
         on_disconnect_callback: función a llamar cuando Deepgram se desconecta inesperadamente
+        on_turn_event: función que recibe "speech_final", "utterance_end" o
+                       "speech_started" (señales para el detector de fin de turno)
         """
         self.callback = callback
         self.on_disconnect_callback = on_disconnect_callback 
+        self.on_turn_event = on_turn_event
         self.deepgram = None
         if DEEPGRAM_KEY:
             try:
-                config = DeepgramClientOptions(options={"keepalive": "true"})
-                self.deepgram = DeepgramClient(DEEPGRAM_KEY, config) 
+                self.deepgram = make_deepgram_client()
             except Exception as e:
                 logger.error(f"FALLO AL INICIALIZAR DeepgramClient: {e}")
                 self.deepgram = None
@@ -61,6 +104,17 @@ class DeepgramSTTStreamer:
         if self._is_closing:
             logger.warning("Intento de iniciar streaming mientras se está cerrando. Abortando.")
             return
+        # Conexión ya abierta del pool (deepgram_pool): se usa sin esperar el handshake
+        t_claim = time.perf_counter()
+        from deepgram_pool import claim_connection
+        pooled = claim_connection(self)
+        if pooled is not None:
+            self.dg_connection = pooled
+            self._started = True
+            DG_CLAIM_SECONDS.labels("pooled").observe(time.perf_counter() - t_claim)
+            logger.info("⚡ Deepgram: conexión tomada del pool (ya abierta)")
+            return
+
         logger.info(f"Intentando CONECTAR con Deepgram...")
 
         try:
@@ -75,27 +129,12 @@ class DeepgramSTTStreamer:
             self._started = False 
 
             self.dg_connection = self.deepgram.listen.asynclive.v("1")
-            self.dg_connection.on(LiveTranscriptionEvents.Open, self._on_open)
-            self.dg_connection.on(LiveTranscriptionEvents.Transcript, self._on_transcript)
-            self.dg_connection.on(LiveTranscriptionEvents.Close, self._on_close)
-            self.dg_connection.on(LiveTranscriptionEvents.Error, self._on_error)
-            self.dg_connection.on(LiveTranscriptionEvents.Unhandled, self._on_unhandled)
-            self.dg_connection.on(LiveTranscriptionEvents.Metadata, self._on_metadata)
-
-            options = LiveOptions(
-                model="nova-2",
-                language="es",
-                encoding="mulaw",
-                sample_rate=8000,
-                channels=1,
-                smart_format=True,
-                interim_results=True, 
-                endpointing=False, 
-                utterance_end_ms="1200", 
-                vad_events=False, 
-            )
-
-            await self.dg_connection.start(options)
+            for event, handler in EVENT_HANDLERS.items():
+                self.dg_connection.on(event, getattr(self, handler))
+
+            await self.dg_connection.start(live_options())
+            if self._started:
+                DG_CLAIM_SECONDS.labels("cold").observe(time.perf_counter() - t_claim)
           
 
         except Exception as e:
@@ -104,11 +143,15 @@ class DeepgramSTTStreamer:
             self.dg_connection = None
 
 
-    async def send_audio(self, chunk: bytes):
-        """Envía un chunk de audio a Deepgram."""
+    async def send_audio(self, chunk) -> bool:
+        """
+        Envía un chunk de audio a Deepgram (bytes o memoryview).
+        Devuelve True si el SDK aceptó el envío.
+        """
         if self.dg_connection and self._started and not self._is_closing: # <--- Quitar chequeo de _is_reconnecting
             try:
-                await self.dg_connection.send(chunk)
+                # El SDK devuelve False (sin lanzar) si el socket ya no sirve
+                return await self.dg_connection.send(chunk) is not False
             except Exception as e:
                 logger.error(f"❌ Error enviando audio a Deepgram: {e}. Estado: _started={self._started}, _is_closing={self._is_closing}")
                 self._started = False # Asumir que la conexión ya no es válida
@@ -121,6 +164,7 @@ class DeepgramSTTStreamer:
         else:
             state_info = f"_started={self._started}, _is_closing={self._is_closing}, dg_connection_exists={self.dg_connection is not None}"
             logger.warning(f"⚠️ Audio ignorado por STT: conexión no iniciada o no operativa. Estado: {state_info}")
+        return False
 
 
 
@@ -129,6 +173,21 @@ class DeepgramSTTStreamer:
 
 
 
+    async def finalize(self) -> bool:
+        """
+        Pide a Deepgram que cierre y entregue como final lo que tenga pendiente
+        (se usa antes de dejar de enviarle silencio; la conexión sigue abierta
+        con el keepalive del SDK).
+        """
+        if not (self.dg_connection and self._started and not self._is_closing):
+            return False
+        try:
+            await self.dg_connection.send(json.dumps({"type": "Finalize"}))
+            return True
+        except Exception as e:
+            logger.warning(f"No se pudo enviar 'Finalize' a Deepgram: {e}")
+            return False
+
     async def close(self):
         """Cierra la conexión con Deepgram de forma controlada."""
         if not self.dg_connection or self._is_closing:
@@ -185,18 +244,33 @@ class DeepgramSTTStreamer:
         # request_id, etc. Por ahora, solo los registramos en modo DEBUG.
 
     async def _on_transcript(self, _connection, result, *args, **kwargs):
-        if not result or not hasattr(result, 'channel') or not result.channel.alternatives or not result.channel.alternatives[0].transcript:
-            # logger.debug("Recibido resultado de transcripción vacío o malformado.")
+        if not result or not hasattr(result, 'channel') or not result.channel.alternatives:
             return
-            
+        speech_final = bool(getattr(result, "speech_final", False))
         transcript = result.channel.alternatives[0].transcript
         if transcript: # Asegurarse que el transcript no sea una cadena vacía
             # logger.debug(f"Transcript recibido: '{transcript}', is_final: {result.is_final}")
             self.callback(transcript, result.is_final)
+        # speech_final llega también con transcript vacío (fin de habla tras ruido)
+        if speech_final:
+            self._emit_turn_event("speech_final")
         # else:
             # logger.debug(f"Transcript vacío recibido. is_final: {result.is_final}")
 
 
+    async def _on_utterance_end(self, _connection, utterance_end, *args, **kwargs):
+        self._emit_turn_event("utterance_end")
+
+    async def _on_speech_started(self, _connection, speech_started, *args, **kwargs):
+        self._emit_turn_event("speech_started")
+
+    def _emit_turn_event(self, kind: str) -> None:
+        if self.on_turn_event:
+            try:
+                self.on_turn_event(kind)
+            except Exception as e:
+                logger.error(f"Error en on_turn_event('{kind}'): {e}")
+
 # Dentro de la clase DeepgramSTTStreamer:
 
     async def _on_close(self, _connection, *args, **kwargs): # Evento de Deepgram cuando ELLOS cierran
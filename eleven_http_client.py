@@ -20,17 +20,18 @@ Requiere: `requests`, `audioop`, `asyncio`, `logging`.
 from __future__ import annotations
 
 import os
-import base64
 import time
 import json
-import asyncio
 import logging
 from io import BytesIO
-from typing import Callable, Awaitable
+from typing import Callable, Awaitable, Optional
 
 import audioop  # type: ignore
 import requests
 
+from tts_cache import TTS_CACHE
+from twilio_outbound import OutboundAudioScheduler
+
 # --------------------------------------------------------------------------
 #  Credenciales y configuración (obligatorio en entorno, p.e. Render / .env)
 # --------------------------------------------------------------------------
@@ -59,7 +60,9 @@ async def send_tts_http_to_twilio(
     group_frames: int = GROUP_FRAMES,
     max_ahead_ms: int = MAX_AHEAD_MS,
     gain: float = GAIN,
-) -> None:
+    outbound: Optional[OutboundAudioScheduler] = None,
+    cache: bool = False,
+) -> bool:
     """Genera TTS en ElevenLabs y lo *gotea* hacia Twilio.
 
     Args:
@@ -70,6 +73,12 @@ async def send_tts_http_to_twilio(
         max_ahead_ms: Cuánto audio máximo adelantado permitimos (jitter
             buffer de Twilio).
         gain: Factor multiplicador de amplitud μ‑law (1.0 = sin cambio).
+        outbound: Planificador de salida de la llamada. Si se omite se crea
+            uno temporal (``group_frames``/``max_ahead_ms`` solo aplican ahí).
+        cache: Buscar/guardar el audio en tts_cache (solo frases fijas).
+
+    Returns:
+        True si el audio se encoló y envió; False si ElevenLabs falló.
     """
 
     logger.info("🗣️ Solicitando TTS a ElevenLabs…")
@@ -93,33 +102,30 @@ async def send_tts_http_to_twilio(
         },
     }
 
-    # 1️⃣ Descargar audio de ElevenLabs
-    try:
-        t_request = time.perf_counter()
-        response = requests.post(url, json=payload, headers=headers, stream=True, timeout=120)
-        response.raise_for_status()
-
-        first_chunk_at: float | None = None
-        buffer = BytesIO()
-
-        for chunk in response.iter_content(chunk_size=4096):
-            if not chunk:
-                continue  # Ignora keep‑alive vacíos
-            if first_chunk_at is None:
-                first_chunk_at = time.perf_counter()
-                logger.info("⏱️ ElevenLabs primer chunk tras %.1f ms", (first_chunk_at - t_request) * 1000)
-            buffer.write(chunk)
-
-        audio_raw: bytes = buffer.getvalue()
-    except Exception as exc:
-        logger.error("🚨 Error solicitando TTS: %s", exc)
-        await _safe_send_mark(websocket_send, stream_sid, "error")
-        return
+    # 1️⃣ Descargar audio de ElevenLabs (o tomarlo de la caché)
+    cache_key = None
+    audio_raw: bytes | None = None
+    if cache:
+        cache_key = TTS_CACHE.make_key(text, ELEVEN_LABS_VOICE_ID, payload["model_id"], payload["voice_settings"])
+        audio_raw = TTS_CACHE.get(cache_key)
+        if audio_raw:
+            logger.info("⚡ TTS HTTP desde caché (%d bytes)", len(audio_raw))
+
+    if not audio_raw:
+        try:
+            audio_raw = _fetch_tts_audio(url, payload, headers)
+        except Exception as exc:
+            logger.error("🚨 Error solicitando TTS: %s", exc)
+            await _safe_send_mark(websocket_send, stream_sid, "error", outbound)
+            return False
 
-    # 2️⃣ WAV → μ‑law crudo (por si acaso)
-    if audio_raw.startswith(b"RIFF"):
-        logger.warning("⚠️ ElevenLabs devolvió WAV; quitando cabecera de 44 bytes")
-        audio_raw = audio_raw[44:]
+        # 2️⃣ WAV → μ‑law crudo (por si acaso)
+        if audio_raw.startswith(b"RIFF"):
+            logger.warning("⚠️ ElevenLabs devolvió WAV; quitando cabecera de 44 bytes")
+            audio_raw = audio_raw[44:]
+
+        if cache_key and audio_raw:
+            TTS_CACHE.put(cache_key, audio_raw)
 
     # 3️⃣ Ganancia
     try:
@@ -131,75 +137,69 @@ async def send_tts_http_to_twilio(
 
     if not audio_raw:
         logger.error("🚨 ElevenLabs devolvió audio vacío")
-        await _safe_send_mark(websocket_send, stream_sid, "error")
-        return
+        await _safe_send_mark(websocket_send, stream_sid, "error", outbound)
+        return False
 
     total_frames = (len(audio_raw) + FRAME_SIZE - 1) // FRAME_SIZE
     logger.info("✅ Audio TTS recibido (%d bytes → %d frames)", len(audio_raw), total_frames)
 
-    # 4️⃣ Envío *pacing* a Twilio
-    start_t = time.perf_counter()
-    ts_send_start = start_t
-
-    frame_len = FRAME_SIZE
-    idx = 0
+    # 4️⃣ Envío *pacing* a Twilio (a través del planificador de la llamada)
+    owns_outbound = outbound is None
+    if owns_outbound:
+        outbound = OutboundAudioScheduler(
+            websocket_send, stream_sid,
+            group_frames=group_frames, max_ahead_ms=max_ahead_ms,
+        )
+    ts_send_start = time.perf_counter()
     try:
-        while idx < total_frames:
-            # Agrupa hasta `group_frames`, respetando longitud real
-            frames_left = total_frames - idx
-            frames_this_round = min(group_frames, frames_left)
-
-            start = idx * frame_len
-            end = min(len(audio_raw), start + frames_this_round * frame_len)
-            chunk = audio_raw[start:end]
-
-            # Padding si último paquete incompleto
-            if len(chunk) % frame_len:
-                pad = frame_len - (len(chunk) % frame_len)
-                chunk += b"\xFF" * pad  # 0xFF = silencio μ‑law
-
-            # Control de pre‑buffer ------------------------------------------
-            now          = time.perf_counter()
-            elapsed_ms   = (now - start_t) * 1000
-            audio_time_ms = idx * 20  # 20 ms por frame ya enviado
-            ahead_ms      = audio_time_ms - elapsed_ms
-            if ahead_ms > max_ahead_ms:
-                sleep_needed = (ahead_ms - max_ahead_ms) / 1000
-                if sleep_needed > 0:
-                    await asyncio.sleep(sleep_needed)
-
-            # Serializar + enviar
-            payload64 = base64.b64encode(chunk).decode()
-            try:
-                await websocket_send(json.dumps({
-                    "event": "media",
-                    "streamSid": stream_sid,
-                    "media": {"payload": payload64},
-                }))
-            except Exception as ws_exc:
-                logger.warning("⚠️ websocket_send falló: %s", ws_exc)
-                await _safe_send_mark(websocket_send, stream_sid, "error")
-                return
-
-            idx += frames_this_round
-
-            # Pacing para siguiente grupo
-            await asyncio.sleep(0)  # cede control al loop
-
+        outbound.enqueue(audio_raw)
+        # 5️⃣ Marca de fin (sale detrás del último frame)
+        outbound.send_mark("end_of_tts")
+        await outbound.flush()
     finally:
         envio_ms = (time.perf_counter() - ts_send_start) * 1000
-        logger.info("📶 Audio enviado a Twilio en %.1f ms", envio_ms)
+        logger.info("📶 Audio enviado a Twilio en %.1f ms", envio_ms)
+        if owns_outbound:
+            await outbound.close()
 
-    # 5️⃣ Marca de fin
-    await _safe_send_mark(websocket_send, stream_sid, "end_of_tts")
     logger.info("🏁 Audio completo enviado a Twilio.")
+    return True
 
 
 # ---------------------------------------------------------------------------
 #  Helpers
 # ---------------------------------------------------------------------------
-async def _safe_send_mark(send: WebSocketSend, stream_sid: str, name: str) -> None:
+def _fetch_tts_audio(url: str, payload: dict, headers: dict) -> bytes:
+    """Descarga el audio completo de ElevenLabs (lanza excepción si falla)."""
+    t_request = time.perf_counter()
+    response = requests.post(url, json=payload, headers=headers, stream=True, timeout=120)
+    response.raise_for_status()
+
+    first_chunk_at: float | None = None
+    buffer = BytesIO()
+
+    for chunk in response.iter_content(chunk_size=4096):
+        if not chunk:
+            continue  # Ignora keep‑alive vacíos
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter()
+            logger.info("⏱️ ElevenLabs primer chunk tras %.1f ms", (first_chunk_at - t_request) * 1000)
+        buffer.write(chunk)
+
+    return buffer.getvalue()
+
+
+async def _safe_send_mark(
+    send: WebSocketSend,
+    stream_sid: str,
+    name: str,
+    outbound: Optional[OutboundAudioScheduler] = None,
+) -> None:
     """Envía un evento *mark* salvaguardado con try/except."""
+    if outbound is not None:
+        # Respeta el orden respecto al audio que ya esté en cola
+        outbound.send_mark(name)
+        return
     try:
         await send(json.dumps({
             "event": "mark",
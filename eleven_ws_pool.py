@@ -0,0 +1,274 @@
+# eleven_ws_pool.py
+# -*- coding: utf-8 -*-
+"""
+Pool de sockets ElevenLabs multi-contexto, precalentados
+────────────────────────────────────────────────────────
+• Antes cada llamada abría su propio WebSocket de stream-input (TLS +
+  handshake antes del saludo) y, como el EOS cierra ese socket, se volvía a
+  abrir en cada respuesta.
+• Aquí el proceso mantiene ELEVEN_WS_POOL_SIZE sockets ya conectados al
+  endpoint multi-stream-input. Cada llamada recibe un ElevenLabsContextClient
+  (misma API que ElevenLabsWSClient) atado a uno de ellos; cada frase es un
+  contexto nuevo (context_id), así un socket lleva varias frases de llamadas
+  distintas a la vez (ELEVEN_WS_MAX_LEASES llamadas por socket).
+• Fin de frase: flush + close_context (el audio pendiente sale y llega
+  isFinal). Barge-in: close_context y el audio que quede se descarta.
+• Los mensajes de cada contexto se procesan en el contexto (call_context)
+  de la llamada que pidió el cliente, no en el de la tarea del socket: los
+  callbacks de audio ven la llamada correcta.
+• close() del cliente devuelve el socket al pool (no lo cierra). Una tarea
+  de fondo manda keep-alive a los sockets ociosos y reabre los caídos.
+• Sin pool (no iniciado o lleno) new_tts_client() da un ElevenLabsWSClient
+  propio, como antes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import websockets
+
+from eleven_ws_tts_client import DEFAULT_MODEL_ID, VOICE_SETTINGS, ElevenLabsWSClient
+from metrics import TTS_WS_LEASES, TTS_WS_POOL_OPEN
+
+logger = logging.getLogger("eleven_ws_pool")
+
+POOL_SIZE = int(os.getenv("ELEVEN_WS_POOL_SIZE", "2"))
+MAX_LEASES = int(os.getenv("ELEVEN_WS_MAX_LEASES", "4"))   # ElevenLabs: 5 contextos por socket (1 es el keep-alive)
+KEEPALIVE_S = 15.0            # socket sin tráfico: ping al contexto de keep-alive
+INACTIVITY_TIMEOUT_S = 180    # lo que ElevenLabs espera sin mensajes antes de cerrar
+KEEPALIVE_CONTEXT = "keepalive"
+
+_context_ids = itertools.count(1)
+
+
+class _PooledSocket:
+    """Un WebSocket multi-stream-input y los contextos que viajan por él."""
+
+    def __init__(self, pool: "ElevenLabsSocketPool", n: int) -> None:
+        self.pool = pool
+        self.name = f"ElevenPool_{n}"
+        self.ws = None
+        self.task: Optional[asyncio.Task] = None
+        self.clients: Set["ElevenLabsContextClient"] = set()      # llamadas con este socket
+        self.contexts: Dict[str, "ElevenLabsContextClient"] = {}  # context_id → dueño
+        self.last_send = 0.0
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run(), name=self.name)
+
+    @property
+    def alive(self) -> bool:
+        return self.ws is not None
+
+    async def _run(self) -> None:
+        pool = self.pool
+        url = (f"wss://api.elevenlabs.io/v1/text-to-speech/{pool.voice_id}/multi-stream-input"
+               f"?model_id={pool.model_id}&output_format=ulaw_8000&auto_mode=true"
+               f"&inactivity_timeout={INACTIVITY_TIMEOUT_S}")
+        t0 = time.perf_counter()
+        try:
+            async with websockets.connect(url, additional_headers={"xi-api-key": pool.api_key}) as ws:
+                self.ws = ws
+                await self.send({"text": " ", "context_id": KEEPALIVE_CONTEXT, "voice_settings": VOICE_SETTINGS})
+                logger.info(f"🟢 {self.name} conectado en {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+                async for message in ws:
+                    try:
+                        data = json.loads(message)
+                    except json.JSONDecodeError:
+                        logger.warning(f"⚠️ {self.name}: mensaje no JSON: {message[:100]}")
+                        continue
+                    client = self.contexts.get(data.get("contextId") or data.get("context_id"))
+                    if client is not None:
+                        # La tarea del socket es del pool: el mensaje se atiende en el contexto de la llamada
+                        await asyncio.create_task(client._handle_message(data), context=client._call_context)
+                    elif "error" in data:
+                        logger.error(f"❌ {self.name}: error de ElevenLabs: {data['error']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ {self.name}: {e}")
+        finally:
+            self.ws = None
+            for client in list(self.clients):
+                client._socket_lost()
+            self.clients.clear()
+            self.contexts.clear()
+            logger.info(f"🔒 {self.name} cerrado")
+
+    async def send(self, message: dict) -> None:
+        self.last_send = time.monotonic()
+        await self.ws.send(json.dumps(message))
+
+    async def keepalive(self) -> None:
+        if self.ws and time.monotonic() - self.last_send >= KEEPALIVE_S:
+            try:
+                await self.send({"text": "", "context_id": KEEPALIVE_CONTEXT})
+            except Exception as e:
+                logger.debug(f"{self.name}: keep-alive falló: {e}")
+
+    async def close(self) -> None:
+        if self.ws:
+            try:
+                await self.ws.send(json.dumps({"close_socket": True}))
+                await self.ws.close()
+            except Exception as e:
+                logger.debug(f"{self.name}: error cerrando: {e}")
+        if self.task and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+class ElevenLabsContextClient(ElevenLabsWSClient):
+    """ElevenLabsWSClient sobre un socket del pool: un contexto por frase."""
+
+    def __init__(self, pool: "ElevenLabsSocketPool", socket: _PooledSocket) -> None:
+        super().__init__(api_key=pool.api_key, voice_id=pool.voice_id, model_id=pool.model_id)
+        self._socket = socket
+        self._context_id: Optional[str] = None
+        self._call_context = contextvars.copy_context()     # contexto de la llamada que lo pidió
+        self._ws = socket.ws
+        self._ws_open.set()
+        socket.clients.add(self)
+
+    def _start_connection(self) -> None:
+        """El socket es del pool: no se abre uno propio."""
+
+    async def _send(self, message: dict) -> None:
+        # Los ajustes de voz solo van en el primer mensaje del contexto (_open_utterance)
+        message = {k: v for k, v in message.items() if k != "voice_settings"}
+        message["context_id"] = self._context_id
+        await self._socket.send(message)
+
+    async def _open_utterance(self) -> None:
+        self._cerrar_contexto()
+        self._context_id = f"{self._socket.name}-{next(_context_ids)}"
+        self._socket.contexts[self._context_id] = self
+        await self._socket.send({"text": " ", "context_id": self._context_id, "voice_settings": self.voice_settings})
+
+    async def _end_utterance(self) -> None:
+        """flush + close_context: sale el audio pendiente y después llega isFinal."""
+        await self._send({"flush": True})
+        await self._send({"close_context": True})
+
+    async def _handle_message(self, data: dict) -> None:
+        await super()._handle_message(data)
+        if data.get("isFinal"):
+            self._socket.contexts.pop(data.get("contextId") or data.get("context_id"), None)
+
+    def _cerrar_contexto(self) -> None:
+        """Deja de escuchar el contexto en curso y le pide a ElevenLabs que lo cierre."""
+        cid, self._context_id = self._context_id, None
+        if cid and self._socket.contexts.pop(cid, None) is not None and self._socket.ws:
+            asyncio.create_task(self._close_context(cid))
+
+    async def _close_context(self, cid: str) -> None:
+        try:
+            await self._socket.send({"context_id": cid, "close_context": True})
+        except Exception as e:
+            logger.debug(f"close_context {cid} falló: {e}")
+
+    def cancel_utterance(self) -> None:
+        super().cancel_utterance()
+        self._cerrar_contexto()
+
+    def _socket_lost(self) -> None:
+        self._ws = None
+        self._ws_close.set()
+
+    async def close(self) -> None:
+        """Devuelve el socket al pool (no lo cierra)."""
+        self.cancel_utterance()
+        self._socket.clients.discard(self)
+        self._ws = None
+        self._ws_close.set()
+        logger.debug(f"♻️ {self._socket.name} devuelto al pool")
+
+
+class ElevenLabsSocketPool:
+    """Sockets multi-contexto abiertos de antemano y prestados a las llamadas."""
+
+    def __init__(self, *, size: int, max_leases: int, model_id: str = DEFAULT_MODEL_ID) -> None:
+        self.api_key = os.getenv("ELEVEN_LABS_API_KEY")
+        self.voice_id = os.getenv("ELEVEN_LABS_VOICE_ID")
+        if not self.api_key or not self.voice_id:
+            raise RuntimeError("ELEVEN_LABS_API_KEY / ELEVEN_LABS_VOICE_ID no configurados")
+        self.model_id = model_id
+        self.max_leases = max_leases
+        self.sockets: List[_PooledSocket] = [_PooledSocket(self, n) for n in range(size)]
+        self._maintain_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        for sock in self.sockets:
+            sock.start()
+        self._maintain_task = asyncio.create_task(self._maintain(), name="ElevenPool_maintain")
+
+    def open_sockets(self) -> int:
+        return sum(1 for s in self.sockets if s.alive)
+
+    async def _maintain(self) -> None:
+        """Keep-alive a los sockets ociosos; los caídos se reabren."""
+        while True:
+            await asyncio.sleep(KEEPALIVE_S / 3)
+            for sock in self.sockets:
+                if sock.task is None or sock.task.done():
+                    logger.info(f"🔁 {sock.name}: reconectando")
+                    sock.start()
+                else:
+                    await sock.keepalive()
+
+    def lease(self) -> Optional[ElevenLabsContextClient]:
+        """Cliente sobre el socket abierto con menos llamadas (None si no hay lugar)."""
+        libres = [s for s in self.sockets if s.alive and len(s.clients) < self.max_leases]
+        if not libres:
+            return None
+        return ElevenLabsContextClient(self, min(libres, key=lambda s: len(s.clients)))
+
+    async def close(self) -> None:
+        if self._maintain_task:
+            self._maintain_task.cancel()
+            await asyncio.gather(self._maintain_task, return_exceptions=True)
+        await asyncio.gather(*(s.close() for s in self.sockets), return_exceptions=True)
+
+
+POOL: Optional[ElevenLabsSocketPool] = None
+TTS_WS_POOL_OPEN.set_function(lambda: POOL.open_sockets() if POOL else 0)
+
+
+def start_pool() -> None:
+    """Arranca el pool (startup de la app). ELEVEN_WS_POOL_SIZE=0 lo desactiva."""
+    global POOL
+    if POOL is not None or POOL_SIZE <= 0:
+        return
+    try:
+        POOL = ElevenLabsSocketPool(size=POOL_SIZE, max_leases=MAX_LEASES)
+    except RuntimeError as e:
+        logger.error(f"❌ Pool ElevenLabs desactivado: {e}")
+        return
+    POOL.start()
+    logger.info(f"🔌 Pool ElevenLabs: {POOL_SIZE} sockets × {MAX_LEASES} llamadas")
+
+
+async def close_pool() -> None:
+    global POOL
+    if POOL is not None:
+        await POOL.close()
+        POOL = None
+
+
+def new_tts_client() -> ElevenLabsWSClient:
+    """Cliente TTS para una llamada: prestado del pool si hay lugar, si no uno propio."""
+    client = POOL.lease() if POOL else None
+    if client is not None:
+        TTS_WS_LEASES.labels("pooled").inc()
+        return client
+    TTS_WS_LEASES.labels("dedicated").inc()
+    return ElevenLabsWSClient()
@@ -5,6 +5,10 @@ Cliente WebSocket de ElevenLabs TTS — v3 OPTIMIZADO con auto_mode
 • Modelo eleven_flash_v2_5 + auto_mode + optimize_streaming_latency
 • Envío directo de chunks sin buffer manual
 • Reutilización de conexión WebSocket
+• speak(cache=True) sirve frases fijas desde tts_cache sin ir a la red
+• Streaming real: begin_stream() + add_text_chunk() por frase + finalize_stream()
+• eleven_ws_pool.ElevenLabsContextClient reutiliza esta API sobre sockets
+  multi-contexto precalentados (redefine _send / _open_utterance / _end_utterance)
 
 """
 
@@ -19,11 +23,24 @@ import time
 from typing import Awaitable, Callable, Optional
 import logging
 
+from metrics import TTS_FIRST_CHUNK_SECONDS
+from tts_cache import TTS_CACHE
+
 logger = logging.getLogger(__name__)
 
 ChunkCallback = Callable[[bytes], Awaitable[None]]
 EndCallback = Callable[[], Awaitable[None]]
 
+DEFAULT_MODEL_ID = "eleven_flash_v2_5"
+
+# ✅ Configuración optimizada según RAG (también la usan los sockets de eleven_ws_pool)
+VOICE_SETTINGS = {
+    "stability": 0.75,
+    "style": 0.45,
+    "use_speaker_boost": False,
+    "speed": 1.2,
+}
+
 
 class ElevenLabsWSClient:
     """Cliente optimizado para TTS streaming con latencia mínima usando auto_mode."""
@@ -33,7 +50,7 @@ class ElevenLabsWSClient:
         *,
         api_key: str | None = None,
         voice_id: str | None = None,
-        model_id: str = "eleven_flash_v2_5",  
+        model_id: str = DEFAULT_MODEL_ID,
     ) -> None:
         # API key: ELEVEN_LABS_API_KEY > parámetro
         self.api_key = api_key or os.getenv("ELEVEN_LABS_API_KEY")
@@ -68,14 +85,13 @@ class ElevenLabsWSClient:
         self._should_close = False
         self._chunk_counter = 0
         self._send_time = 0.0
+        self._stream_sent = 0        # chunks de texto enviados desde begin_stream()
 
-        # ✅ Configuración optimizada según RAG
-        self.voice_settings = {
-            "stability": 0.75,
-            "style": 0.45,
-            "use_speaker_boost": False,
-            "speed": 1.2,
-        }
+        # Grabación de la frase en curso para guardarla en caché al llegar isFinal
+        self._cache_key: Optional[str] = None
+        self._cache_audio: Optional[bytearray] = None
+
+        self.voice_settings = dict(VOICE_SETTINGS)
 
         # Iniciar conexión WebSocket REUTILIZABLE
         self._start_connection()
@@ -185,9 +201,13 @@ class ElevenLabsWSClient:
                         first_audio_time = time.perf_counter()
                         if hasattr(self, '_send_time') and self._send_time > 0:
                             delta_ms = (first_audio_time - self._send_time) * 1000
+                            TTS_FIRST_CHUNK_SECONDS.observe(delta_ms / 1000)
                             logger.info(f"⏱️ [LATENCIA-4-FIRST] EL primer audio chunk: {delta_ms:.1f} ms")
                         self._loop.call_soon_threadsafe(self._first_chunk.set)
                     
+                    if self._cache_audio is not None:
+                        self._cache_audio.extend(audio_bytes)
+
                     # Enviar chunk al callback
                     if self._user_chunk:
                         if asyncio.iscoroutinefunction(self._user_chunk):
@@ -205,6 +225,10 @@ class ElevenLabsWSClient:
         # Fin de stream
         if data.get("isFinal", False):
             logger.info("🔚 ElevenLabs: fin de stream recibido")
+            if self._cache_key and self._cache_audio:
+                TTS_CACHE.put(self._cache_key, self._cache_audio)
+            self._cache_key = None
+            self._cache_audio = None
             if self._user_end:
                 if asyncio.iscoroutinefunction(self._user_end):
                     asyncio.run_coroutine_threadsafe(self._user_end(), self._loop)
@@ -216,8 +240,60 @@ class ElevenLabsWSClient:
             error_msg = data["error"]
             logger.error(f"❌ Error de ElevenLabs: {error_msg}")
 
+    # ─────────────────────── Transporte (eleven_ws_pool lo redefine) ───────────────────────
+
+    async def _send(self, message: dict) -> None:
+        await self._ws.send(json.dumps(message))
+
+    async def _open_utterance(self) -> None:
+        """Antes de cada frase. Socket propio: nada (la configuración va al conectar)."""
+
+    async def _end_utterance(self) -> None:
+        """Fin de la frase: texto vacío (ElevenLabs termina el audio y cierra el socket)."""
+        await self._send({"text": ""})
+
     # ─────────────────────────────────── API pública ────────────────────────────────────
 
+    async def begin_stream(
+        self,
+        on_chunk: ChunkCallback,
+        *,
+        on_end: Optional[EndCallback] = None,
+        timeout_connect: float = 5.0,
+    ) -> bool:
+        """
+        Prepara una frase en streaming: registra callbacks y espera la conexión.
+        Después: add_text_chunk() por cada frase/cláusula y finalize_stream().
+        """
+        try:
+            await asyncio.wait_for(self._ws_open.wait(), timeout=timeout_connect)
+        except asyncio.TimeoutError:
+            logger.error("❌ Timeout esperando conexión ElevenLabs (stream)")
+            return False
+        if not self._ws:
+            logger.error("❌ WebSocket no disponible (stream)")
+            return False
+
+        self._first_chunk = asyncio.Event()
+        self._user_chunk = on_chunk
+        self._user_end = on_end
+        self._is_speaking = True
+        self._cache_key = None
+        self._cache_audio = None
+        self._stream_sent = 0
+        await self._open_utterance()
+        return True
+
+    async def wait_first_chunk(self, timeout: float) -> bool:
+        """True si el primer chunk de audio de la frase en curso llegó (o llega antes de `timeout`)."""
+        if not self._first_chunk:
+            return False
+        try:
+            await asyncio.wait_for(self._first_chunk.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
     async def add_text_chunk(self, text_chunk: str) -> bool:
         """
         Envía chunks directamente a EL con auto_mode (sin buffer manual).
@@ -230,12 +306,16 @@ class ElevenLabsWSClient:
             return False
             
         try:
-            message = {"text": text_chunk.strip()}
+            # EL concatena los chunks tal cual: cada uno debe terminar en espacio
+            message = {"text": text_chunk.strip() + " "}
             
             logger.info(f"📤 Chunk directo a EL: '{text_chunk.strip()[:40]}...' ({len(text_chunk.strip())} chars)")
             
-            self._send_time = time.perf_counter()
-            await self._ws.send(json.dumps(message))
+            if not self._stream_sent:
+                self._send_time = time.perf_counter()   # latencia al primer audio: desde el primer texto
+                logger.info("⏱️ [LATENCIA-4-START] EL WS primer texto enviado (streaming)")
+            self._stream_sent += 1
+            await self._send(message)
             
             return True
             
@@ -249,7 +329,7 @@ class ElevenLabsWSClient:
         """
         try:
             # Enviar EOS (End of Sequence)
-            await self._ws.send(json.dumps({"text": ""}))
+            await self._end_utterance()
             logger.debug("📤 EOS enviado")
             
             return True
@@ -265,12 +345,26 @@ class ElevenLabsWSClient:
         *,
         on_end: Optional[EndCallback] = None,
         timeout_first_chunk: float = 1.0,
+        cache: bool = False,
     ) -> bool:
         """
         API compatible con versión anterior para texto completo.
         Para streaming real usar add_text_chunk() + finalize_stream()
+
+        cache=True: para frases fijas. Si el audio ya está en tts_cache se
+        entrega de inmediato (sin red); si no, se sintetiza y se guarda.
         """
-        
+        cache_key = None
+        if cache:
+            cache_key = TTS_CACHE.make_key(text, self.voice_id, self.model_id, self.voice_settings)
+            audio = TTS_CACHE.get(cache_key)
+            if audio:
+                logger.info(f"⚡ TTS desde caché: {len(text)} chars → {len(audio)} bytes")
+                await on_chunk(audio)
+                if on_end:
+                    await on_end()
+                return True
+
         # Esperar conexión
         try:
             await asyncio.wait_for(self._ws_open.wait(), timeout=5.0)
@@ -287,8 +381,12 @@ class ElevenLabsWSClient:
         self._user_chunk = on_chunk
         self._user_end = on_end
         self._is_speaking = True
+        self._cache_key = cache_key
+        self._cache_audio = bytearray() if cache_key else None
 
         try:
+            await self._open_utterance()
+
             # Mensaje completo sin auto_mode (usando chunk_length_schedule)
             message = {
                 "text": text,
@@ -296,11 +394,11 @@ class ElevenLabsWSClient:
             }
             
             self._send_time = time.perf_counter()
-            await self._ws.send(json.dumps(message))
+            await self._send(message)
             logger.info(f"⏱️ [LATENCIA-4-START] EL WS texto enviado: {len(text)} chars (modo legacy)")
 
             # Enviar EOS
-            await self._ws.send(json.dumps({"text": ""}))
+            await self._end_utterance()
 
             # Esperar primer chunk
             try:
@@ -314,6 +412,17 @@ class ElevenLabsWSClient:
             logger.error(f"❌ Error enviando texto a ElevenLabs: {e}")
             return False
 
+    def cancel_utterance(self) -> None:
+        """
+        Barge-in: descarta lo que falte de la frase en curso. Los chunks que
+        sigan llegando ya no se entregan (ni on_end) y no se guarda en caché.
+        """
+        self._user_chunk = None
+        self._user_end = None
+        self._cache_key = None
+        self._cache_audio = None
+        self._is_speaking = False
+
     async def close(self):
         """Cierra la conexión WebSocket"""
         logger.info("🔒 Cerrando ElevenLabs WebSocket...")
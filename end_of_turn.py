@@ -0,0 +1,292 @@
+# end_of_turn.py
+# -*- coding: utf-8 -*-
+"""
+Detector de fin de turno del llamante
+─────────────────────────────────────
+• Decide CUÁNDO cerrar el turno y mandar lo acumulado a GPT combinando:
+    – eventos de Deepgram: speech_final (endpointing), UtteranceEnd y
+      SpeechStarted;
+    – el VAD local (speech_start / speech_end);
+    – pistas del texto: puntuación final (frase completa) o frase a medias
+      (termina en "y", "de", "que"…, o un teléfono a medio dictar);
+    – una pausa base ADAPTATIVA por llamada: si el llamante sigue hablando
+      justo después de que cerramos su turno, la pausa crece; en turnos
+      limpios vuelve poco a poco a la base.
+• Frase completa → se cierra pronto; frase a medias → se espera más.
+• Un EndOfTurnDetector por llamada. El manager le pasa los eventos y usa
+  delay() para programar el plazo y ready() para decidir al cumplirse.
+• Tuning: con EOT_LOG_FILE cada turno se guarda (eventos + decisión) en
+  JSONL; replay() re-evalúa esos turnos con otra configuración
+  (ver tune_end_of_turn.py) y EOT_CONFIG_FILE carga los valores elegidos.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, fields
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("end_of_turn")
+
+EOT_LOG_FILE = os.getenv("EOT_LOG_FILE", "")
+EOT_CONFIG_FILE = os.getenv("EOT_CONFIG_FILE", "")
+
+# Palabras con las que nadie termina una frase
+CONECTORES_FINALES = frozenset({
+    "y", "o", "u", "e", "de", "del", "que", "pero", "para", "con", "a", "al",
+    "el", "la", "los", "las", "un", "una", "en", "mi", "su", "es", "por",
+    "como", "cuando", "porque", "si", "entonces", "este", "eh", "mm", "pues",
+})
+TELEFONO_DIGITOS = 10
+_WORD_RE = re.compile(r"[\wáéíóúñü]+", re.IGNORECASE)
+_DIGIT_RE = re.compile(r"\d")
+
+# Tipos de evento (también son las claves del log JSONL)
+TRANSCRIPT = "transcript"
+SPEECH_FINAL = "speech_final"
+UTTERANCE_END = "utterance_end"
+SPEECH_STARTED = "speech_started"
+VAD_START = "vad_start"
+VAD_END = "vad_end"
+
+
+@dataclass
+class EndOfTurnConfig:
+    base_pause: float = 0.30         # pausa por defecto tras el último final
+    complete_pause: float = 0.15     # frase que termina en . ? !
+    vad_pause: float = 0.15          # el VAD ya vio terminar la voz
+    speech_final_pause: float = 0.0  # Deepgram ya esperó su endpointing
+    incomplete_pause: float = 1.2    # frase a medias / número a medio dictar
+    max_wait: float = 5.0            # failsafe: se cierra aunque haya parciales
+    max_base_pause: float = 0.8      # techo de la pausa adaptativa
+    adapt_step: float = 0.05         # +s por cada cierre prematuro
+    adapt_decay: float = 0.01        # -s por cada turno limpio
+    premature_window: float = 0.8    # habla dentro de esta ventana tras cerrar = prematuro
+
+
+def load_config(path: str = EOT_CONFIG_FILE, **defaults: float) -> EndOfTurnConfig:
+    """Config con `defaults`, sobrescrita por el JSON de EOT_CONFIG_FILE si existe."""
+    cfg = EndOfTurnConfig(**defaults)
+    if not path:
+        return cfg
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ No se pudo leer la config de fin de turno '{path}': {e}")
+        return cfg
+    names = {f.name for f in fields(cfg)}
+    for key, value in data.items():
+        if key in names:
+            setattr(cfg, key, float(value))
+    logger.info(f"🎚️ Config de fin de turno cargada de '{path}': {asdict(cfg)}")
+    return cfg
+
+
+def frase_incompleta(texto: str) -> bool:
+    """¿El texto acaba a media frase (conector final o teléfono a medio dictar)?"""
+    t = texto.rstrip()
+    if not t:
+        return False
+    if t.endswith(","):
+        return True
+    palabras = _WORD_RE.findall(t.lower())
+    if not palabras:
+        return False
+    if palabras[-1] in CONECTORES_FINALES:
+        return True
+    digitos = len(_DIGIT_RE.findall(t))
+    return 0 < digitos < TELEFONO_DIGITOS and _DIGIT_RE.search(palabras[-1]) is not None
+
+
+def frase_completa(texto: str) -> bool:
+    return texto.rstrip().endswith((".", "?", "!"))
+
+
+class EndOfTurnDetector:
+    """Estado de fin de turno de UNA llamada (tiempos en perf_counter)."""
+
+    def __init__(self, config: Optional[EndOfTurnConfig] = None) -> None:
+        self.config = config or EndOfTurnConfig()
+        self.adaptive_pause = self.config.base_pause
+        self.turns = 0
+        self.premature = 0
+        self._committed_at: Optional[float] = None
+        self._premature_this_turn = False
+        self._events: List[Tuple[float, str, object]] = []
+        self._vad_speaking = False       # estado físico: sobrevive al cambio de turno
+        self._reset_turn()
+
+    def _reset_turn(self) -> None:
+        self._text = ""                  # finales del turno
+        self._last_activity: Optional[float] = None
+        self._partial_pending = False    # llegó un parcial después del último final
+        self._speech_final = False
+        self._utterance_end = False
+        self._dg_speaking = False        # SpeechStarted sin transcript todavía
+        self._vad_ended = False
+        self._events = []
+
+    # ───────────────────────────── Entradas ─────────────────────────────
+
+    def on_transcript(self, text: str, is_final: bool, t: float) -> None:
+        self._check_premature(t)
+        self._record(t, TRANSCRIPT, [text, is_final])
+        self._last_activity = t
+        self._dg_speaking = False
+        self._utterance_end = False
+        self._speech_final = False
+        if is_final:
+            self._text = f"{self._text} {text.strip()}".strip()
+            self._partial_pending = False
+        else:
+            self._partial_pending = True
+
+    def on_speech_final(self, t: float) -> None:
+        self._record(t, SPEECH_FINAL, None)
+        self._speech_final = True
+
+    def on_utterance_end(self, t: float) -> None:
+        self._record(t, UTTERANCE_END, None)
+        self._utterance_end = True
+
+    def on_speech_started(self, t: float) -> None:
+        self._check_premature(t)
+        self._record(t, SPEECH_STARTED, None)
+        self._dg_speaking = True
+        self._vad_ended = False
+
+    def on_vad(self, speaking: bool, t: float) -> None:
+        if speaking:
+            self._check_premature(t)
+        self._record(t, VAD_START if speaking else VAD_END, None)
+        self._vad_speaking = speaking
+        self._vad_ended = not speaking
+
+    # ───────────────────────────── Decisión ─────────────────────────────
+
+    def pause(self) -> float:
+        """Silencio que hay que observar tras la última actividad para cerrar."""
+        cfg = self.config
+        if frase_incompleta(self._text):
+            return cfg.incomplete_pause
+        pausa = self.adaptive_pause
+        if self._speech_final:
+            pausa = min(pausa, cfg.speech_final_pause)
+        if frase_completa(self._text):
+            pausa = min(pausa, cfg.complete_pause)
+        if self._vad_ended:
+            pausa = min(pausa, cfg.vad_pause)
+        return pausa
+
+    def ready(self, t: float) -> bool:
+        """¿Se puede cerrar el turno ya?"""
+        if not self._text or self._last_activity is None:
+            return False
+        quieto = t - self._last_activity
+        if quieto >= self.config.max_wait:
+            return True
+        if self._partial_pending or self._dg_speaking or self._vad_speaking:
+            return False
+        if self._utterance_end:
+            return True
+        return quieto >= self.pause()
+
+    def delay(self, t: float) -> float:
+        """Segundos hasta la próxima evaluación (0 = evaluar ya)."""
+        if self._last_activity is None:
+            return self.adaptive_pause
+        quieto = t - self._last_activity
+        if self._partial_pending or self._dg_speaking or self._vad_speaking:
+            # Sigue hablando: re-evaluar más tarde; el failsafe acota la espera
+            return min(self.adaptive_pause, max(0.0, self.config.max_wait - quieto))
+        if self._utterance_end:
+            return 0.0
+        return max(0.0, self.pause() - quieto)
+
+    def commit(self, t: float) -> dict:
+        """El turno se cerró: se registra, se adapta la pausa y se limpia."""
+        self.turns += 1
+        if not self._premature_this_turn and self.adaptive_pause > self.config.base_pause:
+            self.adaptive_pause = max(self.config.base_pause, self.adaptive_pause - self.config.adapt_decay)
+        entry = {
+            "text": self._text,
+            "events": [[round(ts - self._events[0][0], 3), kind, data] for ts, kind, data in self._events]
+                      if self._events else [],
+            "closed_at": round(t - self._events[0][0], 3) if self._events else 0.0,
+            "pause": round(self.pause(), 3),
+            "adaptive_pause": round(self.adaptive_pause, 3),
+        }
+        self._committed_at = t
+        self._premature_this_turn = False
+        self._reset_turn()
+        return entry
+
+    def _check_premature(self, t: float) -> None:
+        """Voz justo después de cerrar el turno: lo cerramos antes de tiempo."""
+        if self._committed_at is None:
+            return
+        if t - self._committed_at <= self.config.premature_window:
+            self.premature += 1
+            self._premature_this_turn = True
+            self.adaptive_pause = min(self.config.max_base_pause, self.adaptive_pause + self.config.adapt_step)
+            logger.debug(f"⏪ Cierre de turno prematuro: pausa base → {self.adaptive_pause:.2f}s")
+        self._committed_at = None
+
+    def _record(self, t: float, kind: str, data: object) -> None:
+        self._events.append((t, kind, data))
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "premature": self.premature,
+            "adaptive_pause": round(self.adaptive_pause, 3),
+        }
+
+
+def log_turn(entry: dict, call_id: object = None, path: str = EOT_LOG_FILE) -> None:
+    """Agrega un turno cerrado al JSONL de tuning (si EOT_LOG_FILE está definido)."""
+    if not path:
+        return
+    try:
+        with open(path, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps({"call": call_id, **entry}, ensure_ascii=False))
+            fp.write("\n")
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudo escribir el log de fin de turno en '{path}': {e}")
+
+
+def replay(events: Iterable[list], config: EndOfTurnConfig, step: float = 0.01) -> Optional[float]:
+    """
+    Re-evalúa un turno grabado con otra config. Devuelve el instante (s,
+    relativo al primer evento) en que se habría cerrado, o None si no cerró
+    antes de que acabaran los eventos + max_wait.
+    """
+    det = EndOfTurnDetector(config)
+    events = list(events)
+    if not events:
+        return None
+    fin = events[-1][0] + config.max_wait
+    i = 0
+    t = events[0][0]
+    while t <= fin:
+        while i < len(events) and events[i][0] <= t:
+            ts, kind, data = events[i]
+            if kind == TRANSCRIPT:
+                det.on_transcript(data[0], data[1], ts)
+            elif kind == SPEECH_FINAL:
+                det.on_speech_final(ts)
+            elif kind == UTTERANCE_END:
+                det.on_utterance_end(ts)
+            elif kind == SPEECH_STARTED:
+                det.on_speech_started(ts)
+            elif kind in (VAD_START, VAD_END):
+                det.on_vad(kind == VAD_START, ts)
+            i += 1
+        if det.ready(t):
+            return round(t, 3)
+        t += step
+    return None
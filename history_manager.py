@@ -0,0 +1,154 @@
+# history_manager.py
+# -*- coding: utf-8 -*-
+"""
+Historial de la llamada con presupuesto de tokens
+─────────────────────────────────────────────────
+• conversation_history crece durante toda la llamada y se manda completo en
+  los dos pases de GPT: el prompt (y el TTFT) crece con cada turno.
+• HistoryCompactor.compact() devuelve lo que se envía a GPT:
+    – los últimos `keep_turns` turnos tal cual;
+    – los anteriores, plegados en UN mensaje de resumen estructurado (modo,
+      teléfono, nombre, horarios ofrecidos / elegidos, cita seleccionada);
+    – y nunca más de `budget_tokens` en total (tope duro: si aun así no cabe,
+      se quitan turnos viejos y, en último caso, se recorta el mensaje).
+• El corte avanza de `fold_step` en `fold_step` turnos: entre pliegues el
+  inicio del historial no cambia y OpenAI puede seguir cacheando el prefijo.
+• Los datos del resumen salen de las tools (remember_tool_result), no del
+  texto: se guardan en session_state["memoria"] de la llamada en curso.
+• Tokens estimados por caracteres (sin tokenizador): suficiente para un
+  presupuesto, que es un tope y no una cuenta exacta.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from functools import lru_cache
+from typing import Any, Dict, List, MutableMapping, Optional, Sequence
+
+logger = logging.getLogger("history_manager")
+
+CHARS_PER_TOKEN = 3.5        # español con los tokenizadores de OpenAI (conservador)
+MESSAGE_OVERHEAD_TOKENS = 4  # rol + separadores de cada mensaje
+
+_ETIQUETAS = (
+    ("modo", "Modo"),
+    ("telefono", "Teléfono"),
+    ("nombre", "Nombre"),
+    ("motivo", "Motivo"),
+    ("horarios_ofrecidos", "Horarios ofrecidos"),
+    ("horario_elegido", "Horario elegido"),
+    ("cita_seleccionada", "Cita seleccionada"),
+    ("ultima_accion", "Última acción"),
+)
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """Tokens aproximados de un texto."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(msg: Dict[str, Any]) -> int:
+    """Tokens aproximados de un mensaje del historial (contenido + tool calls)."""
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(str(msg.get("content") or ""))
+    for tc in msg.get("tool_calls") or ():
+        fn = tc.get("function", {}) if isinstance(tc, dict) else {}
+        tokens += estimate_tokens(f"{fn.get('name', '')}{fn.get('arguments', '')}")
+    return tokens
+
+
+# ──────────────────────── Memoria estructurada ────────────────────────
+
+def remember_tool_result(state: MutableMapping[str, Any], name: str,
+                         args: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Guarda en state["memoria"] los datos de la tool que el resumen necesita."""
+    if not isinstance(result, dict) or result.get("error"):
+        return
+    memoria = state.setdefault("memoria", {})
+
+    if name == "process_appointment_request" and result.get("available_pretty"):
+        dia = result.get("date_iso") or result.get("suggested_date_iso") or ""
+        memoria["horarios_ofrecidos"] = f"{dia}: {', '.join(map(str, result['available_pretty']))}"
+    elif name == "create_calendar_event":
+        for key, arg in (("nombre", "name"), ("telefono", "phone"), ("motivo", "reason")):
+            if args.get(arg):
+                memoria[key] = args[arg]
+        memoria["horario_elegido"] = result.get("start") or args.get("start_time")
+        memoria["cita_seleccionada"] = result.get("id")
+        memoria["ultima_accion"] = "cita creada"
+    elif name == "search_calendar_event_by_phone":
+        if args.get("phone"):
+            memoria["telefono"] = args["phone"]
+        citas = result.get("search_results") or []
+        if citas:
+            memoria["nombre"] = citas[0].get("patient_name") or memoria.get("nombre")
+            memoria["citas_encontradas"] = "; ".join(
+                f"{c.get('event_id')} ({c.get('start_time_cancun_pretty')})" for c in citas
+            )
+    elif name == "edit_calendar_event":
+        memoria["horario_elegido"] = result.get("start_time_iso")
+        memoria["cita_seleccionada"] = result.get("id")
+        memoria["ultima_accion"] = "cita modificada"
+    elif name == "delete_calendar_event":
+        memoria["cita_seleccionada"] = result.get("deleted_event_id")
+        memoria["ultima_accion"] = "cita eliminada"
+
+
+def summary_text(memoria: Dict[str, Any], modo: Optional[str], folded_turns: int) -> str:
+    """Mensaje de resumen para los turnos plegados."""
+    datos = dict(memoria, modo=modo or "base")
+    if not datos.get("cita_seleccionada") and datos.get("citas_encontradas"):
+        datos["cita_seleccionada"] = f"citas encontradas: {datos['citas_encontradas']}"
+    lineas = [f"RESUMEN DE LA LLAMADA ({folded_turns} turnos anteriores resumidos):"]
+    lineas += [f"• {etiqueta}: {datos[key]}" for key, etiqueta in _ETIQUETAS if datos.get(key)]
+    return "\n".join(lineas)
+
+
+# ──────────────────────────── Compactador ────────────────────────────
+
+class HistoryCompactor:
+    """Decide qué parte del historial se manda a GPT en cada pase."""
+
+    def __init__(self, *, keep_turns: int, budget_tokens: int, fold_step: int = 2) -> None:
+        self.keep_turns = keep_turns
+        self.budget_tokens = budget_tokens
+        self.fold_step = max(1, fold_step)
+
+    def compact(self, history: Sequence[Dict[str, Any]], *, modo: Optional[str],
+                memoria: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        history = list(history)
+        tokens = [message_tokens(m) for m in history]
+
+        # Corte en un mensaje de usuario, avanzando de fold_step en fold_step turnos
+        starts = [i for i, m in enumerate(history) if m.get("role") == "user"]
+        folded = max(0, len(starts) - self.keep_turns)
+        folded -= folded % self.fold_step
+        if not folded and sum(tokens) <= self.budget_tokens:
+            return history
+        cut = starts[folded] if folded < len(starts) else len(history) - 1
+
+        # Tope duro: quitar turnos viejos hasta que quepa (el último mensaje siempre va)
+        summary = {"role": "system", "content": summary_text(memoria or {}, modo, folded)}
+        while cut < len(history) - 1 and sum(tokens[cut:]) > self.budget_tokens - message_tokens(summary):
+            cut += 1
+            while cut < len(history) - 1 and history[cut].get("role") != "user":
+                cut += 1
+            folded += 1
+            summary["content"] = summary_text(memoria or {}, modo, folded)
+        budget = self.budget_tokens - message_tokens(summary)
+
+        kept = history[cut:]
+        if sum(tokens[cut:]) > budget:
+            kept = kept[-1:]
+            kept[0] = dict(kept[0], content=self._recortar(str(kept[0].get("content") or ""), budget))
+
+        logger.info(f"🗜️ Historial: {len(history)} mensajes (~{sum(tokens)} tokens) → resumen de "
+                    f"{folded} turnos + {len(kept)} mensajes (~{message_tokens(summary) + sum(message_tokens(m) for m in kept)} tokens)")
+        return [summary] + kept
+
+    @staticmethod
+    def _recortar(texto: str, budget: int) -> str:
+        """Deja el final del texto (lo último que dijo el usuario) dentro del presupuesto."""
+        max_chars = max(0, int((budget - MESSAGE_OVERHEAD_TOKENS) * CHARS_PER_TOKEN))
+        return texto[-max_chars:] if max_chars else ""
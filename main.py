@@ -3,8 +3,14 @@ import os
 import logging
 from fastapi import FastAPI, Response, WebSocket, Body, Request
 import fastapi
-from aiagent import generate_openai_response_main
+from aiagent import TOOL_EXECUTOR, close_openai_client, generate_openai_response_main
 from tw_utils import TwilioWebSocketManager, set_debug   
+from audio_bank import load_audio_bank
+from calendar_sync import close_sync as close_calendar_sync, start_sync as start_calendar_sync
+from call_bootstrap import refresh_shared_caches
+from deepgram_pool import close_pool as close_dg_pool, start_pool as start_dg_pool
+from eleven_ws_pool import close_pool as close_eleven_pool, start_pool as start_eleven_pool
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics, start_loop_lag_probe
 from consultarinfo import get_consultorio_data_from_cache, load_consultorio_data_to_cache 
 from consultarinfo import router as consultorio_router 
 import buscarslot       
@@ -281,17 +287,51 @@ def startup_event() -> None:
     os.makedirs("audio", exist_ok=True)
     os.makedirs("audio_debug", exist_ok=True)
 
+    # Clips pregrabados: se leen y codifican una sola vez para todas las llamadas
+    load_audio_bank()
+
+    # Sonda de lag del event loop para /metrics
+    start_loop_lag_probe()
+
+    # Sockets de ElevenLabs ya conectados antes de la primera llamada
+    start_eleven_pool()
+
+    # Conexiones de Deepgram abiertas de antemano: la llamada no espera el handshake
+    start_dg_pool()
+
+    # Slots libres: sincronización incremental de Google Calendar en segundo plano
+    start_calendar_sync()
+
+    # Slots y datos del consultorio calientes antes de la primera llamada
+    refresh_shared_caches()
+
     # Activa métricas detalladas ⏱️  – pon False en producción:
     set_debug(True)
 
     logger.info("🚀 Backend listo, streaming STT activo.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """Cierra los pools: HTTP del cliente OpenAI, calendario, sockets de ElevenLabs, Deepgram y tools."""
+    await close_openai_client()
+    await close_calendar_sync()
+    await close_eleven_pool()
+    await close_dg_pool()
+    TOOL_EXECUTOR.shutdown()
+
+
 @app.get("/")
 async def root():
     return {"message": "Backend activo, streaming STT listo."}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Histogramas y contadores en formato de texto de Prometheus."""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.post("/twilio-voice")
 async def twilio_voice():
     """
@@ -0,0 +1,421 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+"""
+Métricas estilo Prometheus (GET /metrics)
+─────────────────────────────────────────
+• Contadores, histogramas y gauges con etiquetas, sin dependencias.
+• Camino caliente SIN locks: cada hilo escribe en su propio shard
+  (threading.local); el lock solo se toma la primera vez que un hilo usa
+  una serie, para registrar su shard.
+• Al hacer scrape se suman los shards de todos los hilos y se genera el
+  formato de texto 0.0.4 de Prometheus.
+• Gauges con set_function(): el valor se calcula en el scrape (llamadas
+  activas, edad de la caché de slots) en vez de mantenerlo al día.
+• start_loop_lag_probe(): tarea que mide cuánto tarda el event loop en
+  despertar respecto a lo pedido (lag del loop).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from call_context import active_calls
+
+logger = logging.getLogger("metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de 5 ms (marcas del loop) a 10 s (GPT con tools lento)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75,
+                   1.0, 1.5, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Base: registro de series por etiquetas y shards por hilo."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # (valores de etiquetas) → shards de todos los hilos
+        self._shards: Dict[Tuple[str, ...], List[list]] = {}
+        self._children: Dict[Tuple[str, ...], "_Child"] = {}
+
+    def labels(self, *values: str, **kw: str) -> "_Child":
+        if kw:
+            values = tuple(str(kw[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban etiquetas {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, _Child(self, values))
+                self._shards.setdefault(values, [])
+        return child
+
+    @property
+    def family(self) -> str:
+        """Nombre en las líneas # HELP / # TYPE."""
+        return self.name
+
+    def _new_shard(self) -> list:
+        raise NotImplementedError
+
+    def _shard(self, key: Tuple[str, ...]) -> list:
+        """Shard de ESTE hilo para la serie `key` (se crea una sola vez)."""
+        local = self._local.__dict__
+        shard = local.get(key)
+        if shard is None:
+            shard = self._new_shard()
+            with self._lock:
+                self._shards.setdefault(key, []).append(shard)
+            local[key] = shard
+        return shard
+
+    def _snapshot(self) -> List[Tuple[Tuple[str, ...], List[list]]]:
+        with self._lock:
+            return [(key, list(shards)) for key, shards in self._shards.items()]
+
+    def collect(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class _Child:
+    """Serie concreta (métrica + valores de etiquetas)."""
+
+    __slots__ = ("_metric", "_key")
+
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]) -> None:
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._metric._inc(self._key, amount)
+
+    def observe(self, value: float) -> None:
+        self._metric._observe(self._key, value)
+
+    def set(self, value: float) -> None:
+        self._metric._set(self._key, value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @property
+    def family(self) -> str:
+        # Como prometheus_client: HELP/TYPE y las muestras con el mismo nombre *_total
+        return f"{self.name}_total"
+
+    def _new_shard(self) -> list:
+        return [0.0]
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._inc((), amount)
+
+    def _inc(self, key: Tuple[str, ...], amount: float) -> None:
+        self._shard(key)[0] += amount
+
+    def collect(self) -> Iterable[str]:
+        for key, shards in self._snapshot():
+            total = sum(s[0] for s in shards)
+            yield f"{self.family}{_labels_text(self.labelnames, key)} {_fmt(total)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._bounds = tuple(sorted(buckets))
+
+    def _new_shard(self) -> list:
+        # [cuenta por bucket…, +Inf, suma]
+        return [0] * (len(self._bounds) + 1) + [0.0]
+
+    def observe(self, value: float) -> None:
+        self._observe((), value)
+
+    def _observe(self, key: Tuple[str, ...], value: float) -> None:
+        shard = self._shard(key)
+        shard[bisect.bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+    def collect(self) -> Iterable[str]:
+        n = len(self._bounds) + 1
+        for key, shards in self._snapshot():
+            counts = [0] * n
+            total = 0.0
+            for s in shards:
+                for i in range(n):
+                    counts[i] += s[i]
+                total += s[-1]
+            cumulative = 0
+            for bound, c in zip(self._bounds + (math.inf,), counts):
+                cumulative += c
+                le = f'le="{_fmt(bound)}"'
+                yield f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}"
+            labels = _labels_text(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_fmt(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    """Valor puntual. set() guarda el último valor; set_function() lo calcula en el scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self._set((), value)
+
+    def _set(self, key: Tuple[str, ...], value: float) -> None:
+        # Asignación simple a un dict: atómica bajo el GIL, sin shard
+        self._values[key] = value
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        self._fn = fn
+
+    def collect(self) -> Iterable[str]:
+        if self._fn is not None:
+            try:
+                value = float(self._fn())
+            except Exception as e:
+                logger.debug(f"Gauge {self.name}: error calculando valor: {e}")
+                return
+            yield f"{self.name} {_fmt(value)}"
+            return
+        for key, value in list(self._values.items()):
+            yield f"{self.name}{_labels_text(self.labelnames, key)} {_fmt(value)}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.family} {m.documentation}")
+            lines.append(f"# TYPE {m.family} {m.kind}")
+            lines.extend(m.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render_metrics() -> str:
+    """Texto para GET /metrics (agrega todos los shards en este momento)."""
+    return REGISTRY.render()
+
+
+# ══════════════════ MÉTRICAS DEL BOT ══════════════════════════════════
+
+# Respuesta
+STT_TO_GPT_SECONDS = REGISTRY.register(Histogram(
+    "stt_final_to_gpt_seconds",
+    "Tiempo desde el último final de Deepgram hasta lanzar GPT",
+))
+GPT_PASS_SECONDS = REGISTRY.register(Histogram(
+    "gpt_pass_seconds",
+    "Duración de cada pase de GPT (1 = con tools, 2 = tras ejecutar tools)",
+    labelnames=("pass",),
+))
+GPT_HISTORY_TOKENS = REGISTRY.register(Histogram(
+    "gpt_history_tokens",
+    "Tokens estimados del historial enviado a GPT por turno (tras compactar)",
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000),
+))
+GPT_PROMPT_TOKENS = REGISTRY.register(Counter(
+    "gpt_prompt_tokens",
+    "Tokens de prompt enviados a GPT por pase (usage del stream)",
+    labelnames=("pass",),
+))
+GPT_CACHED_PROMPT_TOKENS = REGISTRY.register(Counter(
+    "gpt_cached_prompt_tokens",
+    "Tokens de prompt servidos desde la caché de prefijos de OpenAI "
+    "(ratio = gpt_cached_prompt_tokens / gpt_prompt_tokens)",
+    labelnames=("pass",),
+))
+TOOL_SECONDS = REGISTRY.register(Histogram(
+    "tool_execution_seconds",
+    "Tiempo de ejecución de cada tool en handle_tool_execution",
+    labelnames=("tool",),
+))
+TOOL_TIMEOUTS = REGISTRY.register(Counter(
+    "tool_timeouts",
+    "Tools que no respondieron dentro de su timeout (tool_executor)",
+    labelnames=("tool",),
+))
+RESPONSE_TEMPLATES_USED = REGISTRY.register(Counter(
+    "response_templates_used",
+    "Respuestas tras una tool generadas por plantilla (sin segundo pase de GPT)",
+    labelnames=("tool", "status"),
+))
+SPECULATIONS = REGISTRY.register(Counter(
+    "gpt_speculations",
+    "Llamadas especulativas a GPT sobre parciales estables (hit, miss, aborted)",
+    labelnames=("outcome",),
+))
+SPECULATION_WASTED_TOKENS = REGISTRY.register(Counter(
+    "gpt_speculation_wasted_tokens",
+    "Tokens (prompt + respuesta) gastados en especulaciones descartadas",
+))
+
+# TTS
+TTS_FIRST_CHUNK_SECONDS = REGISTRY.register(Histogram(
+    "tts_first_chunk_seconds",
+    "Latencia de ElevenLabs WS desde el envío del texto hasta el primer chunk de audio",
+))
+TTS_REQUESTS = REGISTRY.register(Counter(
+    "tts_requests",
+    "Peticiones de TTS (saludo o respuesta)",
+    labelnames=("kind",),
+))
+BARGE_INS = REGISTRY.register(Counter(
+    "barge_ins",
+    "Interrupciones del llamante mientras el bot pensaba (gpt) o hablaba (tts)",
+    labelnames=("phase",),
+))
+TTS_HTTP_FALLBACKS = REGISTRY.register(Counter(
+    "tts_http_fallbacks",
+    "Peticiones de TTS que cayeron al fallback HTTP de ElevenLabs",
+    labelnames=("kind", "outcome"),
+))
+TTS_WS_LEASES = REGISTRY.register(Counter(
+    "tts_ws_leases",
+    "Clientes TTS entregados a llamadas (pooled = socket del pool, dedicated = socket propio)",
+    labelnames=("kind",),
+))
+TTS_WS_POOL_OPEN = REGISTRY.register(Gauge(
+    "tts_ws_pool_open_sockets",
+    "Sockets multi-contexto de ElevenLabs abiertos en el pool",
+))
+
+# Motor de slots
+SLOT_CACHE_RELOAD_SECONDS = REGISTRY.register(Histogram(
+    "slot_cache_reload_seconds",
+    "Duración de la recarga de slots libres desde Google Calendar",
+))
+SLOT_CACHE_AGE_SECONDS = REGISTRY.register(Gauge(
+    "slot_cache_age_seconds",
+    "Segundos desde la última recarga de la caché de slots",
+))
+CALENDAR_SYNCS = REGISTRY.register(Counter(
+    "calendar_syncs",
+    "Sincronizaciones de Google Calendar (full = listado completo, incremental = syncToken, error)",
+    labelnames=("kind",),
+))
+CALENDAR_SYNC_DAYS = REGISTRY.register(Counter(
+    "calendar_sync_days_recomputed",
+    "Días de la caché de slots recalculados por la sincronización de calendario",
+))
+
+# STT
+STT_AUDIO_SECONDS = REGISTRY.register(Counter(
+    "stt_audio_seconds",
+    "Audio del llamante enviado a Deepgram o retenido por el VAD local",
+    labelnames=("outcome",),
+))
+DG_CLAIM_SECONDS = REGISTRY.register(Histogram(
+    "deepgram_claim_seconds",
+    "Desde start_streaming() hasta tener la conexión de Deepgram lista (pooled = del pool, cold = abierta en la llamada)",
+    labelnames=("source",),
+))
+DG_POOL_EXHAUSTED = REGISTRY.register(Counter(
+    "deepgram_pool_exhausted",
+    "Llamadas que encontraron el pool de Deepgram vacío y abrieron la conexión en frío",
+))
+DG_POOL_IDLE = REGISTRY.register(Gauge(
+    "deepgram_pool_idle_connections",
+    "Conexiones de Deepgram abiertas y libres en el pool",
+))
+
+# Arranque de llamada
+CALL_BOOTSTRAP_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "call_bootstrap_stage_seconds",
+    "Etapas del arranque de la llamada (tts_client, deepgram, start_event, caches, greeting_audio)",
+    labelnames=("stage",),
+))
+GREETING_FIRST_AUDIO_SECONDS = REGISTRY.register(Histogram(
+    "greeting_first_audio_seconds",
+    "Desde el accept del WebSocket de Twilio hasta el primer frame de audio del saludo",
+))
+
+# Carga
+ACTIVE_CALLS = REGISTRY.register(Gauge(
+    "active_calls",
+    "Llamadas de Twilio en curso en este proceso",
+))
+ACTIVE_CALLS.set_function(lambda: len(active_calls()))
+LOOP_LAG_SECONDS = REGISTRY.register(Histogram(
+    "event_loop_lag_seconds",
+    "Retraso del event loop al despertar respecto a lo programado",
+    buckets=LOOP_LAG_BUCKETS,
+))
+
+
+# ══════════════════ LAG DEL EVENT LOOP ════════════════════════════════
+
+_lag_task: Optional[asyncio.Task] = None
+
+
+async def _loop_lag_probe(interval: float) -> None:
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG_SECONDS.observe(max(0.0, time.perf_counter() - t0 - interval))
+
+
+def start_loop_lag_probe(interval: float = LOOP_LAG_INTERVAL) -> None:
+    """Arranca (una vez) la sonda de lag en el loop en curso."""
+    global _lag_task
+    if _lag_task is None or _lag_task.done():
+        _lag_task = asyncio.get_running_loop().create_task(
+            _loop_lag_probe(interval), name="loop_lag_probe"
+        )
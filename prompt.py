@@ -1,5 +1,7 @@
+from functools import lru_cache
+from typing import Dict, List
+
 from utils import get_cancun_time
-from typing import List, Dict
 
 # ========== CORE: INSTRUCCIONES UNIVERSALES (con CAMBIO DE MODO) ==========
 PROMPT_CORE = """
@@ -605,22 +607,21 @@ PROMPTS_MODO = {
 }
 
 # ========== Generador principal ==============
-def generate_openai_prompt(
-    conversation_history: List[Dict],
-    *,
-    modo: str | None = None,
-    pending_question: str | None = None,
-) -> List[Dict]:
-    current_time_str = get_cancun_time().strftime("%d/%m/%Y %H:%M")
-    prompt_core = PROMPT_CORE.strip()
-    prompt_modo = PROMPTS_MODO.get(modo, "").strip()
+# El system prompt va de lo estable a lo volátil: CORE + modo forman un prefijo
+# idéntico byte a byte entre turnos (OpenAI cachea prefijos de prompt) y la
+# hora y la pregunta pendiente van al final.
+
+# Prefijo estable por modo (se arma una sola vez al importar)
+_PREFIJOS: Dict[str | None, str] = {
+    modo: f"{PROMPT_CORE.strip()}\n\n{texto.strip()}".rstrip()
+    for modo, texto in PROMPTS_MODO.items()
+}
+
 
-    # Aquí pones la hora antes de todo lo demás:
-    system_prompt = (
-        f"🕒 HORA ACTUAL (Cancún): {current_time_str}\n\n"
-        f"{prompt_core}\n\n"
-        f"{prompt_modo}"
-    )
+@lru_cache(maxsize=256)
+def _system_prompt(modo: str | None, pending_question: str | None, current_time_str: str) -> str:
+    """System prompt armado; memoizado por (modo, pregunta pendiente, minuto)."""
+    system_prompt = _PREFIJOS.get(modo, _PREFIJOS[None])
 
     if pending_question:
         system_prompt += (
@@ -629,6 +630,18 @@ def generate_openai_prompt(
             f"«{pending_question}»"
         )
 
+    return system_prompt + f"\n\n🕒 HORA ACTUAL (Cancún): {current_time_str}"
+
+
+def generate_openai_prompt(
+    conversation_history: List[Dict],
+    *,
+    modo: str | None = None,
+    pending_question: str | None = None,
+) -> List[Dict]:
+    current_time_str = get_cancun_time().strftime("%d/%m/%Y %H:%M")
+    system_prompt = _system_prompt(modo, pending_question, current_time_str)
+
     messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
     for turn in conversation_history:
         if isinstance(turn, dict) and "role" in turn and "content" in turn:
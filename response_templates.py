@@ -0,0 +1,149 @@
+# response_templates.py
+# -*- coding: utf-8 -*-
+"""
+Respuestas por plantilla para resultados de tools estructurados
+───────────────────────────────────────────────────────────────
+• Tras una tool, el segundo pase de GPT solo "verbaliza" el resultado. Para
+  los resultados con forma fija (status de process_appointment_request, cita
+  creada / modificada / eliminada) la frase sale de una plantilla con las
+  mismas palabras que pide prompt.py y ese segundo viaje al modelo se omite.
+• Opt-in por tool y por status: cada renderer devuelve None cuando no puede
+  responder de forma determinista (errores, campos faltantes, status nuevo)
+  y entonces se usa el segundo pase normal.
+• Fechas y horas con los helpers existentes: available_pretty (buscarslot)
+  y format_date_nicely / convertir_hora_a_palabras (utils).
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import format_date_nicely
+
+logger = logging.getLogger("response_templates")
+
+Renderer = Callable[[Dict[str, Any], Dict[str, Any]], Optional[str]]   # (args, result) → texto
+
+CIERRE_AYUDA = "¿Le puedo ayudar en algo más?"   # tw_utils resetea el modo al ver esta frase
+
+# Frases fijas de prompt.py (PASO 3) por status
+_FIJAS = {
+    "NO_MORE_LATE": "No hay horarios más tarde ese día. ¿Quiere que busque en otro día?",
+    "NO_MORE_EARLY": "No hay horarios más temprano ese día. ¿Quiere que busque en otro día?",
+    "NO_SLOT_FRANJA": "No encontré horarios libres en esa franja para ese día. "
+                      "¿Quiere que revise en otro horario o en otro día?",
+    "NEED_EXACT_DATE": "¿Podría indicarme la fecha con mayor precisión, por favor?",
+    "OUT_OF_RANGE": "Atendemos de nueve treinta a dos de la tarde. ¿Busco dentro de ese rango?",
+    "NO_SLOT": "No encontré horarios en los próximos cuatro meses, lo siento. ¿Puedo ayudar en algo más?",
+}
+_FRANJAS = {"mañana": "en la mañana", "tarde": "en la tarde", "mediodia": "al mediodía"}
+
+
+def _fecha(iso: Optional[str], hhmm: Optional[str] = None) -> Optional[str]:
+    """'2025-07-08' → 'martes 8 de Julio' (None si no es una fecha válida)."""
+    if not iso:
+        return None
+    try:
+        d = date.fromisoformat(iso[:10])
+    except ValueError:
+        return None
+    texto = format_date_nicely(d, specific_time_hhmm=hhmm)
+    return texto[:1].lower() + texto[1:]
+
+
+def _lista(items: List[str]) -> str:
+    """['a', 'b', 'c'] → 'a, b y c'."""
+    if len(items) <= 1:
+        return "".join(items)
+    return f"{', '.join(items[:-1])} y {items[-1]}"
+
+
+# ──────────────────────────── Renderers ────────────────────────────
+
+def _appointment_request(args: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    status = result.get("status")
+    if status in _FIJAS:
+        return _FIJAS[status]
+
+    horas = result.get("available_pretty") or []
+    if not horas or not all(isinstance(h, str) for h in horas):
+        return None
+    kw = result.get("requested_time_kw")
+    franja = _FRANJAS.get(kw, "")
+    preferida = args.get("explicit_time_preference_param")
+
+    if status == "SLOT_LIST":
+        fecha = _fecha(result.get("date_iso"))
+        if not fecha:
+            return None
+        if preferida and kw and preferida != kw and preferida in _FRANJAS:
+            return (f"Busqué para el {fecha} {_FRANJAS[preferida]} y no encontré. Sin embargo, "
+                    f"tengo disponible {franja}: {_lista(horas)}. ¿Alguna de estas horas está bien para usted?")
+        donde = f" {franja}" if franja else ""
+        return f"Para el {fecha}{donde}, tengo disponible: {_lista(horas)}. ¿Alguna de estas horas está bien para usted?"
+
+    if status == "SLOT_FOUND_LATER":
+        pedida = _fecha(result.get("requested_date_iso"))
+        sugerida = _fecha(result.get("suggested_date_iso"))
+        if not pedida or not sugerida:
+            return None
+        busque = f"Busqué el {pedida}"
+        if preferida and preferida in _FRANJAS:
+            busque += f" {_FRANJAS[preferida]}"
+        donde = f" {franja}" if franja else ""
+        return (f"{busque} y no había espacio. El siguiente disponible es el {sugerida}{donde}: "
+                f"{_lista(horas)}. ¿Alguna de estas horas le parece bien?")
+    return None
+
+
+def _hhmm(iso: Optional[str]) -> Optional[str]:
+    if not iso:
+        return None
+    try:
+        return datetime.fromisoformat(iso).strftime("%H:%M")
+    except ValueError:
+        return None
+
+
+def _create_event(args: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    if result.get("error") or not result.get("id"):
+        return None
+    return f"Su cita quedó agendada. {CIERRE_AYUDA}"
+
+
+def _edit_event(args: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    if result.get("error") or not result.get("id"):
+        return None
+    inicio = result.get("start_time_iso")
+    fecha = _fecha(inicio, _hhmm(inicio))
+    if not fecha:
+        return None
+    return f"¡Listo! Su cita ha sido modificada para el {fecha}. {CIERRE_AYUDA}"
+
+
+def _delete_event(args: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    if result.get("error") or not result.get("deleted_event_id"):
+        return None
+    return f"La cita ha sido eliminada exitosamente de nuestro calendario. {CIERRE_AYUDA}"
+
+
+RENDERERS: Dict[str, Renderer] = {
+    "process_appointment_request": _appointment_request,
+    "create_calendar_event": _create_event,
+    "edit_calendar_event": _edit_event,
+    "delete_calendar_event": _delete_event,
+}
+
+
+def render_tool_response(name: str, args: Dict[str, Any], result: Dict[str, Any]) -> Optional[str]:
+    """Frase final para el resultado de la tool `name`, o None si debe decidir GPT."""
+    renderer = RENDERERS.get(name)
+    if renderer is None or not isinstance(result, dict):
+        return None
+    try:
+        return renderer(args, result)
+    except Exception as e:
+        logger.warning(f"⚠️ Plantilla de {name} falló, se usa el segundo pase: {e}")
+        return None
@@ -0,0 +1,139 @@
+# slot_bitmap.py
+# -*- coding: utf-8 -*-
+"""
+Índice de disponibilidad en bits (días × slots) para process_appointment_request
+────────────────────────────────────────────────────────────────────────────────
+• La caché de slots libres (buscarslot.free_slots_cache, día → ["HH:MM"…])
+  se compacta en un arreglo NumPy de un uint8 por día: el bit j está
+  encendido si SLOT_TIMES[j] está libre. Los domingos van en 0.
+• Las franjas son máscaras precalculadas, con los mismos cortes que
+  _slots_for_franja: mañana ≤ 11:45, mediodía 11:00–13:15, tarde ≥ 12:30.
+  La regla de las 6 h de hoy también es una máscara (mask_from).
+• Índice de salto "siguiente día que sirve": para cada criterio (cualquier
+  slot, o franja preferida con "más tarde / más temprano") un arreglo
+  next[i] = primer día ≥ i que lo cumple. Se calcula con un mínimo
+  acumulado al revés. Buscar en 120 días es una lectura, no un bucle.
+• Solo el día elegido (y hoy, si cae en el rango, por la regla de las 6 h)
+  se evalúa escalar con _pick, que replica el orden original: franja
+  preferida → recorte más tarde/temprano → otras franjas.
+• Se reconstruye entero al cambiar la caché (~90 días: décimas de ms).
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, time as dt_time, timedelta
+from functools import lru_cache
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+FRANJAS = ("mañana", "mediodia", "tarde")           # orden en que se prueban las alternativas
+_CORTES = {
+    "mañana": lambda t: t <= dt_time(11, 45),
+    "mediodia": lambda t: dt_time(11, 0) <= t <= dt_time(13, 15),
+    "tarde": lambda t: t >= dt_time(12, 30),
+}
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+Pick = Tuple[List[str], Optional[str]]          # (slots del día, franja usada)
+
+
+@lru_cache(maxsize=8)
+def _layout(slot_starts: Tuple[str, ...]):
+    """Horas, máscaras de franja y slots de cada uno de los 256 valores de un día."""
+    times = [datetime.strptime(s, "%H:%M").time() for s in slot_starts]
+    masks = {franja: sum(1 << j for j, t in enumerate(times) if corte(t)) for franja, corte in _CORTES.items()}
+    slots_of = [[s for j, s in enumerate(slot_starts) if m >> j & 1] for m in range(256)]
+    return times, masks, slots_of
+
+
+class SlotBitmap:
+    """Disponibilidad de días consecutivos desde day0, un uint8 por día."""
+
+    def __init__(self, day0: date, bits: np.ndarray, slot_starts: Sequence[str]) -> None:
+        if len(slot_starts) > 8:
+            raise ValueError("SlotBitmap admite hasta 8 slots por día")
+        self.day0 = day0
+        self.bits = bits
+        self.slot_starts = tuple(slot_starts)
+        self._times, self.masks, self._slots_of = _layout(self.slot_starts)
+        self._next: Dict[Tuple[Optional[str], int], np.ndarray] = {(None, 0): self._skip_index(bits != 0)}
+        for franja, m in self.masks.items():
+            en_franja = _POPCOUNT[bits & m]
+            for need in (2, 3):
+                # Con recorte más tarde/temprano el día sirve si la franja tiene `need` slots
+                # o si está vacía y hay otra franja con algo (las alternativas no se recortan)
+                self._next[(franja, need)] = self._skip_index((en_franja >= need) | ((en_franja == 0) & (bits != 0)))
+
+    @classmethod
+    def from_cache(cls, cache: Mapping[str, Sequence[str]], slot_starts: Sequence[str]) -> "SlotBitmap":
+        """Arma el índice a partir de día ('YYYY-MM-DD') → slots libres."""
+        pos = {s: j for j, s in enumerate(slot_starts)}
+        dias = {date.fromisoformat(k): v for k, v in cache.items()}
+        if not dias:
+            return cls(date.min, np.zeros(0, dtype=np.uint8), slot_starts)
+        day0 = min(dias)
+        bits = np.zeros((max(dias) - day0).days + 1, dtype=np.uint8)
+        for d, slots in dias.items():
+            if d.weekday() != 6:            # Domingo sin citas
+                bits[(d - day0).days] = sum(1 << pos[s] for s in set(slots) if s in pos)
+        return cls(day0, bits, slot_starts)
+
+    @staticmethod
+    def _skip_index(ok: np.ndarray) -> np.ndarray:
+        """next[i] = primer j ≥ i con ok[j] (len(ok) si no hay); con centinela al final."""
+        n = len(ok)
+        idx = np.where(ok, np.arange(n), n)
+        return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+    # ─────────────────────────── Consultas ───────────────────────────
+
+    def mask_from(self, limit: dt_time) -> int:
+        """Slots que empiezan a `limit` o después (regla de anticipación de hoy)."""
+        return sum(1 << j for j, t in enumerate(self._times) if t >= limit)
+
+    def _pick(self, b: int, pref: Optional[str], more_late: bool, more_early: bool) -> Optional[Pick]:
+        """Slots de un día (bits `b`) según la franja preferida y el recorte pedido."""
+        if not pref:
+            return (list(self._slots_of[b]), None) if b else None
+        sel = self._slots_of[b & self.masks[pref]]
+        if sel:
+            if more_late:
+                sel = sel[1:5]          # siguientes 4
+            if more_early:
+                sel = sel[-5:-1]        # anteriores 4
+            return (list(sel), pref) if sel else None
+        for alt in FRANJAS:
+            if alt != pref and b & self.masks[alt]:
+                return list(self._slots_of[b & self.masks[alt]]), alt
+        return None
+
+    def search(self, start: date, horizon_days: int, *, today: date, today_mask: int,
+               pref: Optional[str] = None, more_late: bool = False,
+               more_early: bool = False) -> Optional[Tuple[date, List[str], Optional[str]]]:
+        """Primer día en [start, start + horizon_days) con horarios → (día, slots, franja)."""
+        n = len(self.bits)
+        lo = max((start - self.day0).days, 0)
+        hi = min((start - self.day0).days + horizon_days, n)
+        if lo >= hi:
+            return None
+        need = (more_late + more_early + 1) if pref and (more_late or more_early) else 0
+        nxt = self._next[(pref if need else None, need)]
+
+        t = (today - self.day0).days
+        tramos = [(lo, hi)]
+        if lo <= t < hi:
+            tramos = [(lo, t), (t, t + 1), (t + 1, hi)]
+        for a, b in tramos:
+            if a == t and a < b:        # hoy: la regla de las 6 h cambia sus bits
+                pick = self._pick(int(self.bits[t]) & today_mask, pref, more_late, more_early)
+                if pick is not None:
+                    return (self.day0 + timedelta(days=t), *pick)
+                continue
+            pos = int(nxt[a]) if a < b else b
+            while pos < b:
+                pick = self._pick(int(self.bits[pos]), pref, more_late, more_early)
+                if pick is not None:
+                    return (self.day0 + timedelta(days=pos), *pick)
+                pos = int(nxt[pos + 1])   # slots fuera de toda franja: seguir saltando
+        return None
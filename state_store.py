@@ -1,6 +1,41 @@
 # state_store.py
-# Memoriza datos durante UNA llamada (se reinicia cuando Twilio abre un WS nuevo)
-session_state = {
-    "events_found": [],       # lista completa de citas encontradas
-    "current_event_id": None  # la cita que el usuario confirmó
-}
+# Memoriza datos durante UNA llamada (cada WS de Twilio tiene su propio estado).
+# `session_state` se usa como un dict normal, pero resuelve al estado de la
+# llamada en curso (ver call_context.py). Fuera de una llamada (endpoints HTTP
+# de n8n) cae a un estado global de respaldo.
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator
+
+from call_context import current_call, new_session_state
+
+_fallback_state: Dict[str, Any] = new_session_state()
+
+
+class _SessionStateProxy(MutableMapping):
+    """Dict que delega en el estado de la llamada actual."""
+
+    @staticmethod
+    def _target() -> Dict[str, Any]:
+        ctx = current_call()
+        return ctx.state if ctx is not None else _fallback_state
+
+    def __getitem__(self, key: str) -> Any:
+        return self._target()[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._target()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._target()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._target())
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def __repr__(self) -> str:
+        return f"session_state({self._target()!r})"
+
+
+session_state = _SessionStateProxy()
@@ -0,0 +1,102 @@
+# text_segmenter.py
+# -*- coding: utf-8 -*-
+"""
+Segmentador de texto para TTS en streaming
+──────────────────────────────────────────
+• Recibe los deltas de GPT tal como llegan y entrega frases o cláusulas
+  completas para mandarlas a ElevenLabs (add_text_chunk) sin esperar a que
+  termine la respuesta.
+• Corta en fin de frase (. ? ! … o salto de línea) seguido de espacio y, si
+  el fragmento ya es suficientemente largo, en cláusula (, ; :). La primera
+  cláusula admite un corte más corto para que el audio arranque antes.
+• No corta números ("10.30", "1,500": sin espacio detrás) ni abreviaturas
+  ("Dr.", "Sra.", "a. m.").
+• Un ClauseSegmenter por respuesta: feed() por cada delta, flush() al final.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+FIRST_MIN_CHARS = 15         # primera cláusula: arrancar el audio cuanto antes
+CLAUSE_MIN_CHARS = 40        # resto: cortar en coma solo si el trozo ya es largo
+MAX_CHARS = 200              # sin puntuación: cortar en el último espacio
+
+SENTENCE_END = frozenset(".?!…")
+CLAUSE_END = frozenset(",;:")
+ABREVIATURAS = frozenset({
+    "dr", "dra", "sr", "sra", "srta", "lic", "ing", "mtro", "mtra", "av",
+    "núm", "num", "tel", "hrs", "aprox", "col", "cd", "pág", "ej",
+})
+_LAST_WORD_RE = re.compile(r"(\w+)$")
+
+
+class ClauseSegmenter:
+    """Acumula deltas de texto y devuelve los segmentos que ya se pueden sintetizar."""
+
+    def __init__(
+        self,
+        first_min_chars: int = FIRST_MIN_CHARS,
+        min_chars: int = CLAUSE_MIN_CHARS,
+        max_chars: int = MAX_CHARS,
+    ) -> None:
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.segments = 0
+        self._buf = ""
+        self._pos = 0                # hasta dónde ya se buscó un corte
+
+    def feed(self, delta: str) -> List[str]:
+        """Agrega un delta; devuelve los segmentos completos (normalmente 0 o 1)."""
+        self._buf += delta
+        out: List[str] = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return out
+            segment, self._buf = self._buf[:cut].strip(), self._buf[cut:]
+            self._pos = 0
+            if segment:
+                self.segments += 1
+                out.append(segment)
+
+    def flush(self) -> Optional[str]:
+        """Fin de la respuesta: devuelve lo que quede (o None)."""
+        segment, self._buf, self._pos = self._buf.strip(), "", 0
+        if not segment:
+            return None
+        self.segments += 1
+        return segment
+
+    def _find_cut(self) -> Optional[int]:
+        buf = self._buf
+        min_clause = self.first_min_chars if not self.segments else self.min_chars
+        # El último carácter se deja para la próxima vuelta: falta ver qué le sigue
+        for i in range(self._pos, len(buf) - 1):
+            c = buf[i]
+            if c == "\n":
+                return i + 1
+            if not buf[i + 1].isspace():
+                continue
+            if c in SENTENCE_END and not self._abreviatura(i):
+                return i + 1
+            if c in CLAUSE_END and len(buf[:i + 1].strip()) >= min_clause:
+                return i + 1
+        self._pos = max(0, len(buf) - 1)
+        if len(buf) > self.max_chars:
+            space = buf.rfind(" ", 0, self.max_chars)
+            if space > 0:
+                return space + 1
+        return None
+
+    def _abreviatura(self, i: int) -> bool:
+        """¿El punto en buf[i] cierra una abreviatura y no una frase?"""
+        if self._buf[i] != ".":
+            return False
+        m = _LAST_WORD_RE.search(self._buf, 0, i)
+        if not m:
+            return False
+        word = m.group(1).lower()
+        return word in ABREVIATURAS or (len(word) == 1 and word.isalpha())
@@ -0,0 +1,176 @@
+# timer_scheduler.py
+# -*- coding: utf-8 -*-
+"""
+Temporizadores compartidos por todas las llamadas (un solo heap por loop)
+──────────────────────────────────────────────────────────────────────────
+• En vez de una tarea asyncio por temporizador (o un while+sleep que
+  despierta cada 50 ms), todos los plazos viven en UN heap y el loop solo
+  tiene armado UN call_at: el del plazo más cercano.
+• call_later() devuelve un TimerHandle cancelable y reprogramable.
+  reschedule() reutiliza el mismo handle (p.ej. el timer de pausa que se
+  reinicia con cada evento de STT) sin crear tareas nuevas.
+• Los handles cancelados/reprogramados se borran de forma perezosa: la
+  entrada vieja queda en el heap y se descarta al salir.
+• El callback puede ser una función normal o una corrutina; la corrutina
+  solo se convierte en tarea cuando el plazo se cumple. Ambas corren en el
+  contexto (ContextVar) capturado al programar → ven su propia llamada.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import weakref
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("timer_scheduler")
+
+
+class TimerHandle:
+    """Plazo programado en el TimerScheduler."""
+
+    __slots__ = ("_scheduler", "_callback", "_args", "_context", "_gen", "when", "name")
+
+    def __init__(self, scheduler: "TimerScheduler", callback: Callable[..., Any], args: Tuple[Any, ...], name: Optional[str]) -> None:
+        self._scheduler = scheduler
+        self._callback = callback
+        self._args = args
+        self._context = contextvars.copy_context()
+        self._gen = 0                 # generación vigente en el heap (0 = inactivo)
+        self.when: Optional[float] = None
+        self.name = name
+
+    @property
+    def active(self) -> bool:
+        return self._gen != 0
+
+    def cancel(self) -> None:
+        """Cancela el plazo (no hace nada si ya se disparó)."""
+        if self._gen:
+            self._gen = 0
+            self.when = None
+            self._scheduler._note_stale()
+
+    def reschedule(self, delay: float) -> None:
+        """Mueve el plazo a `delay` segundos desde ahora (aunque ya se haya disparado)."""
+        if self._gen:
+            self._scheduler._note_stale()
+        self._scheduler._push(self, delay)
+
+    def __repr__(self) -> str:
+        state = f"when={self.when:.3f}" if self._gen else "inactive"
+        return f"<TimerHandle {self.name or self._callback.__qualname__} {state}>"
+
+
+class TimerScheduler:
+    """Heap de plazos + un único asyncio.TimerHandle armado al más cercano."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._seq = itertools.count(1)
+        self._armed: Optional[asyncio.TimerHandle] = None
+        self._armed_when: Optional[float] = None
+        self._stale = 0
+        self._running: Set[asyncio.Task] = set()
+        self.fired = 0
+        self.wakeups = 0
+
+    # ─────────────────────────────── API pública ───────────────────────────────
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args: Any, name: Optional[str] = None) -> TimerHandle:
+        handle = TimerHandle(self, callback, args, name)
+        self._push(handle, delay)
+        return handle
+
+    def __len__(self) -> int:
+        return len(self._heap) - self._stale
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self),
+            "heap_size": len(self._heap),
+            "running_tasks": len(self._running),
+            "fired": self.fired,
+            "wakeups": self.wakeups,
+        }
+
+    # ─────────────────────────────── Internos ──────────────────────────────────
+
+    def _push(self, handle: TimerHandle, delay: float) -> None:
+        when = self._loop.time() + max(0.0, delay)
+        gen = next(self._seq)
+        handle._gen = gen
+        handle.when = when
+        heapq.heappush(self._heap, (when, gen, handle))
+        if self._armed_when is None or when < self._armed_when:
+            self._arm(when)
+
+    def _note_stale(self) -> None:
+        self._stale += 1
+        # Compactar si la basura domina el heap
+        if self._stale > 64 and self._stale > len(self._heap) // 2:
+            self._heap = [e for e in self._heap if e[2]._gen == e[1]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _arm(self, when: float) -> None:
+        if self._armed is not None:
+            self._armed.cancel()
+        self._armed = self._loop.call_at(when, self._fire)
+        self._armed_when = when
+
+    def _fire(self) -> None:
+        self._armed = None
+        self._armed_when = None
+        self.wakeups += 1
+        now = self._loop.time()
+        heap = self._heap
+
+        while heap and heap[0][0] <= now:
+            _when, gen, handle = heapq.heappop(heap)
+            if handle._gen != gen:
+                self._stale = max(0, self._stale - 1)
+                continue
+            handle._gen = 0
+            handle.when = None
+            self.fired += 1
+            self._run(handle)
+
+        # Descartar basura en la cima para no despertar por plazos muertos
+        while heap and heap[0][2]._gen != heap[0][1]:
+            heapq.heappop(heap)
+            self._stale = max(0, self._stale - 1)
+        if heap:
+            self._arm(heap[0][0])
+
+    def _run(self, handle: TimerHandle) -> None:
+        try:
+            result = handle._context.run(handle._callback, *handle._args)
+        except Exception:
+            logger.exception(f"❌ Error en temporizador {handle!r}")
+            return
+        if asyncio.iscoroutine(result):
+            task = self._loop.create_task(result, name=handle.name, context=handle._context)
+            self._running.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Error en temporizador {task.get_name()}: {task.exception()!r}")
+
+
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, TimerScheduler]" = weakref.WeakKeyDictionary()
+
+
+def get_timers() -> TimerScheduler:
+    """Scheduler compartido del loop en curso (se crea al primer uso)."""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _schedulers[loop] = TimerScheduler(loop)
+    return scheduler
@@ -0,0 +1,102 @@
+# tool_executor.py
+# -*- coding: utf-8 -*-
+"""
+Ejecución de tools de GPT sin bloquear el event loop
+────────────────────────────────────────────────────
+• Las tools bloqueantes (Google Calendar, Sheets, OpenWeatherMap) corren en
+  un ThreadPoolExecutor ACOTADO y compartido por todas las llamadas; las
+  que solo leen memoria (set_mode, detect_intent…) se ejecutan en línea.
+• Las tool calls de una misma respuesta de GPT corren en paralelo; las que
+  escriben en el calendario se serializan entre sí (en su orden original)
+  para no pisarse.
+• Cada tool tiene su timeout. Al vencer se devuelve un error estructurado
+  ({"error", "error_type": "timeout", "tool", "timeout_s", "retry_safe"}) que
+  GPT ve como resultado de la tool; el hilo no se puede matar y termina por
+  su cuenta (una escritura puede completarse igualmente → retry_safe=False).
+• El contexto de la llamada (call_context) viaja al hilo.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from call_context import run_in_call_context
+from metrics import TOOL_TIMEOUTS
+
+logger = logging.getLogger("tool_executor")
+
+ToolCall = Tuple[str, Callable[..., Dict[str, Any]], Sequence[Any]]   # (nombre, fn, args)
+
+
+class ToolExecutor:
+    """Pool acotado + timeouts por tool para handle_tool_execution."""
+
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        timeouts: Mapping[str, float],
+        default_timeout: float,
+        inline: Iterable[str] = (),
+        serial: Iterable[str] = (),
+    ) -> None:
+        self.timeouts = dict(timeouts)
+        self.default_timeout = default_timeout
+        self.inline = frozenset(inline)      # sin E/S: no vale la pena saltar a un hilo
+        self.serial = frozenset(serial)      # escrituras: una a la vez, en orden
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def timeout_for(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    async def run(self, name: str, fn: Callable[..., Dict[str, Any]], *args: Any) -> Dict[str, Any]:
+        """Ejecuta una tool; nunca lanza salvo cancelación (el error va en el dict)."""
+        if name in self.inline:
+            return fn(*args)
+        timeout = self.timeout_for(name)
+        loop = asyncio.get_running_loop()
+        t0 = perf_counter()
+        future = loop.run_in_executor(self._pool, run_in_call_context(fn, *args))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            TOOL_TIMEOUTS.labels(name).inc()
+            logger.error(f"⏰ Tool {name} sin respuesta tras {perf_counter() - t0:.1f}s (timeout {timeout:.1f}s)")
+            return {
+                "error": f"La herramienta {name} no respondió a tiempo.",
+                "error_type": "timeout",
+                "tool": name,
+                "timeout_s": timeout,
+                # Una escritura que venció pudo completarse: no repetirla sin verificar
+                "retry_safe": name not in self.serial,
+            }
+
+    async def run_all(self, calls: Sequence[ToolCall]) -> List[Dict[str, Any]]:
+        """Ejecuta las tool calls de una respuesta; resultados en el mismo orden."""
+        if len(calls) == 1:
+            name, fn, args = calls[0]
+            return [await self.run(name, fn, *args)]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(calls)
+
+        async def _one(i: int) -> None:
+            name, fn, args = calls[i]
+            results[i] = await self.run(name, fn, *args)
+
+        async def _serial(indices: List[int]) -> None:
+            for i in indices:
+                await _one(i)
+
+        serial = [i for i, c in enumerate(calls) if c[0] in self.serial]
+        jobs = [_one(i) for i, c in enumerate(calls) if c[0] not in self.serial]
+        if serial:
+            jobs.append(_serial(serial))
+        await asyncio.gather(*jobs)
+        return results  # type: ignore[return-value]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
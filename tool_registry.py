@@ -0,0 +1,517 @@
+# tool_registry.py
+# -*- coding: utf-8 -*-
+"""
+Registro único de tools de GPT (voz y texto)
+────────────────────────────────────────────
+• Se arma UNA vez al importar: nombre → función, y por modo el esquema que
+  ve GPT junto con su validador compilado. Los modos de voz son None,
+  "crear", "editar" y "eliminar"; el agente de texto usa "texto".
+• tools_for(modo) devuelve la lista ya armada del modo (mismo objeto y mismo
+  orden en cada turno: nada de concatenar listas por llamada) y
+  tools_json(modo) la misma lista ya serializada (tamaño en logs).
+• validate() revisa los argumentos contra el esquema del modo (requeridos,
+  tipos, enums y chequeos propios de la tool) ANTES de gastar la ida a
+  Google; call() despacha con un lookup en dict.
+• Las funciones devuelven siempre un dict (lo que ve GPT como resultado).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import buscarslot
+from calendar_sync import request_sync
+from consultarinfo import get_consultorio_data_from_cache
+from crearcita import create_calendar_event
+from editarcita import edit_calendar_event
+from eliminarcita import delete_calendar_event
+from selectevent import select_calendar_event_by_index
+from utils import search_calendar_event_by_phone
+from weather_utils import get_cancun_weather
+
+logger = logging.getLogger("tool_registry")
+
+Validator = Callable[[Dict[str, Any]], Optional[str]]   # args → mensaje de error o None
+Check = Callable[[Dict[str, Any]], Optional[str]]
+
+TEXT_MODE = "texto"
+
+_JSON_TYPES: Dict[str, tuple] = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+}
+
+
+def compile_validator(schema: Dict[str, Any], check: Optional[Check] = None) -> Validator:
+    """Validador para el bloque "parameters" de una tool (subconjunto de JSON Schema)."""
+    params = schema.get("function", {}).get("parameters") or {}
+    required = tuple(params.get("required", ()))
+    rules = []
+    for name, prop in (params.get("properties") or {}).items():
+        types = prop.get("type")
+        types = (types,) if isinstance(types, str) else tuple(types or ())
+        py_types = tuple(t for name_t in types for t in _JSON_TYPES.get(name_t, ()))
+        enum = frozenset(prop["enum"]) if "enum" in prop else None
+        rules.append((name, py_types, "boolean" in types, enum))
+
+    def validate(args: Dict[str, Any]) -> Optional[str]:
+        missing = [p for p in required if args.get(p) is None]
+        if missing:
+            return f"Missing required parameters: {', '.join(missing)}"
+        for name, py_types, bool_ok, enum in rules:
+            value = args.get(name)
+            if value is None:
+                continue
+            # bool es subclase de int: solo vale donde el esquema admite boolean
+            if py_types and (not isinstance(value, py_types) or (isinstance(value, bool) and not bool_ok)):
+                return f"Parámetro {name} con tipo inválido: {type(value).__name__}"
+            if enum is not None and value not in enum:
+                return f"Parámetro {name} fuera de los valores permitidos: {sorted(enum)}"
+        return check(args) if check else None
+
+    return validate
+
+
+@dataclass
+class Tool:
+    name: str
+    fn: Callable[..., Dict[str, Any]]
+    check: Optional[Check] = None
+    validators: Dict[Optional[str], Validator] = field(default_factory=dict)   # modo → validador
+
+
+class ToolRegistry:
+    """Tools por nombre, con esquema y validador por modo."""
+
+    def __init__(self) -> None:
+        self._tools: Dict[str, Tool] = {}
+        self._by_mode: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self._json: Dict[Optional[str], str] = {}
+        self._compiled: Dict[int, Validator] = {}
+
+    def function(self, name: str, fn: Callable[..., Dict[str, Any]], *, check: Optional[Check] = None) -> None:
+        """Registra la función que ejecuta la tool `name`."""
+        self._tools[name] = Tool(name, fn, check)
+
+    def expose(self, mode: Optional[str], schemas: Sequence[Dict[str, Any]]) -> None:
+        """Publica en `mode` los esquemas dados (en ese orden); compila sus validadores."""
+        for schema in schemas:
+            tool = self._tools[schema["function"]["name"]]
+            # El mismo esquema en varios modos (TOOLS_BASE) se compila una sola vez
+            key = id(schema)
+            if key not in self._compiled:
+                self._compiled[key] = compile_validator(schema, tool.check)
+            tool.validators[mode] = self._compiled[key]
+        self._by_mode[mode] = list(schemas)
+        self._json[mode] = json.dumps(self._by_mode[mode], ensure_ascii=False)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def tools_for(self, mode: Optional[str]) -> List[Dict[str, Any]]:
+        return self._by_mode.get(mode) or self._by_mode[None]
+
+    def tools_json(self, mode: Optional[str]) -> str:
+        return self._json.get(mode) or self._json[None]
+
+    def validate(self, name: str, args: Dict[str, Any], mode: Optional[str] = None) -> Optional[str]:
+        """Mensaje de error si los argumentos no cumplen el esquema del modo; None si son válidos."""
+        tool = self._tools.get(name)
+        if tool is None:
+            return f"Función desconocida: {name}"
+        # Tool fuera de su modo (GPT con el modo recién cambiado): cualquier esquema suyo
+        validator = tool.validators.get(mode) or next(iter(tool.validators.values()), None)
+        return validator(args) if validator else None
+
+    def call(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return self._tools[name].fn(**args)
+
+
+# ══════════════════ ESQUEMAS: AGENTE DE VOZ ══════════════════════════
+TOOLS_BASE = [
+    {
+        "type": "function",
+        "function": {
+            "name": "read_sheet_data",
+            "description": "Obtener información general del consultorio como dirección, horarios de atención general, servicios principales, o políticas de cancelación. No usar para verificar disponibilidad de citas."
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_cancun_weather",
+            "description": "Obtener el estado del tiempo actual en Cancún, como temperatura, descripción (soleado, nublado, lluvia), y sensación térmica. Útil si el usuario pregunta específicamente por el clima."
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "detect_intent",
+            "description": "Detecta la intención del usuario cuando no está claro si quiere agendar en un horario 'más tarde' (more_late) o 'más temprano' (more_early) de la hora que le propusimos.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "intention": {
+                        "type": "string",
+                        "enum": ["more_late", "more_early"],
+                        "description": "La intención detectada del usuario."
+                    }
+                },
+                "required": ["intention"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "set_mode",
+            "description": (
+                "Cambia el modo de operación del asistente. "
+                "Úsala cuando detectes una intención clara del usuario de agendar, editar o eliminar una cita. "
+                "Solo cambia el modo si la intención es evidente. Si hay duda, primero pregunta al usuario."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "mode": {
+                        "type": "string",
+                        "enum": ["crear", "editar", "eliminar", "None"],
+                        "description": (
+                            "'crear' para agendar cita nueva, "
+                            "'editar' para modificar, "
+                            "'eliminar' para cancelar cita, "
+                            "'None' para modo informativo/general."
+                        ),
+                    }
+                },
+                "required": ["mode"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "end_call",
+            "description": "Cierra la llamada de manera definitiva. Úsala cuando ya se haya despedido al paciente.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "reason": {
+                        "type": "string",
+                        "description": "Motivo del cierre. Ej: 'user_request', 'task_completed', 'assistant_farewell'."
+                    }
+                },
+                "required": ["reason"]
+            }
+        }
+    },
+]
+TOOLS_CREAR = TOOLS_BASE + [
+    {
+        "type": "function",
+        "function": {
+            "name": "process_appointment_request",
+            "description": (
+                "Procesa la solicitud de agendamiento o consulta de disponibilidad de citas. "
+                "Interpreta la petición de fecha/hora del usuario (ej. 'próxima semana', 'el 15 a las 10', etc.)"
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "user_query_for_date_time": {"type": "string"},
+                    "day_param": {"type": "integer"},
+                    "month_param": {"type": ["string", "integer"]},
+                    "year_param": {"type": "integer"},
+                    "fixed_weekday_param": {"type": "string"},
+                    "explicit_time_preference_param": {"type": "string", "enum": ["mañana", "tarde", "mediodia"]},
+                    "is_urgent_param": {"type": "boolean"},
+                    "more_late_param": {"type": "boolean"},
+                    "more_early_param": {"type": "boolean"}
+                },
+                "required": ["user_query_for_date_time"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "create_calendar_event",
+            "description": "Crear una nueva cita médica en el calendario después de que el usuario haya confirmado todo.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "phone": {"type": "string"},
+                    "reason": {"type": "string"},
+                    "start_time": {"type": "string", "format": "date-time"},
+                    "end_time": {"type": "string", "format": "date-time"}
+                },
+                "required": ["name", "phone", "start_time", "end_time"]
+            }
+        }
+    }
+]
+TOOLS_EDITAR = TOOLS_BASE + [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_calendar_event_by_phone",
+            "description": "Buscar citas existentes de un paciente por su número de teléfono."
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "edit_calendar_event",
+            "description": "Modificar una cita existente en el calendario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_id": {"type": "string"},
+                    "new_start_time_iso": {"type": "string", "format": "date-time"},
+                    "new_end_time_iso": {"type": "string", "format": "date-time"},
+                    "new_name": {"type": "string"},
+                    "new_reason": {"type": "string"},
+                    "new_phone_for_description": {"type": "string"}
+                },
+                "required": ["event_id", "new_start_time_iso", "new_end_time_iso"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "process_appointment_request",
+            "description": "Verifica nuevos slots para citas editadas."
+        }
+    }
+]
+TOOLS_ELIMINAR = TOOLS_BASE + [
+    {
+        "type": "function",
+        "function": {
+            "name": "search_calendar_event_by_phone",
+            "description": "Buscar citas existentes de un paciente por su número de teléfono."
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_calendar_event",
+            "description": "Eliminar/Cancelar una cita existente del calendario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_id": {"type": "string"},
+                    "original_start_time_iso": {"type": "string", "format": "date-time"}
+                },
+                "required": ["event_id", "original_start_time_iso"]
+            }
+        }
+    }
+]
+
+# ══════════════════ ESQUEMAS: AGENTE DE TEXTO ════════════════════════
+TOOLS_TEXTO = [
+    {
+        "type": "function",
+        "function": {
+            "name": "read_sheet_data",
+            "description": "Obtener información general del consultorio como dirección, horarios de atención general, servicios principales, o políticas de cancelación. No usar para verificar disponibilidad de citas."
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_cancun_weather",
+            "description": "Obtener el estado del tiempo actual en Cancún, como temperatura, descripción (soleado, nublado, lluvia), y sensación térmica. Útil si el usuario pregunta específicamente por el clima."
+            # No necesita parámetros ya que la ciudad está fija en la función.
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "process_appointment_request",
+            "description": (
+                "Procesa la solicitud de agendamiento o consulta de disponibilidad de citas. "
+                "Interpreta la petición de fecha/hora del usuario (ej. 'próxima semana', 'el 15 a las 10', 'esta semana en la tarde', 'lo más pronto posible') "
+                "y busca un slot disponible en el calendario que cumpla con los criterios. "
+                "Devuelve un slot encontrado, un mensaje si no hay disponibilidad, o pide aclaración si la fecha es ambigua o conflictiva."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "user_query_for_date_time": {
+                        "type": "string",
+                        "description": "La frase textual completa del usuario referente a la fecha y/o hora deseada. Ej: 'quiero una cita para el próximo martes por la tarde', '¿tienes algo para el 15 de mayo a las 10 am?', 'lo más pronto posible'."
+                    },
+                    "day_param": {"type": "integer", "description": "Día numérico del mes si el usuario lo menciona explícitamente (ej. 15 para 'el 15 de mayo'). Opcional."},
+                    "month_param": {"type": ["string", "integer"], "description": "Mes, como nombre (ej. 'mayo', 'enero') o número (ej. 5, 1) si el usuario lo menciona. Opcional."},
+                    "year_param": {"type": "integer", "description": "Año si el usuario lo especifica (ej. 2025). Opcional, si no se da, se asume el actual o el siguiente si la fecha es pasada."},
+                    "fixed_weekday_param": {"type": "string", "description": "Día de la semana solicitado por el usuario (ej. 'lunes', 'martes'). Opcional."},
+                    "explicit_time_preference_param": {"type": "string", "description": "Preferencia explícita de franja horaria como 'mañana', 'tarde' o 'mediodia', si el usuario la indica claramente. Opcional.", "enum": ["mañana", "tarde", "mediodia"]},
+                    "is_urgent_param": {"type": "boolean", "description": "Poner a True si el usuario indica urgencia o quiere la cita 'lo más pronto posible', 'cuanto antes', etc. Esto priorizará la búsqueda inmediata. Opcional, default False."},
+                    "more_late_param": {"type": "boolean", "description": "Cuando el usuario pide ‘más tarde’ después de ofrecerle un horario. Opcional."},
+                    "more_early_param": {"type": "boolean", "description": "Cuando el usuario pide ‘más temprano’ después de ofrecerle un horario. Opcional."}
+                },
+                "required": ["user_query_for_date_time"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "create_calendar_event",
+            "description": "Crear una nueva cita médica en el calendario DESPUÉS de que el usuario haya confirmado un slot específico, nombre, teléfono y motivo.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Nombre completo del paciente."},
+                    "phone": {"type": "string", "description": "Número de teléfono del paciente (10 dígitos)."},
+                    "reason": {"type": "string", "description": "Motivo de la consulta."},
+                    "start_time": {"type": "string", "format": "date-time", "description": "Hora de inicio de la cita en formato ISO8601 con offset (ej. markup-MM-DDTHH:MM:SS-05:00). Obtenido de 'process_appointment_request'."},
+                    "end_time": {"type": "string", "format": "date-time", "description": "Hora de fin de la cita en formato ISO8601 con offset. Obtenido de 'process_appointment_request'."}
+                },
+                "required": ["name", "phone", "start_time", "end_time"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_calendar_event_by_phone",
+            "description": "Buscar citas existentes de un paciente por su número de teléfono para poder modificarlas o cancelarlas.",
+            "parameters": {
+                "type": "object",
+                "properties": {"phone": {"type": "string", "description": "Número de teléfono del paciente (10 dígitos)."}},
+                "required": ["phone"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "select_calendar_event_by_index",
+            "description": (
+                "Marca cuál de las citas encontradas (events_found) "
+                "es la que el paciente quiere modificar o cancelar. "
+                "Úsalo después de enumerar las citas y recibir la confirmación "
+                "del paciente. selected_index = 0 para la primera cita listada."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "selected_index": {
+                        "type": "integer",
+                        "description": "Índice de la cita (0, 1, 2…)."
+                    }
+                },
+                "required": ["selected_index"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "edit_calendar_event",
+            "description": "Modificar una cita existente en el calendario. Requiere el ID del evento y los nuevos detalles de fecha/hora. Opcionalmente puede actualizar nombre, motivo o teléfono en la descripción.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_id": {"type": "string", "description": "El ID del evento de calendario a modificar. Obtenido de 'search_calendar_event_by_phone'."},
+                    "new_start_time_iso": {"type": "string", "format": "date-time", "description": "Nueva hora de inicio para la cita en formato ISO8601 con offset (ej. 2025-MM-DDTHH:MM:SS-05:00). Obtenida de 'process_appointment_request'."},
+                    "new_end_time_iso": {"type": "string", "format": "date-time", "description": "Nueva hora de fin para la cita en formato ISO8601 con offset. Obtenida de 'process_appointment_request'."},
+                    "new_name": {"type": "string", "description": "Opcional. Nuevo nombre del paciente si el usuario desea cambiarlo."},
+                    "new_reason": {"type": "string", "description": "Opcional. Nuevo motivo de la consulta si el usuario desea cambiarlo."},
+                    "new_phone_for_description": {"type": "string", "description": "Opcional. Nuevo teléfono para la descripción de la cita si el usuario desea cambiarlo."}
+                },
+                "required": ["event_id", "new_start_time_iso", "new_end_time_iso"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "delete_calendar_event",
+            "description": "Eliminar/Cancelar una cita existente del calendario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "event_id": {"type": "string", "description": "El ID del evento de calendario a eliminar. Obtenido de 'search_calendar_event_by_phone'."},
+                    "original_start_time_iso": {"type": "string", "format": "date-time", "description": "Hora de inicio original de la cita a eliminar en formato ISO8601 con offset (ej. 2025-MM-DDTHH:MM:SS-05:00), para confirmación."}
+                },
+                "required": ["event_id", "original_start_time_iso"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "detect_intent",
+            "description": "Detecta la intención principal del usuario cuando no está claro si quiere agendar una nueva cita, o si cambia de opinión hacia modificar o cancelar una cita existente, o si pide 'más tarde' o 'más temprano' un horario.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "intention": {
+                        "type": "string",
+                        "enum": ["create", "edit", "delete", "informational", "unknown", "more_late", "more_early"],
+                        "description": "La intención detectada del usuario."
+                    }
+                },
+                "required": ["intention"]
+            }
+        }
+    }
+]
+
+
+# ══════════════════ FUNCIONES ════════════════════════════════════════
+def _check_phone(args: Dict[str, Any]) -> Optional[str]:
+    phone = args.get("phone", "")
+    if not (isinstance(phone, str) and phone.isdigit() and len(phone) == 10):
+        logger.warning(f"Teléfono inválido '{phone}' para crear evento. La IA debería haberlo validado.")
+        return "Teléfono inválido proporcionado para crear la cita. Debe tener 10 dígitos."
+    return None
+
+
+def _sincroniza(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Dict[str, Any]]:
+    """La tool cambia el calendario: la caché de slots se sincroniza al terminar."""
+    def wrapper(**kwargs: Any) -> Dict[str, Any]:
+        try:
+            return fn(**kwargs)
+        finally:
+            request_sync()
+    return wrapper
+
+
+def _set_mode(mode: Optional[str] = None) -> Dict[str, Any]:
+    logger.info(f"🔁 Tool set_mode llamada: cambiando modo a '{mode}'")
+    return {"new_mode": mode}
+
+
+TOOLS = ToolRegistry()
+TOOLS.function("read_sheet_data", lambda: {"data_consultorio": get_consultorio_data_from_cache()})
+TOOLS.function("get_cancun_weather", get_cancun_weather)
+TOOLS.function("process_appointment_request", buscarslot.process_appointment_request)
+TOOLS.function("create_calendar_event", _sincroniza(create_calendar_event), check=_check_phone)
+TOOLS.function("edit_calendar_event", _sincroniza(edit_calendar_event))
+TOOLS.function("delete_calendar_event", _sincroniza(delete_calendar_event))
+TOOLS.function("search_calendar_event_by_phone",
+               lambda phone: {"search_results": search_calendar_event_by_phone(phone)})
+TOOLS.function("select_calendar_event_by_index", select_calendar_event_by_index)
+TOOLS.function("detect_intent", lambda intention=None: {"intent_detected": intention})
+TOOLS.function("set_mode", _set_mode)
+TOOLS.function("end_call", lambda reason="unknown": {"call_ended_reason": reason})
+
+TOOLS.expose(None, TOOLS_BASE)
+TOOLS.expose("crear", TOOLS_CREAR)
+TOOLS.expose("editar", TOOLS_EDITAR)
+TOOLS.expose("eliminar", TOOLS_ELIMINAR)
+TOOLS.expose(TEXT_MODE, TOOLS_TEXTO)
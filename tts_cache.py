@@ -0,0 +1,142 @@
+# tts_cache.py
+# -*- coding: utf-8 -*-
+"""
+Caché de audio TTS direccionada por contenido
+─────────────────────────────────────────────
+• Clave = sha256(texto + voice_id + modelo + voice_settings + formato):
+  si cambia cualquiera de ellos se sintetiza de nuevo.
+• Nivel 1: LRU en memoria acotado por bytes (compartido por todas las llamadas).
+• Nivel 2: un archivo .ulaw por clave en disco (sobrevive reinicios).
+  Escritura atómica (tmp + os.replace) para no dejar archivos a medias.
+• Solo se usa para frases fijas (saludo, despedida, errores): quien llama
+  decide con `cache=True`; las respuestas de GPT no se guardan.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger("tts_cache")
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_MEMORY_BYTES = 16 * 1024 * 1024   # ~35 min de μ-law 8 kHz
+
+
+class TTSCache:
+    """LRU en memoria + almacén en disco para audio μ-law ya sintetizado."""
+
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_memory_bytes: int = TTS_CACHE_MAX_MEMORY_BYTES) -> None:
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def make_key(
+        text: str,
+        voice_id: str,
+        model_id: str,
+        voice_settings: Optional[dict] = None,
+        output_format: str = "ulaw_8000",
+    ) -> str:
+        material = json.dumps(
+            [text, voice_id, model_id, voice_settings or {}, output_format],
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ulaw")
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Devuelve el audio cacheado o None."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+        except FileNotFoundError:
+            audio = None
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo leer caché TTS '{key[:12]}': {e}")
+            audio = None
+
+        with self._lock:
+            if not audio:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes) -> None:
+        """Guarda el audio en memoria y en disco."""
+        if not audio:
+            return
+        audio = bytes(audio)
+        with self._lock:
+            self._remember(key, audio)
+            self.stores += 1
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(audio)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo escribir caché TTS en disco: {e}")
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        """Inserta en el LRU (con el lock tomado) y expulsa lo más viejo."""
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        if len(audio) > self.max_memory_bytes:
+            return
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
+
+
+# Instancia única del proceso
+TTS_CACHE = TTSCache()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# tune_end_of_turn.py
+# --------------------------------------------------
+# Ajuste del detector de fin de turno con llamadas grabadas.
+# Lee el JSONL que escribe EOT_LOG_FILE, re-evalúa cada turno
+# con una rejilla de configuraciones (end_of_turn.replay) y
+# reporta, por configuración:
+#   • espera añadida tras la última voz/transcript (media, p95)
+#   • % de turnos cerrados ANTES de la última transcripción
+#     (el llamante no había terminado → lo habríamos cortado)
+# Con --write guarda la mejor config (menor p95 con cortes
+# por debajo de --max-cut) para usarla con EOT_CONFIG_FILE.
+#
+#   python tune_end_of_turn.py eot_log.jsonl [--max-cut 0.02] [--write eot_config.json]
+# --------------------------------------------------
+
+import argparse
+import itertools
+import json
+import statistics
+import sys
+from dataclasses import asdict, replace
+
+from end_of_turn import TRANSCRIPT, EndOfTurnConfig, replay
+
+# ======= REJILLA ====================
+GRID = {
+    "base_pause":     (0.20, 0.30, 0.40),
+    "complete_pause": (0.05, 0.10, 0.15, 0.25),
+    "vad_pause":      (0.10, 0.15, 0.25),
+    "incomplete_pause": (0.8, 1.2, 1.6),
+}
+# ====================================
+
+
+def _load_turns(path: str) -> list:
+    turns = []
+    with open(path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if any(ev[1] == TRANSCRIPT for ev in entry.get("events", [])):
+                turns.append(entry["events"])
+    return turns
+
+
+def _evaluate(turns: list, cfg: EndOfTurnConfig) -> dict:
+    waits, cuts = [], 0
+    for events in turns:
+        last_speech = max(ev[0] for ev in events if ev[1] == TRANSCRIPT)
+        closed = replay(events, cfg)
+        if closed is None:
+            closed = last_speech + cfg.max_wait
+        if closed < last_speech:
+            cuts += 1
+        else:
+            waits.append(closed - last_speech)
+    waits.sort()
+    return {
+        "mean_ms": statistics.fmean(waits) * 1000 if waits else 0.0,
+        "p95_ms": waits[int(0.95 * (len(waits) - 1))] * 1000 if waits else 0.0,
+        "cut_rate": cuts / len(turns),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("log", help="JSONL escrito con EOT_LOG_FILE")
+    parser.add_argument("--max-cut", type=float, default=0.02, help="máximo %% de turnos cortados (0-1)")
+    parser.add_argument("--write", help="guardar la mejor config en este JSON")
+    args = parser.parse_args()
+
+    turns = _load_turns(args.log)
+    if not turns:
+        sys.exit("Sin turnos con transcripción en el log.")
+    print(f"Turnos: {len(turns)}")
+
+    base = EndOfTurnConfig()
+    print(f"{'config':<60} {'media':>8} {'p95':>8} {'cortes':>7}")
+    results = []
+    keys = list(GRID)
+    for values in itertools.product(*(GRID[k] for k in keys)):
+        cfg = replace(base, **dict(zip(keys, values)))
+        res = _evaluate(turns, cfg)
+        results.append((cfg, res))
+        label = " ".join(f"{k}={v}" for k, v in zip(keys, values))
+        print(f"{label:<60} {res['mean_ms']:7.0f}ms {res['p95_ms']:7.0f}ms {res['cut_rate']:6.1%}")
+
+    ok = [r for r in results if r[1]["cut_rate"] <= args.max_cut]
+    if not ok:
+        sys.exit(f"Ninguna config corta menos del {args.max_cut:.0%} de los turnos.")
+    best_cfg, best = min(ok, key=lambda r: r[1]["p95_ms"])
+    print(f"\nMejor (cortes ≤ {args.max_cut:.0%}): {asdict(best_cfg)}")
+    print(f"  media {best['mean_ms']:.0f} ms · p95 {best['p95_ms']:.0f} ms · cortes {best['cut_rate']:.1%}")
+
+    if args.write:
+        with open(args.write, "w", encoding="utf-8") as fp:
+            json.dump(asdict(best_cfg), fp, indent=2)
+        print(f"Guardada en {args.write} (usar con EOT_CONFIG_FILE).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# turn_trace.py
+# -*- coding: utf-8 -*-
+"""
+Trazas de latencia por turno (STT final → primer audio a Twilio)
+────────────────────────────────────────────────────────────────
+• Cada llamada tiene un CallTracer con un anillo PREASIGNADO de turnos;
+  marcar una etapa solo guarda un time.perf_counter() en una lista
+  (sin strftime, sin dicts, sin logs en el camino caliente).
+• Etapas (en orden):
+      stt_final → pause_fired → gpt_request → gpt_first_token →
+      tools_start → tools_end → second_pass → gpt_done →
+      tts_request → tts_first_chunk → first_media_sent
+• Cada etapa se marca una sola vez por turno (la primera), salvo
+  stt_final, que conserva el ÚLTIMO final antes de enviar a GPT.
+• Módulos sin acceso al manager (aiagent) marcan con trace_mark(), que
+  resuelve el tracer de la llamada en curso vía call_context.
+• Turnos completos → JSONL (dump_jsonl / TURN_TRACE_FILE).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+from typing import IO, Dict, Iterator, List, Optional
+
+from call_context import current_call
+
+logger = logging.getLogger("turn_trace")
+
+STAGES = (
+    "stt_final",
+    "pause_fired",
+    "gpt_request",
+    "gpt_first_token",
+    "tools_start",
+    "tools_end",
+    "second_pass",
+    "gpt_done",
+    "tts_request",
+    "tts_first_chunk",
+    "first_media_sent",
+)
+STAGE_INDEX: Dict[str, int] = {name: i for i, name in enumerate(STAGES)}
+_STT_FINAL = STAGE_INDEX["stt_final"]
+_PAUSE_FIRED = STAGE_INDEX["pause_fired"]
+
+# Si se define, cada llamada agrega sus turnos completos a este archivo JSONL
+TURN_TRACE_FILE = os.getenv("TURN_TRACE_FILE", "")
+TURN_RING_SIZE = 64
+
+
+class TurnTrace:
+    """Un turno: marcas de tiempo perf_counter por etapa (0.0 = no ocurrió)."""
+
+    __slots__ = ("turn", "marks", "complete")
+
+    def __init__(self) -> None:
+        self.turn = 0
+        self.marks: List[float] = [0.0] * len(STAGES)
+        self.complete = False
+
+    def reset(self, turn: int) -> None:
+        self.turn = turn
+        marks = self.marks
+        for i in range(len(marks)):
+            marks[i] = 0.0
+        self.complete = False
+
+    def to_dict(self, call_id: object = None) -> dict:
+        """Etapas como ms relativos al stt_final (o a la primera marca)."""
+        base = self.marks[_STT_FINAL] or next((m for m in self.marks if m), 0.0)
+        return {
+            "call": call_id,
+            "turn": self.turn,
+            "spans_ms": {
+                name: round((m - base) * 1000, 1)
+                for name, m in zip(STAGES, self.marks) if m
+            },
+        }
+
+
+class CallTracer:
+    """Anillo de turnos de una llamada."""
+
+    def __init__(self, call_id: object = None, capacity: int = TURN_RING_SIZE) -> None:
+        self.call_id = call_id
+        self._ring = [TurnTrace() for _ in range(max(1, capacity))]
+        self._turns = 0                      # turnos iniciados
+        self._current: Optional[TurnTrace] = None
+
+    @property
+    def in_turn(self) -> bool:
+        return self._current is not None
+
+    def begin_turn(self) -> None:
+        """Abre un turno nuevo (sobrescribe el más viejo del anillo)."""
+        self._turns += 1
+        slot = self._ring[(self._turns - 1) % len(self._ring)]
+        slot.reset(self._turns)
+        self._current = slot
+
+    def mark(self, stage: str, t: Optional[float] = None) -> None:
+        """Marca la etapa en el turno abierto (solo la primera vez)."""
+        cur = self._current
+        if cur is None:
+            return
+        i = STAGE_INDEX[stage]
+        if not cur.marks[i]:
+            cur.marks[i] = t or time.perf_counter()
+
+    def mark_stt_final(self, t: Optional[float] = None) -> None:
+        """Abre turno si hace falta y guarda el último final del usuario."""
+        cur = self._current
+        if cur is None or cur.marks[_PAUSE_FIRED]:
+            # Un turno ya enviado a GPT que nunca llegó a audio queda abandonado
+            self.begin_turn()
+        self._current.marks[_STT_FINAL] = t or time.perf_counter()
+
+    def end_turn(self) -> Optional[TurnTrace]:
+        cur = self._current
+        if cur is None:
+            return None
+        cur.complete = True
+        self._current = None
+        return cur
+
+    def completed(self) -> Iterator[TurnTrace]:
+        """Turnos completos que siguen en el anillo, del más viejo al más nuevo."""
+        n = len(self._ring)
+        first = max(1, self._turns - n + 1)
+        for turn in range(first, self._turns + 1):
+            slot = self._ring[(turn - 1) % n]
+            if slot.turn == turn and slot.complete:
+                yield slot
+
+    def dump_jsonl(self, fp: IO[str]) -> int:
+        """Escribe los turnos completos como JSONL. Devuelve cuántos escribió."""
+        count = 0
+        for trace in self.completed():
+            fp.write(json.dumps(trace.to_dict(self.call_id), ensure_ascii=False))
+            fp.write("\n")
+            count += 1
+        return count
+
+    def flush_to_file(self, path: str = TURN_TRACE_FILE) -> int:
+        if not path:
+            return 0
+        try:
+            with open(path, "a", encoding="utf-8") as fp:
+                return self.dump_jsonl(fp)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudieron escribir trazas en '{path}': {e}")
+            return 0
+
+
+def trace_mark(stage: str) -> None:
+    """Marca una etapa en el tracer de la llamada en curso (si la hay)."""
+    ctx = current_call()
+    tracer = ctx.tracer if ctx is not None else None
+    if tracer is not None:
+        tracer.mark(stage)
@@ -9,21 +9,35 @@ CON LOGGING DETALLADO DE TIEMPOS.
 """
 
 import asyncio
-import base64
 import json
 import logging
 import re
 import time
-import os
 from datetime import datetime 
 from typing import Optional, List, Tuple 
 from decouple import config
 from fastapi import WebSocket
 from starlette.websockets import WebSocketState
 from aiagent import handle_tool_execution
-from state_store import session_state
+from call_bootstrap import BootstrapTimer, refresh_shared_caches
+from call_context import CallContext, begin_call, end_call
+from timer_scheduler import TimerHandle, get_timers
+from turn_trace import CallTracer
 from eleven_http_client import send_tts_http_to_twilio
-from eleven_ws_tts_client import ElevenLabsWSClient
+from eleven_ws_pool import new_tts_client
+from history_manager import remember_tool_result
+from twilio_frames import TwilioFrameDecoder
+from audio_ring_buffer import MulawRingBuffer
+from twilio_outbound import OutboundAudioScheduler
+from audio_bank import AUDIO_BANK, AudioClip
+from tts_cache import TTS_CACHE
+from metrics import (
+    BARGE_INS, SPECULATION_WASTED_TOKENS, SPECULATIONS, STT_AUDIO_SECONDS,
+    STT_TO_GPT_SECONDS, TTS_HTTP_FALLBACKS, TTS_REQUESTS,
+)
+from vad import SPEECH_START, VoiceActivityDetector
+from end_of_turn import EndOfTurnDetector, load_config as load_eot_config, log_turn
+from text_segmenter import ClauseSegmenter
 from utils import terminar_llamada_twilio
 import utils
 from asyncio import run_coroutine_threadsafe
@@ -31,9 +45,7 @@ import collections.abc
 
 # Tus importaciones de módulos locales
 try:
-    from aiagent import generate_openai_response_main 
-    from buscarslot import load_free_slots_to_cache 
-    from consultarinfo import load_consultorio_data_to_cache 
+    from aiagent import SPECULATION_ABORTED, generate_openai_response_main 
     from deepgram_stt_streamer import DeepgramSTTStreamer 
     from prompt import generate_openai_prompt 
     from utils import get_cancun_time 
@@ -49,10 +61,49 @@ logger.setLevel(logging.DEBUG) # Asegúrate que esté en DEBUG para ver los nuev
 LOG_TS_FORMAT = "%H:%M:%S.%f" 
 
 # --- Constantes Configurables para Tiempos (en segundos) ---
-PAUSA_SIN_ACTIVIDAD_TIMEOUT = .30
-MAX_TIMEOUT_SIN_ACTIVIDAD = 5.0
+PAUSA_SIN_ACTIVIDAD_TIMEOUT = .30     # pausa base del detector de fin de turno (end_of_turn.py)
+MAX_TIMEOUT_SIN_ACTIVIDAD = 5.0       # failsafe: se envía aunque el llamante parezca seguir
+STALL_TIMEOUT = 0.3          # Sin chunks de TTS durante este tiempo → se reactiva STT
+MONITOR_RECHECK = 5.0        # Re-chequeo de silencio mientras el bot está ocupado
 LATENCY_THRESHOLD_FOR_HOLD_MESSAGE = 50 # Umbral para mensaje de espera
-HOLD_MESSAGE_FILE = "audio/espera_1.wav" # Asegúrate que esta sea la ruta correcta a tu archivo mu-law
+HOLD_MESSAGE_CLIP = "espera_1"          # Clip del banco de audio (audio/espera_1.wav)
+ERROR_MESSAGE_CLIP = "error_sistema"    # Se reproduce si fallan ElevenLabs WS y HTTP
+GREETING_FALLBACK_CLIP = "saludo"       # Saludo pregrabado si no hay TTS al contestar
+AUDIO_BUFFER_MS = 5000        # Audio del llamante que se conserva mientras Deepgram no está disponible
+REPLAY_CHUNK_BYTES = 3200     # 400 ms por envío al re-inyectar el buffer a Deepgram
+
+# --- Barge-in: el llamante puede interrumpir al bot ---
+BARGE_IN_ENABLED = config("BARGE_IN_ENABLED", default=True, cast=bool)
+BARGE_IN_GRACE = 0.5          # s tras empezar el turno del bot sin admitir barge-in (eco / cola de su frase)
+BARGE_IN_MIN_WORDS = 2        # palabras (no muletillas) que debe tener un parcial para cortar al bot
+BARGE_IN_VAD_WINDOW_MS = 1000 # el VAD debe haber oído voz en este margen (descarta ruido transcrito)
+MULETILLAS = frozenset({"ajá", "aja", "mhm", "mm", "mmm", "ok", "okay", "sí", "si", "ah", "eh", "este", "bueno"})
+
+# --- VAD local (vad.py) ---
+VAD_ENABLED = config("VAD_ENABLED", default=True, cast=bool)
+VAD_SILENCE_HOLD_MS = 1500    # con este silencio el audio deja de ir a Deepgram (el SDK manda keepalive)
+VAD_PREROLL_MS = 300          # silencio retenido que se re-envía cuando vuelve la voz
+
+# --- GPT especulativo sobre parciales estables ---
+SPECULATIVE_GPT = config("SPECULATIVE_GPT", default=True, cast=bool)
+SPEC_STABLE_MS = 250          # el parcial no debe cambiar en este tiempo para especular
+SPEC_MIN_WORDS = 2            # no especular sobre "hola" / muletillas sueltas
+
+# --- TTS en streaming: deltas de GPT → frases → ElevenLabs (text_segmenter.py) ---
+TTS_STREAMING = config("TTS_STREAMING", default=True, cast=bool)
+TTS_STREAM_MAX_CHARS = 400    # failsafe provisional mientras aún no se conoce el texto completo
+
+# Detector de fin de turno: EOT_CONFIG_FILE (JSON) sobrescribe estos valores
+EOT_CONFIG = load_eot_config(base_pause=PAUSA_SIN_ACTIVIDAD_TIMEOUT, max_wait=MAX_TIMEOUT_SIN_ACTIVIDAD)
+
+_STT_AUDIO_SENT = STT_AUDIO_SECONDS.labels("sent")
+_STT_AUDIO_WITHHELD = STT_AUDIO_SECONDS.labels("withheld")
+_SPEC_TEXT_RE = re.compile(r"[^\w\s]+")
+
+
+def _normalizar_spec(texto: str) -> str:
+    """Texto comparable entre parcial y final: minúsculas, sin puntuación ni espacios extra."""
+    return " ".join(_SPEC_TEXT_RE.sub(" ", texto.lower()).split())
           
 
 # --- Otras Constantes Globales ---
@@ -60,10 +111,9 @@ HOLD_MESSAGE_FILE = "audio/espera_1.wav" # Asegúrate que esta sea la ruta corre
 CALL_MAX_DURATION = 600 
 CALL_SILENCE_TIMEOUT = 30 
 GOODBYE_PHRASE = "Fue un placer atenderle. ¡Hasta luego!"
+TECH_ERROR_PHRASE = "Disculpe, tuve un problema técnico. ¿Podría repetir?"
 TEST_MODE_NO_GPT = False # <--- Poner en True para pruebas sin GPT
 
-CURRENT_CALL_MANAGER: Optional[object] = None
-
 
 # --------------------------------------------------------------------------
 
@@ -75,9 +125,15 @@ class TwilioWebSocketManager:
         self.websocket: Optional[WebSocket] = None
         self.stt_streamer: Optional[DeepgramSTTStreamer] = None
         self.current_gpt_task: Optional[asyncio.Task] = None
-        self.temporizador_pausa: Optional[asyncio.Task] = None 
-        self.tts_timeout_task: Optional[asyncio.Task] = None
-        self.audio_espera_task: Optional[asyncio.Task] = None
+        self._dg_start_task: Optional[asyncio.Task] = None
+        self.bootstrap = BootstrapTimer()
+        # Plazos en el scheduler compartido (timer_scheduler.py), no tareas propias
+        self.temporizador_pausa: Optional[TimerHandle] = None 
+        self.tts_timeout_timer: Optional[TimerHandle] = None
+        self.audio_espera_timer: Optional[TimerHandle] = None
+        self.stall_timer: Optional[TimerHandle] = None
+        self.duration_timer: Optional[TimerHandle] = None
+        self.silence_timer: Optional[TimerHandle] = None
         self.finalizar_llamada_pendiente = False
         self.dg_tts_client = None # Será inicializado más adelante
         self.call_sid: str = "" 
@@ -90,7 +146,10 @@ class TwilioWebSocketManager:
         self.is_speaking: bool = False 
         self.ignorar_stt: bool = False 
         self.ultimo_evento_fue_parcial: bool = False 
+        self.tts_descartar_audio: bool = False   # True tras un barge-in hasta el siguiente TTS
+        self._barge_in_task: Optional[asyncio.Task] = None
         now = self._now()
+        self.bot_turn_ts: float = now            # inicio del turno del bot (gracia del barge-in)
         ts_now_str = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
         self.stream_start_time: float = now
         self.last_activity_ts: float = now 
@@ -100,43 +159,46 @@ class TwilioWebSocketManager:
         
         self.twilio_terminated = False
                 
-        self.audio_buffer_twilio: List[bytes] = []
+        # Últimos AUDIO_BUFFER_MS de audio μ-law mientras STT no está operativo (drop-oldest)
+        self.audio_buffer_twilio = MulawRingBuffer(AUDIO_BUFFER_MS)
         self.audio_buffer_lock = asyncio.Lock()
-        self.audio_buffer_max_bytes = 40000  # ~5 segundos de audio μ-law 8kHz
-        self.audio_buffer_current_bytes = 0
+        self._replay_lock = asyncio.Lock()   # un solo vaciado del buffer a la vez (bucle y reconexión)
         self.hold_audio_task: Optional[asyncio.Task] = None
         self.pending_question = None 
+        self.frame_decoder = TwilioFrameDecoder()
+        self.vad: Optional[VoiceActivityDetector] = VoiceActivityDetector() if VAD_ENABLED else None
+        self.vad_preroll = MulawRingBuffer(VAD_PREROLL_MS)
+        self.stt_retenido = False    # True mientras el VAD retiene silencio
+        self.eot = EndOfTurnDetector(EOT_CONFIG)
+        # GPT especulativo: tarea lanzada sobre un parcial estable y su "huella"
+        self.spec_timer: Optional[TimerHandle] = None
+        self.spec_task: Optional[asyncio.Task] = None
+        self.spec_texto = ""          # normalizado; el turno debe cerrar con este texto
+        self.spec_huella: Optional[tuple] = None   # (len historial, modo, pending)
+        self.spec_usage: dict = {}
+        self.spec_tool_records: list = []   # (tool, args, resultado): memoria solo si acierta
+        self.spec_prompt_chars = 0
+        self._spec_candidato: Tuple[str, str] = ("", "")
+        self.spec_stats = {"launched": 0, "hit": 0, "miss": 0, "aborted": 0, "wasted_tokens": 0}
+        # TTS en streaming de la respuesta en curso
+        self.tts_segmenter = ClauseSegmenter()
+        self.tts_stream_ws: Optional[bool] = None   # None = sin empezar; False = WS no disponible
+        self.tts_stream_texto = ""    # deltas recibidos de GPT
+        self.tts_stream_enviados = 0  # frases entregadas a ElevenLabs WS
+        self.tts_stream_resto: List[str] = []       # frases que no llegaron a ElevenLabs WS
+        self.tracer = CallTracer()
+        # Único emisor de media/mark/clear hacia Twilio (se crea al aceptar el WS)
+        self.outbound: Optional[OutboundAudioScheduler] = None
 
       
 
        
         self.finales_acumulados: List[str] = []
         self.conversation_history: List[dict] = []
-        self.hold_audio_mulaw_bytes: bytes = b""
-
-
-
-        try:
-            if os.path.exists(HOLD_MESSAGE_FILE):
-                with open(HOLD_MESSAGE_FILE, 'rb') as f:
-                    raw = f.read()
-
-                # ── Si el archivo comienza con “RIFF” es un WAV; quita cabecera de 44 bytes ──
-                if raw[:4] == b"RIFF":
-                    raw = raw[44:]
-
-                self.hold_audio_mulaw_bytes = raw
-                if self.hold_audio_mulaw_bytes:
-                    logger.info(f"Successfully loaded hold message '{HOLD_MESSAGE_FILE}' ({len(self.hold_audio_mulaw_bytes)} bytes).")
-                else:
-                    logger.warning(f"Hold message file '{HOLD_MESSAGE_FILE}' is empty.")
-            else:
-                logger.error(f"Hold message file not found at: {HOLD_MESSAGE_FILE}")
-        except Exception as e:
-            logger.error(f"Failed to load hold message file '{HOLD_MESSAGE_FILE}': {e}", exc_info=True)
-
-        if not self.hold_audio_mulaw_bytes:
-             logger.warning("Hold message feature will be disabled.")
+        # Clip ya codificado y compartido por todas las llamadas (ver audio_bank.py)
+        self.hold_clip: Optional[AudioClip] = AUDIO_BANK.get(HOLD_MESSAGE_CLIP)
+        if not self.hold_clip:
+             logger.warning(f"Hold message clip '{HOLD_MESSAGE_CLIP}' no disponible. Hold message feature will be disabled.")
         logger.debug(f"⏱️ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] INIT END (ID: {id(self)})")
 
 
@@ -147,6 +209,16 @@ class TwilioWebSocketManager:
         return time.perf_counter()
 
 
+    def _cancel_timers(self) -> None:
+        """Cancela todos los plazos de la llamada en el scheduler compartido."""
+        for attr in ("temporizador_pausa", "tts_timeout_timer", "audio_espera_timer",
+                     "stall_timer", "duration_timer", "silence_timer", "spec_timer"):
+            handle = getattr(self, attr, None)
+            if handle:
+                handle.cancel()
+            setattr(self, attr, None)
+
+
 
 
     def _reset_state_for_new_call(self):
@@ -154,15 +226,12 @@ class TwilioWebSocketManager:
         ts = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
         #logger.debug(f"⏱️ TS:[{ts}] RESET_STATE START")
         # Cancelar tareas si quedaron de una llamada anterior
-        if self.temporizador_pausa and not self.temporizador_pausa.done():
-            self.temporizador_pausa.cancel()
-            logger.debug("   RESET_STATE: Temporizador pausa cancelado.")
+        self._cancel_timers()
         if self.current_gpt_task and not self.current_gpt_task.done():
             self.current_gpt_task.cancel()
             logger.debug("   RESET_STATE: Tarea GPT cancelada.")
             
         self.current_gpt_task = None
-        self.temporizador_pausa = None
         self.call_ended = False
         self.shutdown_reason = "N/A"
         self.is_speaking = False
@@ -171,7 +240,6 @@ class TwilioWebSocketManager:
         now = self._now()
         
         self.last_chunk_time = None
-        self.stall_detector_task = None
 
         self.last_activity_ts = now
         self.last_final_ts = now
@@ -188,90 +256,56 @@ class TwilioWebSocketManager:
         self.websocket = websocket
         try:
             await websocket.accept()
+            self.bootstrap = BootstrapTimer()   # etapas del arranque medidas desde aquí
             ts_accept = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
             #logger.info(f"⏱️ TS:[{ts_accept}] HANDLE_WS WebSocket accepted.")
         except Exception as e_accept:
              logger.error(f"❌ Fallo al aceptar WebSocket: {e_accept}")
              return 
 
-        global CURRENT_CALL_MANAGER
-        CURRENT_CALL_MANAGER = self 
+        self.outbound = OutboundAudioScheduler(websocket.send_text)
+
+        # Contexto propio de esta llamada: lo heredan todas las tareas/hilos que cree
+        self.call_ctx: CallContext = begin_call(self)
+        self.call_ctx.tracer = self.tracer
+        self.tracer.call_id = self.call_ctx.call_id
         
         self._reset_state_for_new_call() 
 
 
         # --- Crear el cliente Eleven Labs TTS WebSocket (una sola vez) ---
         try:
-            from eleven_ws_tts_client import ElevenLabsWSClient
-            self.dg_tts_client = ElevenLabsWSClient()
-            logger.debug("🔌 Elabs TTS WS abierto al iniciar la llamada.")
+            t_tts = time.perf_counter()
+            self.dg_tts_client = new_tts_client()
+            self.bootstrap.done("tts_client", t_tts)
+            logger.debug("🔌 Elabs TTS WS listo al iniciar la llamada.")
         except Exception as e_ws_init:
             logger.error(f"❌ No se pudo abrir el WS de Elabs TTS: {e_ws_init}")
             self.dg_tts_client = None  # Se creará on-demand en el bloque de saludo
 
+        # --- Cachés compartidas (slots, consultorio): en segundo plano, solo si vencieron ---
+        refresh_shared_caches()
 
+        # --- Iniciar Deepgram sin bloquear: el saludo sale en cuanto llega "start" ---
+        if not self.stt_streamer: # Crear instancia si no existe (útil si el manager se reutilizara)
+             self.stt_streamer = DeepgramSTTStreamer(
+                 callback=self._stt_callback,
+                 on_disconnect_callback=self._reconnect_deepgram_if_needed,
+                 on_turn_event=self._on_dg_turn_event,
+             )
+        self._dg_start_task = asyncio.create_task(self._iniciar_deepgram(), name="DeepgramStart")
 
-
-
-
-
-        # --- Precarga de Datos ---
-        ts_preload_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-        #logger.debug(f"⏱️ TS:[{ts_preload_start}] HANDLE_WS Preload Start")
-        try:
-            preload_start_pc = self._now()
-            await asyncio.gather(
-                asyncio.to_thread(load_free_slots_to_cache, 90),
-                asyncio.to_thread(load_consultorio_data_to_cache)
-            )
-            preload_duration = (self._now() - preload_start_pc) * 1000
-            logger.info(f"✅ Precarga de datos completada. ⏱️ DUR:[{preload_duration:.1f}ms]")
-        except Exception as e_preload:
-            logger.warning(f"⚠️ Precarga de datos falló: {e_preload}", exc_info=False) 
-
-
-        # --- Iniciar Deepgram ---
-        ts_dg_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-        #logger.debug(f"⏱️ TS:[{ts_dg_start}] HANDLE_WS Deepgram Init Start")
-        monitor_task = None # Definir monitor_task aquí para que exista en el scope del finally
-        try:
-            dg_start_pc = self._now()
-            if not self.stt_streamer: # Crear instancia si no existe (útil si el manager se reutilizara)
-                 self.stt_streamer = DeepgramSTTStreamer(
-                     callback=self._stt_callback,
-                     on_disconnect_callback=self._reconnect_deepgram_if_needed
-                 )
-            
-            await self.stt_streamer.start_streaming() # Intenta iniciar la conexión
-            dg_duration = (self._now() - dg_start_pc) * 1000
-            
-            if self.stt_streamer._started: # Verificar si realmente se inició
-                logger.info(f"✅ Deepgram STT iniciado. ⏱️ DUR:[{dg_duration:.1f}ms]")
-            else: 
-                logger.critical(f"❌ CRÍTICO: Deepgram STT NO PUDO INICIARSE después del intento. ⏱️ DUR:[{dg_duration:.1f}ms]")
-                await self._shutdown(reason="Deepgram Initial Connection Failed")
-                return # Salir de handle_twilio_websocket si Deepgram no inicia
-        except Exception as e_dg_start:
-            logger.critical(f"❌ CRÍTICO: Excepción al intentar iniciar Deepgram: {e_dg_start}", exc_info=True)
-            # self._safe_close_websocket ya no es necesario aquí si _shutdown maneja el cierre del websocket de Twilio
-            await self._shutdown(reason="STT Initialization Exception") # _shutdown debería manejar la limpieza
-            # CURRENT_CALL_MANAGER = None # _shutdown o el finally de handle_twilio_websocket deberían manejar esto
-            return
-       # --- Tarea de Monitoreo ---
-        monitor_task = asyncio.create_task(self._monitor_call_timeout(), name=f"MonitorTask_{self.call_sid or id(self)}")
+       # --- Monitoreo de duración y silencio (plazos, sin polling) ---
+        self._arm_call_monitor()
         #logger.debug(f"⏱️ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] HANDLE_WS Monitor task created.")
 
         # --- Bucle Principal de Recepción ---
         #logger.debug(f"⏱️ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] HANDLE_WS Entering main receive loop...")
         try:
             while not self.call_ended:
-                ts_loop_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-                # logger.debug(f"⏱️ TS:[{ts_loop_start}] HANDLE_WS Waiting for message...")
                 try:
                     raw = await websocket.receive_text()
-                    data = json.loads(raw)
-                    ts_msg_received = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-                    # logger.debug(f"⏱️ TS:[{ts_msg_received}] HANDLE_WS Message received.")
+                    frame = self.frame_decoder.decode(raw)
                 except Exception as e_receive:
                     if "1000" in str(e_receive) or "1001" in str(e_receive) or "1006" in str(e_receive) or "close code" in str(e_receive).lower():
                          logger.warning(f"🔌 WebSocket desconectado: {e_receive}")
@@ -281,14 +315,54 @@ class TwilioWebSocketManager:
                          await self._shutdown(reason=f"WebSocket Receive Error: {type(e_receive).__name__}")
                     break 
 
-                event = data.get("event")
-               
+                event = frame.event
 
+                # --- Camino rápido: frames de audio (≈50/s) ---
+                if event == "media":
+                    decoded_payload = frame.payload
+                    if not decoded_payload:
+                        continue  # 👈 CORRECTO: ignoramos este mensaje y seguimos
 
+                    if self.vad is not None:
+                        vad_events = self.vad.process(decoded_payload)
+                        if vad_events:
+                            self._on_vad_events(vad_events)
+
+                    # Con barge-in, Deepgram sigue escuchando mientras el bot piensa/habla
+                    if self.ignorar_stt and not self._barge_in_armado():
+                        continue
+
+                    # Silencio prolongado según el VAD: no se envía a Deepgram
+                    if self.vad is not None and self.vad.silence_ms >= VAD_SILENCE_HOLD_MS:
+                        await self._retener_silencio(decoded_payload)
+                        continue
+
+                    # Mientras STT no opere (o se esté re-inyectando el buffer) el audio
+                    # se encola detrás del pendiente para conservar el orden.
+                    if not self.stt_streamer or not self.stt_streamer._started or self._replay_lock.locked():
+                        async with self.audio_buffer_lock:
+                            self.audio_buffer_twilio.append(decoded_payload)
+                        continue
+
+                    if self.audio_buffer_twilio:
+                        await self._replay_audio_buffer()
+                    if self.stt_retenido:
+                        await self._enviar_preroll()
+
+                    try:
+                        await self.stt_streamer.send_audio(decoded_payload)
+                        _STT_AUDIO_SENT.inc(len(decoded_payload) / 8000)
+                    except Exception as e_send_audio:
+                        logger.error(f"❌ Error enviando audio a STT: {e_send_audio}")
+                    continue
+
+                data = frame.data or {}
 
 
                 if event == "start":
                     self.stream_sid = data.get("streamSid")
+                    self.outbound.stream_sid = self.stream_sid
+                    self.bootstrap.done("start_event")
 
                     # Generar el saludo
                     greeting_text = self._greeting()
@@ -296,47 +370,37 @@ class TwilioWebSocketManager:
                     # 🔇 Silenciar STT mientras hablamos
                     self.tts_en_progreso = True
                     self.ignorar_stt = True
+                    self.tts_descartar_audio = False
+                    self.bot_turn_ts = self._now()
 
                     # 🧹 Vacía el búfer de audio que Twilio pudiera tener
-                    await self.websocket.send_text(json.dumps({
-                        "event": "clear",
-                        "streamSid": self.stream_sid
-                    }))
+                    await self.outbound.clear()
+                    self.outbound.notify_next_media(self.bootstrap.greeting_audio)
 
                     # ▶️ Enviar TTS (ElevenLabs WS primero, ElevenLabs HTTP fallback)
-                    async def _send_greet_chunk(chunk: bytes) -> None:
-                        await self.websocket.send_text(json.dumps({
-                            "event": "media",
-                            "streamSid": self.stream_sid,
-                            "media": { "payload": base64.b64encode(chunk).decode() },
-                        }))
-                        # ACTUALIZA EL TIMESTAMP DEL ÚLTIMO CHUNK
-                        self.last_chunk_time = self._now()
-
                     async def _on_greet_end():
                         await self._reactivar_stt_despues_de_envio()
 
                     try:
                         # Si aún no existe el cliente, créalo (caso de error previo)
                         if not getattr(self, "dg_tts_client", None):
-                            from eleven_ws_tts_client import ElevenLabsWSClient
-                            self.dg_tts_client = ElevenLabsWSClient()
+                            self.dg_tts_client = new_tts_client()
                             logger.debug("🔌 ElevenLabs TTS WS creado / recreado.")
 
+                        TTS_REQUESTS.labels("greeting").inc()
                         ok = await self.dg_tts_client.speak(
                             greeting_text,
-                            on_chunk=_send_greet_chunk,
+                            on_chunk=self._enqueue_tts_chunk,
                             on_end=_on_greet_end,
                             timeout_first_chunk=3.0,
+                            cache=True,
                         )
 
                         if not ok:
                             raise RuntimeError("ElevenLabs WS tardó en dar el primer chunk")
                         else:
                             # INICIAR DETECTOR DE STALLS PARA EL SALUDO
-                            self.stall_detector_task = asyncio.create_task(
-                                self._start_stall_detector()
-                            )
+                            self._start_stall_detector()
 
                     except Exception as e_dg_greet:
                         logger.error(f"ElevenLabs WS falló en saludo: {e_dg_greet}. Usando ElevenLabs HTTP.")
@@ -351,11 +415,17 @@ class TwilioWebSocketManager:
 
                         # ── 2) Fallback a ElevenLabs (HTTP) ────────────────────────────────────
                         logger.info("🔴 Fallback (saludo): Elabs WS no entregó audio a tiempo → se llama ElevenLabs HTTP.")
-                        await send_tts_http_to_twilio(
+                        ok_http = await send_tts_http_to_twilio(
                             text=greeting_text,
                             stream_sid=self.stream_sid,
                             websocket_send=self.websocket.send_text,
+                            outbound=self.outbound,
+                            cache=True,
                         )
+                        TTS_HTTP_FALLBACKS.labels("greeting", "ok" if ok_http else "failed").inc()
+                        if not ok_http:
+                            logger.warning("🔴 ElevenLabs HTTP también falló en el saludo → saludo pregrabado.")
+                            await self._play_clip(AUDIO_BANK.get(GREETING_FALLBACK_CLIP), wait=False)
 
                         # ── 3) Reactivar STT tan pronto termine el envío del fallback ──────────
                         await self._reactivar_stt_despues_de_envio()
@@ -365,6 +435,8 @@ class TwilioWebSocketManager:
                     received_call_sid = start_data.get("callSid")
                     if received_call_sid and self.call_sid != received_call_sid:
                         self.call_sid = received_call_sid
+                        self.call_ctx.call_sid = received_call_sid
+                        self.tracer.call_id = received_call_sid
 
                     logger.debug(f"⏱️ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] Saludo TTS enviado.")
                     logger.debug(f"⏱️ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] HANDLE_WS Greeting TTS finished.")
@@ -373,41 +445,8 @@ class TwilioWebSocketManager:
 
 
 
-                elif event == "media":
-                    payload_b64 = data.get("media", {}).get("payload")
-                    if not payload_b64:
-                        continue  # 👈 CORRECTO: ignoramos este mensaje y seguimos
-
-                    decoded_payload = base64.b64decode(payload_b64)
-                    chunk_size = len(decoded_payload)
-
-                    if self.ignorar_stt:
-                        continue
-
-                    if not self.stt_streamer or not self.stt_streamer._started:
-                        async with self.audio_buffer_lock:
-                            if self.audio_buffer_current_bytes + chunk_size <= self.audio_buffer_max_bytes:
-                                self.audio_buffer_twilio.append(decoded_payload)
-                                self.audio_buffer_current_bytes += chunk_size
-                                logger.debug(
-                                    f"🎙️ Audio bufferizado (STT inactivo). "
-                                    f"Tamaño total: {self.audio_buffer_current_bytes} bytes."
-                                )
-                            else:
-                                logger.warning("⚠️ Buffer de audio excedido. Chunk descartado.")
-                        continue
-
-                    try:
-                        await self.stt_streamer.send_audio(decoded_payload)
-                    except Exception as e_send_audio:
-                        logger.error(f"❌ Error enviando audio a STT: {e_send_audio}")
-
-
-
-
-
                 elif event == "stop":
-                    logger.info(f"🛑 Evento 'stop' recibido de Twilio (TS:{datetime.now().strftime(LOG_TS_FORMAT)[:-3]})")
+                    logger.info("🛑 Evento 'stop' recibido de Twilio")
                     await self._shutdown(reason="Twilio Stop Event")
                     # break # shutdown pone call_ended a True
 
@@ -418,12 +457,12 @@ class TwilioWebSocketManager:
                             self.ignorar_stt = False                      
                             logger.info("🔈 Fin de TTS, STT reactivado")    
 
-                    logger.debug(f"🔹 Evento 'mark' recibido: {mark_name} (TS:{datetime.now().strftime(LOG_TS_FORMAT)[:-3]})")
+                    logger.debug(f"🔹 Evento 'mark' recibido: {mark_name}")
                     
                 elif event == "connected": # Ignorar este evento informativo
                      pass                   
                 else:
-                    logger.warning(f"❓ Evento WebSocket desconocido: {event} (TS:{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}), Data: {str(data)[:200]}")
+                    logger.warning(f"❓ Evento WebSocket desconocido: {event}, Data: {str(data)[:200]}")
 
 
 
@@ -439,31 +478,8 @@ class TwilioWebSocketManager:
             # Asegurar limpieza final
             logger.info(f"🏁 Iniciando bloque finally de handle_twilio_websocket. CallSid: {self.call_sid or 'N/A'}") 
             
-            if monitor_task and not monitor_task.done():
-                logger.info("Cancelando tarea de monitoreo en finally...")
-                monitor_task.cancel()
-                try:
-                    await asyncio.wait_for(monitor_task, timeout=0.5)
-                except asyncio.TimeoutError:
-                    logger.warning("Timeout (0.5s) esperando la cancelación de la tarea de monitoreo.")
-                except asyncio.CancelledError:
-                    logger.debug("Tarea de monitoreo ya estaba cancelada o se canceló a tiempo.")
-                except Exception as e_cancel_mon:
-                    logger.error(f"Error durante la espera de cancelación de la tarea de monitoreo: {e_cancel_mon}")
-
-            # Cancelar audio_espera_task si seguía activo
-            if self.audio_espera_task and not self.audio_espera_task.done():
-                logger.debug("🛑 Cancelando tarea de audio de espera en cleanup final...")
-                self.audio_espera_task.cancel()
-                try:
-                    await asyncio.wait_for(self.audio_espera_task, timeout=0.5)
-                except asyncio.TimeoutError:
-                    logger.warning("⚠️ Timeout esperando cancelación de audio_espera_task.")
-                except asyncio.CancelledError:
-                    logger.debug("Tarea de audio de espera cancelada correctamente.")
-                except Exception as e:
-                    logger.error(f"❌ Error al cancelar audio_espera_task: {e}")
-            self.audio_espera_task = None
+            # Cancelar monitor, audio de espera y demás plazos pendientes
+            self._cancel_timers()
 
             if not self.call_ended:
                 logger.warning("Llamada no marcada como finalizada en finally de handle_twilio_websocket, llamando a _shutdown como precaución.")
@@ -475,8 +491,7 @@ class TwilioWebSocketManager:
 
             logger.info(f"🏁 Finalizado handle_twilio_websocket (post-finally). CallSid: {self.call_sid or 'N/A'}")
 
-            if CURRENT_CALL_MANAGER is self: 
-                CURRENT_CALL_MANAGER = None
+            end_call(self.call_ctx)
 
 
 
@@ -486,6 +501,27 @@ class TwilioWebSocketManager:
 
 
 
+    async def _iniciar_deepgram(self) -> None:
+        """Conexión inicial con Deepgram (tarea aparte, en paralelo con el saludo)."""
+        streamer = self.stt_streamer
+        try:
+            dg_start_pc = time.perf_counter()
+            await streamer.start_streaming() # Intenta iniciar la conexión
+            dg_duration = self.bootstrap.done("deepgram", dg_start_pc)
+
+            if self.call_ended:
+                await streamer.close()       # la llamada terminó mientras conectaba
+            elif streamer._started: # Verificar si realmente se inició
+                logger.info(f"✅ Deepgram STT iniciado. ⏱️ DUR:[{dg_duration:.1f}ms]")
+            else:
+                logger.critical(f"❌ CRÍTICO: Deepgram STT NO PUDO INICIARSE después del intento. ⏱️ DUR:[{dg_duration:.1f}ms]")
+                await self._shutdown(reason="Deepgram Initial Connection Failed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e_dg_start:
+            logger.critical(f"❌ CRÍTICO: Excepción al intentar iniciar Deepgram: {e_dg_start}", exc_info=True)
+            await self._shutdown(reason="STT Initialization Exception") # _shutdown debería manejar la limpieza
+
     async def _reconnect_deepgram_if_needed(self):
         """
         Intenta reconectar a Deepgram si la llamada aún está activa.
@@ -518,7 +554,8 @@ class TwilioWebSocketManager:
         # Creamos la nueva instancia
         self.stt_streamer = DeepgramSTTStreamer(
             callback=self._stt_callback,
-            on_disconnect_callback=self._reconnect_deepgram_if_needed # ¡Importante!
+            on_disconnect_callback=self._reconnect_deepgram_if_needed, # ¡Importante!
+            on_turn_event=self._on_dg_turn_event,
         )
 
         await self.stt_streamer.start_streaming() # Intenta iniciar la nueva conexión
@@ -527,32 +564,13 @@ class TwilioWebSocketManager:
             logger.info("RECONEXIÓN DG: ✅ Reconexión a Deepgram exitosa.")
 
             # ------------------------------------------------------------------
-            # 1️⃣  Enviar al STT cualquier audio que se haya quedado en el buffer
-            #     mientras Deepgram estuvo caído, **protegido con el lock** para
-            #     evitar condiciones de carrera con el hilo principal de Twilio.
+            # 1️⃣  Enviar al STT el audio que se quedó en el ring buffer mientras
+            #     Deepgram estuvo caído. Se envía directo desde el buffer (sin
+            #     copias) y solo se consume lo que Deepgram aceptó, así que si se
+            #     vuelve a caer el resto sigue ahí para la próxima reconexión.
+            #     El lock evita que el bucle de Twilio escriba sobre la vista en uso.
             # ------------------------------------------------------------------
-            async with self.audio_buffer_lock:
-                buffered_audio = list(self.audio_buffer_twilio)   # copia segura
-                self.audio_buffer_twilio.clear()                  # limpia buffer
-                self.audio_buffer_current_bytes = 0               # reinicia contador
-
-            if buffered_audio:
-                logger.info(f"RECONEXIÓN DG: Enviando {len(buffered_audio)} chunks de audio bufferizado…")
-                for chunk in buffered_audio:
-                    # Re-chequeamos por si Deepgram se vuelve a caer en mitad del envío
-                    if self.stt_streamer and self.stt_streamer._started:
-                        await self.stt_streamer.send_audio(chunk)
-                    else:
-                        logger.warning(
-                            "RECONEXIÓN DG: Deepgram se desconectó durante el vaciado "
-                            "del buffer. Re-bufferizando audio restante."
-                        )
-                        # Re-inyectamos el audio que faltó y salimos del bucle
-                        self.audio_buffer_twilio.extend(buffered_audio[buffered_audio.index(chunk):])
-                        self.audio_buffer_current_bytes = sum(len(c) for c in self.audio_buffer_twilio)
-                        break
-                else:
-                    logger.info("RECONEXIÓN DG: Buffer de audio enviado por completo.")
+            await self._replay_audio_buffer()
             # ------------------------------------------------------------------
             # 2️⃣  La lógica de `ignorar_stt` / `is_speaking` se gestiona más arriba.
             #     Aquí solo nos aseguramos de que el STT volvió a estar operativo.
@@ -569,46 +587,80 @@ class TwilioWebSocketManager:
 
 
 
+    async def _replay_audio_buffer(self) -> None:
+        """
+        Re-inyecta a Deepgram el audio bufferizado, en orden y sin realocar.
+        El vaciado entero va bajo _replay_lock: si el bucle de Twilio y la
+        reconexión lo piden a la vez, el segundo espera y encuentra el buffer vacío.
+        """
+        async with self._replay_lock:
+            if not self.audio_buffer_twilio:
+                return
+
+            pending_ms = self.audio_buffer_twilio.duration_ms
+            dropped = self.audio_buffer_twilio.dropped_bytes
+            logger.info(
+                f"RECONEXIÓN DG: Enviando {pending_ms:.0f} ms de audio bufferizado "
+                f"({dropped} bytes antiguos descartados por capacidad)…"
+            )
+            sent = 0
+            while self.audio_buffer_twilio:
+                if not self.stt_streamer or not self.stt_streamer._started:
+                    break
+                async with self.audio_buffer_lock:
+                    view = self.audio_buffer_twilio.peek(REPLAY_CHUNK_BYTES)
+                    if not await self.stt_streamer.send_audio(view):
+                        break
+                    self.audio_buffer_twilio.consume(len(view))
+                sent += len(view)
+
+            if self.audio_buffer_twilio:
+                logger.warning(
+                    "RECONEXIÓN DG: Deepgram se desconectó durante el vaciado "
+                    f"del buffer. Se conservan {self.audio_buffer_twilio.duration_ms:.0f} ms."
+                )
+                return
+            self.audio_buffer_twilio.dropped_bytes = 0
+            logger.info(f"RECONEXIÓN DG: Buffer de audio enviado por completo ({sent} bytes).")
+
     # --- Callback de Deepgram y Lógica de Acumulación ---
 
     def _stt_callback(self, transcript: str, is_final: bool):
-        """Callback de Deepgram con Timestamps y Lógica Mejorada."""
-        ts_callback_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-        #logger.debug(f"⏱️ TS:[{ts_callback_start}] STT_CALLBACK START (final={is_final})")
-
+        """Callback de Deepgram (tiempos con perf_counter; las trazas van a self.tracer)."""
         if self.ignorar_stt:
-            logger.debug(f"🚫 STT Ignorado (ignorar_stt=True): final={is_final}, text='{transcript[:60]}...' (TS:{ts_callback_start})")
+            if self._es_barge_in(transcript, is_final):
+                self._barge_in(transcript, is_final)
+                return
+            logger.debug(f"🚫 STT Ignorado (ignorar_stt=True): final={is_final}, text='{transcript[:60]}...'")
             return 
 
         ahora_pc = self._now() # Usar perf_counter para coherencia en timestamps relativos internos
-        ahora_dt = datetime.now() # Usar datetime para logs absolutos
         
         if transcript and transcript.strip():
             self.last_activity_ts = ahora_pc # Actualizar con perf_counter
             self.ultimo_evento_fue_parcial = not is_final 
             
             log_text_brief = transcript.strip()[:60] + ('...' if len(transcript.strip()) > 60 else '')
-            #logger.debug(f"🎤 TS:[{ahora_dt.strftime(LOG_TS_FORMAT)[:-3]}] STT_CALLBACK Activity: final={is_final}, flag_parcial={self.ultimo_evento_fue_parcial}, text='{log_text_brief}'")
+            #logger.debug(f"🎤 STT_CALLBACK Activity: final={is_final}, flag_parcial={self.ultimo_evento_fue_parcial}, text='{log_text_brief}'")
 
             if is_final:
                 self.last_final_ts = ahora_pc # Actualizar TS del último final
                 self.last_final_stt_timestamp = ahora_pc
-                #logger.info(f"📥 TS:[{ahora_dt.strftime(LOG_TS_FORMAT)[:-3]}] STT_CALLBACK Final Recibido: '{transcript.strip()}'")
+                #logger.info(f"📥 STT_CALLBACK Final Recibido: '{transcript.strip()}'")
                 self.finales_acumulados.append(transcript.strip())
+                self.tracer.mark_stt_final(ahora_pc)
             else:
                  # Loguear parciales solo si el nivel de log es TRACE o similar (si lo implementas)
-                 #logger.debug(f"📊 TS:[{ahora_dt.strftime(LOG_TS_FORMAT)[:-3]}] STT_CALLBACK Parcial: '{log_text_brief}'")
+                 #logger.debug(f"📊 STT_CALLBACK Parcial: '{log_text_brief}'")
                  pass
 
-            # Reiniciar el temporizador principal
-            if self.temporizador_pausa and not self.temporizador_pausa.done():
-                logger.debug(f"   STT_CALLBACK Cancelling existing pause timer...") # Log de cancelación está en la tarea
-                self.temporizador_pausa.cancel()
-                
-            #logger.debug(f"⏱️ TS:[{ahora_dt.strftime(LOG_TS_FORMAT)[:-3]}] STT_CALLBACK Reiniciando timer de pausa ({PAUSA_SIN_ACTIVIDAD_TIMEOUT}s).")
-            self.temporizador_pausa = asyncio.create_task(self._intentar_enviar_si_pausa(), name=f"PausaTimer_{self.call_sid or id(self)}")
+            # Reiniciar el temporizador principal con la espera que pide el detector
+            self.eot.on_transcript(transcript, is_final, ahora_pc)
+            self._reprogramar_pausa(self.eot.delay(ahora_pc))
+            if SPECULATIVE_GPT:
+                self._seguir_especulacion(transcript, is_final)
         else:
-             logger.debug(f"🔇 TS:[{ahora_dt.strftime(LOG_TS_FORMAT)[:-3]}] STT_CALLBACK Recibido transcript vacío.")
+             logger.debug("🔇 STT_CALLBACK Recibido transcript vacío.")
 
 
 
@@ -616,25 +668,20 @@ class TwilioWebSocketManager:
 
 
 
-    async def _intentar_enviar_si_pausa(self):
-        """Tarea que espera pausa y decide si enviar, con Timestamps."""
-        ts_intento_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-        #logger.debug(f"⏱️ TS:[{ts_intento_start}] INTENTAR_ENVIAR START")
-        
-        tiempo_espera = PAUSA_SIN_ACTIVIDAD_TIMEOUT 
-        timeout_maximo = MAX_TIMEOUT_SIN_ACTIVIDAD
+    def _reprogramar_pausa(self, delay: float) -> None:
+        """(Re)programa el plazo de fin de turno (mismo handle, sin crear tareas)."""
+        if self.temporizador_pausa:
+            self.temporizador_pausa.reschedule(delay)
+        else:
+            self.temporizador_pausa = get_timers().call_later(
+                delay, self._intentar_enviar_si_pausa,
+                name=f"PausaTimer_{self.call_sid or id(self)}",
+            )
 
+    async def _intentar_enviar_si_pausa(self):
+        """Se dispara cuando se cumple la pausa; el detector de fin de turno decide si enviar."""
         try:
-            #logger.debug(f"⏳ Esperando {tiempo_espera:.1f}s de pausa total...")
-            await asyncio.sleep(tiempo_espera)
-            
-            ts_sleep_end = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
             ahora = self._now()
-            elapsed_activity = ahora - self.last_activity_ts
-            # Usar getattr para evitar error si last_final_ts no se inicializó bien
-            elapsed_final = ahora - getattr(self, 'last_final_ts', ahora) 
-            
-            #logger.debug(f"⌛ TS:[{ts_sleep_end}] INTENTAR_ENVIAR Timer completado. Tiempo real desde últ_act: {elapsed_activity:.2f}s / desde últ_final: {elapsed_final:.2f}s")
 
             if self.call_ended:
                 logger.debug("⚠️ INTENTAR_ENVIAR: Llamada finalizada durante espera. Abortando.")
@@ -645,36 +692,21 @@ class TwilioWebSocketManager:
                 self.ultimo_evento_fue_parcial = False # Resetear por si acaso
                 return
 
-            # --- Lógica de Decisión para Enviar ---
-            
-            # CONDICIÓN 1: Timeout Máximo (Failsafe)
-            if elapsed_activity >= timeout_maximo:
-                logger.warning(f"⚠️ TS:[{ts_sleep_end}] INTENTAR_ENVIAR: Timeout máximo ({timeout_maximo:.1f}s) alcanzado (elapsed={elapsed_activity:.2f}s). Forzando envío.")
-                await self._proceder_a_enviar() 
-                return
-
-            # CONDICIÓN 2: Pausa Normal y Último Evento fue FINAL
-            # Comparamos con umbral ligeramente menor para evitar problemas de precisión flotante
-            if elapsed_activity >= (tiempo_espera - 0.1) and not self.ultimo_evento_fue_parcial:
-                #logger.info(f"✅ TS:[{ts_sleep_end}] INTENTAR_ENVIAR: Pausa normal ({tiempo_espera:.1f}s) detectada después de FINAL. Procediendo.")
-                await self._proceder_a_enviar() 
-                return
-                
-            # CONDICIÓN 3: Pausa Normal pero Último Evento fue PARCIAL
-            if elapsed_activity >= (tiempo_espera - 0.1) and self.ultimo_evento_fue_parcial:
-                #logger.info(f"⏸️ TS:[{ts_sleep_end}] INTENTAR_ENVIAR: Pausa normal ({tiempo_espera:.1f}s) detectada después de PARCIAL. Esperando 'is_final=true' correspondiente...")
-                # No enviamos, esperamos que el final reinicie el timer.
-                # El failsafe (Condición 1) eventualmente actuará si el final nunca llega.
+            if self.eot.ready(ahora):
+                elapsed_activity = ahora - self.last_activity_ts
+                if elapsed_activity >= self.eot.config.max_wait:
+                    logger.warning(f"⚠️ INTENTAR_ENVIAR: Timeout máximo ({self.eot.config.max_wait:.1f}s) alcanzado (elapsed={elapsed_activity:.2f}s). Forzando envío.")
+                await self._proceder_a_enviar()
                 return
 
-            logger.debug(f"❔ TS:[{ts_sleep_end}] INTENTAR_ENVIAR: Timer cumplido, pero ninguna condición de envío activa.")
+            # Aún no: parcial pendiente, frase a medias o el llamante sigue hablando.
+            # El failsafe (max_wait) acota la espera si el final nunca llega.
+            self._reprogramar_pausa(max(0.02, self.eot.delay(ahora)))
 
         except asyncio.CancelledError:
-            ts_cancel = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-            logger.debug(f"🛑 TS:[{ts_cancel}] INTENTAR_ENVIAR: Timer de pausa cancelado/reiniciado (normal).")
+            logger.debug("🛑 INTENTAR_ENVIAR: Timer de pausa cancelado/reiniciado (normal).")
         except Exception as e:
-            ts_error = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-            logger.error(f"❌ TS:[{ts_error}] Error en _intentar_enviar_si_pausa: {e}", exc_info=True)
+            logger.error(f"❌ Error en _intentar_enviar_si_pausa: {e}", exc_info=True)
 
 
 
@@ -689,11 +721,14 @@ class TwilioWebSocketManager:
         mensaje = await self._preparar_mensaje_para_gpt()
         if not mensaje:
             return
+        self.tracer.mark("pause_fired")
+        log_turn(self.eot.commit(self._now()), self.call_sid or self.call_ctx.call_id)
 
         # ⏱️ Medición: cuánto tiempo pasó desde el último is_final
         ahora_pc = self._now()
         if hasattr(self, "last_final_stt_timestamp"):
             delta_ms = (ahora_pc - self.last_final_stt_timestamp) * 1000
+            STT_TO_GPT_SECONDS.observe(delta_ms / 1000)
             logger.info(f"⏱️ [LATENCIA-1] STT final → GPT call: {delta_ms:.1f} ms")
 
         await self._activar_modo_ignorar_stt()
@@ -738,12 +773,12 @@ class TwilioWebSocketManager:
         """Activa ignorar_stt y cancela temporizador de pausa si existe."""
         
         self.ignorar_stt = True
+        self.bot_turn_ts = self._now()
         logger.info("🚫 PROCEDER_ENVIAR: Activado ignorar_stt=True")
 
-        if self.temporizador_pausa and not self.temporizador_pausa.done():
+        if self.temporizador_pausa and self.temporizador_pausa.active:
             self.temporizador_pausa.cancel()
             logger.debug("🕒 PROCEDER_ENVIAR: Temporizador de pausa cancelado.")
-            self.temporizador_pausa = None
     
 
 
@@ -768,12 +803,13 @@ class TwilioWebSocketManager:
             self.current_gpt_task = None
 
         # ── 2️⃣  (Re)programa el temporizador “un segundo, por favor” ─────────────
-        if self.audio_espera_task and not self.audio_espera_task.done():
-            self.audio_espera_task.cancel()
+        if self.audio_espera_timer:
+            self.audio_espera_timer.cancel()
 
         if ts_final is not None:
-            self.audio_espera_task = asyncio.create_task(
-                self._iniciar_temporizador_audio_espera(ts_final),
+            self.audio_espera_timer = get_timers().call_later(
+                LATENCY_THRESHOLD_FOR_HOLD_MESSAGE,
+                self._reproducir_audio_espera, ts_final,
                 name=f"HoldAudioTimer_{self.call_sid or id(self)}"
             )
 
@@ -791,45 +827,53 @@ class TwilioWebSocketManager:
 
     async def process_gpt_response_wrapper(self, texto_para_gpt: str, last_final_ts: Optional[float]):
         """Wrapper seguro que llama a process_gpt_response y asegura reactivar STT."""
-        ts_wrapper_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
         try:
             await self.process_gpt_response(texto_para_gpt, last_final_ts)
         except Exception as e:
             logger.error(f"❌ Error capturado dentro de process_gpt_response_wrapper: {e}", exc_info=True)
         finally:
-            ts_wrapper_end = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-            logger.debug(f"🏁 TS:[{ts_wrapper_end}] PROCESS_GPT_WRAPPER Finalizado. STT seguirá desactivado hasta isFinal de TTS")
+            logger.debug(f"🏁 PROCESS_GPT_WRAPPER Finalizado. STT seguirá desactivado hasta isFinal de TTS")
 
 
     async def _timeout_reactivar_stt(self, segundos: float):
         """
-        Espera 'segundos'.  
-        Si al terminar todavía estamos en modo TTS (self.tts_en_progreso),
+        Se dispara 'segundos' después de iniciar el TTS (si nadie lo canceló).
+        Si todavía estamos en modo TTS (self.tts_en_progreso),
         asume que ElevenLabs nunca envió isFinal y reactiva el STT.
         """
-        try:
-            await asyncio.sleep(segundos)
-            if self.call_ended:
-                return
+        if self.call_ended:
+            return
 
-            if self.tts_en_progreso:        # --> sigue “hablando” según nuestro estado
-                logger.warning(f"[TTS-TIMEOUT] Pasaron {segundos:.1f}s sin isFinal; "
-                               "reactivando STT por seguridad.")
-                self.tts_en_progreso = False
-                await self._reactivar_stt_despues_de_envio()
-        except asyncio.CancelledError:
-            # Cronómetro cancelado a tiempo (llegó isFinal)
-            pass
+        if self.tts_en_progreso:        # --> sigue “hablando” según nuestro estado
+            logger.warning(f"[TTS-TIMEOUT] Pasaron {segundos:.1f}s sin isFinal; "
+                           "reactivando STT por seguridad.")
+            self.tts_en_progreso = False
+            await self._reactivar_stt_despues_de_envio()
+
+
+    async def _enqueue_tts_chunk(self, chunk: bytes) -> None:
+        """Callback on_chunk del TTS: encola el audio en el planificador de salida."""
+        if self.tts_descartar_audio:
+            return  # chunk rezagado de una respuesta interrumpida (barge-in)
+        self.outbound.enqueue(chunk)
+        # ACTUALIZA EL TIMESTAMP DEL ÚLTIMO CHUNK
+        self.last_chunk_time = self._now()
+        self.tracer.mark("tts_first_chunk", self.last_chunk_time)
+
+
+    def _on_first_media_sent(self) -> None:
+        """El primer frame de la respuesta salió hacia Twilio: cierra el turno."""
+        self.tracer.mark("first_media_sent")
+        trace = self.tracer.end_turn()
+        if trace is not None:
+            spans = trace.to_dict()["spans_ms"]
+            logger.info(f"⏱️ [TURNO {trace.turn}] " + " → ".join(f"{k}={v}" for k, v in spans.items()))
 
 
     async def _send_mark_end_of_tts(self) -> None:
-        """Envía explícitamente el evento mark end_of_tts a Twilio."""
-        if self.websocket.application_state == WebSocketState.CONNECTED:
-            await self.websocket.send_text(json.dumps({
-                "event": "mark",
-                "streamSid": self.stream_sid,
-                "mark": {"name": "end_of_tts"}
-            }))
+        """Encola el evento mark end_of_tts detrás del audio pendiente."""
+        if self.outbound and self.websocket and self.websocket.application_state == WebSocketState.CONNECTED:
+            self.outbound.send_mark("end_of_tts")
 
 
     async def _reactivar_stt_despues_de_envio(self):
@@ -837,13 +881,9 @@ class TwilioWebSocketManager:
         log_prefix = f"ReactivarSTT_{self.call_sid}"
         
         # CANCELAR DETECTOR DE STALLS SI ESTÁ ACTIVO
-        if self.stall_detector_task:
-            self.stall_detector_task.cancel()
-            try:
-                await self.stall_detector_task
-            except asyncio.CancelledError:
-                pass
-            self.stall_detector_task = None
+        if self.stall_timer:
+            self.stall_timer.cancel()
+            self.stall_timer = None
         self.last_chunk_time = None
 
         # 0. Enviar marca de fin de TTS
@@ -854,9 +894,7 @@ class TwilioWebSocketManager:
 
         # 1. Limpiar buffers de audio
         async with self.audio_buffer_lock:
-            bytes_descartados = self.audio_buffer_current_bytes
-            self.audio_buffer_twilio.clear()
-            self.audio_buffer_current_bytes = 0
+            bytes_descartados = self.audio_buffer_twilio.clear()
 
         # 2. Limpiar textos finales acumulados
         self.finales_acumulados.clear()
@@ -873,30 +911,268 @@ class TwilioWebSocketManager:
         logger.info(f" 🟢 STT reactivado (ignorar_stt=False).")
 
         # 6. Cancelar cronómetro de timeout si existía
-        if self.tts_timeout_task and not self.tts_timeout_task.done():
-            self.tts_timeout_task.cancel()
-        self.tts_timeout_task = None
+        if self.tts_timeout_timer:
+            self.tts_timeout_timer.cancel()
+        self.tts_timeout_timer = None
 
 
-    async def _start_stall_detector(self):
-        """Monitorea si el envío de chunks se detiene"""
+    def _start_stall_detector(self) -> None:
+        """Programa el chequeo de stalls (sin polling: un plazo que se re-arma)."""
         #logger.debug("🚦 Iniciando detector de stalls TTS...")
-        while not self.call_ended and self.tts_en_progreso:
-            ahora = self._now()
-            if self.last_chunk_time and (ahora - self.last_chunk_time) > 0.3:  # 300ms
-                logger.warning("🚨 STALL DETECTED! No hay chunks recientes, reactivando STT")
-                await self._reactivar_stt_despues_de_envio()
+        if self.stall_timer:
+            self.stall_timer.reschedule(STALL_TIMEOUT)
+        else:
+            self.stall_timer = get_timers().call_later(
+                STALL_TIMEOUT, self._check_stall, name=f"StallTimer_{self.call_sid or id(self)}"
+            )
+
+    def _check_stall(self):
+        """Plazo del detector: si hubo chunks recientes se re-arma al nuevo límite."""
+        if self.call_ended or not self.tts_en_progreso:
+            return None
+        ahora = self._now()
+        if self.last_chunk_time and (ahora - self.last_chunk_time) > STALL_TIMEOUT:
+            logger.warning("🚨 STALL DETECTED! No hay chunks recientes, reactivando STT")
+            return self._reactivar_stt_despues_de_envio()   # el scheduler la corre como tarea
+        restante = STALL_TIMEOUT
+        if self.last_chunk_time:
+            restante = STALL_TIMEOUT - (ahora - self.last_chunk_time) + 0.01
+        self.stall_timer.reschedule(restante)
+        return None
+
+
+
+
+
+
+
+
+
+
+
+    # --- VAD local ---
+
+    def _on_vad_events(self, events) -> None:
+        """Inicio/fin de voz del llamante según el VAD local."""
+        ahora = self._now()
+        for ev in events:
+            speaking = ev == SPEECH_START
+            self.eot.on_vad(speaking, ahora)
+            if speaking:
+                self.last_activity_ts = ahora
+                logger.debug("🎙️ VAD: inicio de voz")
+            else:
+                logger.debug("🤫 VAD: fin de voz")
+                # Turno con finales pendientes: cerrar en cuanto la voz terminó
+                if self.finales_acumulados and not self.ignorar_stt:
+                    self._reprogramar_pausa(self.eot.delay(ahora))
+
+    def _on_dg_turn_event(self, kind: str) -> None:
+        """speech_final / utterance_end / speech_started de Deepgram → detector de fin de turno."""
+        ahora = self._now()
+        if kind == "speech_started":
+            self.eot.on_speech_started(ahora)
+            return
+        if kind == "speech_final":
+            self.eot.on_speech_final(ahora)
+        elif kind == "utterance_end":
+            self.eot.on_utterance_end(ahora)
+        if self.finales_acumulados and not self.ignorar_stt:
+            self._reprogramar_pausa(self.eot.delay(ahora))
+
+    async def _retener_silencio(self, payload: bytes) -> None:
+        """Guarda el silencio en el pre-roll en vez de mandarlo a Deepgram."""
+        if not self.stt_retenido:
+            self.stt_retenido = True
+            # Que Deepgram entregue ya lo pendiente: no le llegará más audio por un rato
+            if self.stt_streamer and self.stt_streamer._started:
+                await self.stt_streamer.finalize()
+        self.vad_preroll.append(payload)
+        _STT_AUDIO_WITHHELD.inc(len(payload) / 8000)
+
+    async def _enviar_preroll(self) -> None:
+        """Volvió la voz: manda a Deepgram los últimos ms retenidos (arranque de la frase)."""
+        self.stt_retenido = False
+        for view in self.vad_preroll.views():
+            if not await self.stt_streamer.send_audio(view):
                 break
-            await asyncio.sleep(0.05)  # Revisar cada 50ms
+        self.vad_preroll.clear()
 
+    # --- Barge-in ---
 
+    def _barge_in_armado(self) -> bool:
+        """¿Se puede interrumpir al bot ahora? (nunca durante la despedida)."""
+        return BARGE_IN_ENABLED and not self.finalizar_llamada_pendiente and not self.call_ended
 
+    def _es_barge_in(self, transcript: str, is_final: bool) -> bool:
+        """
+        Distingue voz real del llamante de eco/ruido: fuera de la ventana de
+        gracia y con suficientes palabras que no sean muletillas ("ajá", "sí"…).
+        """
+        if not self._barge_in_armado():
+            return False
+        if self._now() - self.bot_turn_ts < BARGE_IN_GRACE:
+            return False
+        if self.vad is not None and self.vad.silence_ms > BARGE_IN_VAD_WINDOW_MS:
+            return False   # Deepgram transcribió algo que el VAD no oyó como voz
+        palabras = [p for p in re.findall(r"\w+", transcript.lower()) if p not in MULETILLAS]
+        return len(palabras) >= (1 if is_final else BARGE_IN_MIN_WORDS)
+
+    def _barge_in(self, transcript: str, is_final: bool) -> None:
+        """
+        El llamante habló encima del bot: corta el audio en Twilio, cancela GPT
+        y el TTS en curso y arranca su turno con lo que acaba de decir.
+        """
+        fase = "tts" if self.tts_en_progreso else "gpt"
+        BARGE_INS.labels(fase).inc()
+        logger.info(f"✋ BARGE-IN ({fase}): '{transcript.strip()[:60]}'")
+
+        # 1. Nada más de la respuesta interrumpida llega a Twilio
+        self.tts_descartar_audio = True
+        if self.current_gpt_task and not self.current_gpt_task.done():
+            self.current_gpt_task.cancel()
+        self.current_gpt_task = None
+        tts_client = self.dg_tts_client
+        self.dg_tts_client = None          # process_gpt_response crea uno nuevo
+        if tts_client:
+            tts_client.cancel_utterance()
+
+        for attr in ("tts_timeout_timer", "stall_timer", "audio_espera_timer"):
+            handle = getattr(self, attr)
+            if handle:
+                handle.cancel()
+            setattr(self, attr, None)
+        self.last_chunk_time = None
+
+        # 2. Volver a escuchar y tratar la frase como inicio del siguiente turno
+        self.ignorar_stt = False
+        self.tts_en_progreso = False
+        self.finales_acumulados.clear()
+        self._barge_in_task = asyncio.create_task(
+            self._limpiar_tras_barge_in(tts_client),
+            name=f"BargeIn_{self.call_sid or id(self)}",
+        )
+        self._stt_callback(transcript, is_final)
 
+    # --- GPT especulativo ---
 
+    def _seguir_especulacion(self, transcript: str, is_final: bool) -> None:
+        """
+        Sigue el texto del turno en curso: descarta la especulación si el texto
+        cambió y, si cambió, espera SPEC_STABLE_MS de estabilidad para lanzar otra.
+        """
+        partes = list(self.finales_acumulados)
+        if not is_final:
+            partes.append(transcript.strip())
+        candidato = " ".join(partes)
+        norm = _normalizar_spec(candidato)
+        if self.spec_task and norm != self.spec_texto:
+            self._descartar_especulacion("miss")
+        if norm == self._spec_candidato[1]:
+            return              # mismo texto: no reinicia la ventana de estabilidad
+        self._spec_candidato = (candidato, norm)
+        if self.spec_timer:
+            self.spec_timer.reschedule(SPEC_STABLE_MS / 1000)
+        else:
+            self.spec_timer = get_timers().call_later(
+                SPEC_STABLE_MS / 1000, self._lanzar_especulacion,
+                name=f"SpecTimer_{self.call_sid or id(self)}",
+            )
 
+    def _lanzar_especulacion(self) -> None:
+        """El texto lleva SPEC_STABLE_MS sin cambiar: se pide la respuesta a GPT por adelantado."""
+        candidato, norm = self._spec_candidato
+        if (self.call_ended or self.ignorar_stt or self.spec_task
+                or len(norm.split()) < SPEC_MIN_WORDS):
+            return
+        modo = getattr(self, "modo", None)
+        pending = self._pending_tras(candidato)
+        history = list(self.conversation_history)
+        history.append({"role": "user", "content": candidato})
+
+        self.spec_texto = norm
+        self.spec_huella = (len(self.conversation_history), modo, pending)
+        self.spec_usage = {}
+        self.spec_tool_records = []
+        self.spec_prompt_chars = sum(len(str(m.get("content") or "")) for m in history)
+        self.spec_stats["launched"] += 1
+        logger.info(f"🔮 GPT especulativo sobre parcial estable: '{candidato[:60]}'")
+        self.spec_task = asyncio.create_task(
+            generate_openai_response_main(
+                history=history,
+                modo=modo,
+                pending_question=pending,
+                model=config("CHATGPT_MODEL", default="gpt-4.1-mini"),
+                speculative=True,
+                usage=self.spec_usage,
+                tool_records=self.spec_tool_records,
+            ),
+            name=f"SpecGPT_{self.call_sid or id(self)}",
+        )
 
+    def _tomar_especulacion(self, user_text: str) -> Optional[asyncio.Task]:
+        """
+        Al cerrar el turno: devuelve la tarea especulativa si se lanzó con el
+        mismo texto, historial, modo y pending_question; si no, la descarta.
+        """
+        if self.spec_timer:
+            self.spec_timer.cancel()
+            self.spec_timer = None
+        self._spec_candidato = ("", "")
+        task = self.spec_task
+        if task is None:
+            return None
+        huella = (len(self.conversation_history) - 1, self.modo, self.pending_question)
+        if _normalizar_spec(user_text) != self.spec_texto or huella != self.spec_huella or task.cancelled():
+            self._descartar_especulacion("miss")
+            return None
+        self.spec_task = None
+        return task
 
+    def _descartar_especulacion(self, outcome: str) -> None:
+        """Cancela la especulación en curso (si la hay) y la contabiliza como desperdicio."""
+        task, self.spec_task = self.spec_task, None
+        if task is None:
+            return
+        if not task.done():
+            task.cancel()
+        self._contar_especulacion(outcome, wasted=True)
+
+    def _contar_especulacion(self, outcome: str, wasted: bool) -> None:
+        SPECULATIONS.labels(outcome).inc()
+        self.spec_stats[outcome] += 1
+        if not wasted:
+            return
+        tokens = self.spec_usage.get("prompt_tokens", 0) + self.spec_usage.get("completion_tokens", 0)
+        if not tokens:
+            # Cancelada antes del chunk de uso: estimación ~4 caracteres por token
+            tokens = self.spec_prompt_chars // 4
+        SPECULATION_WASTED_TOKENS.inc(tokens)
+        self.spec_stats["wasted_tokens"] += tokens
+        logger.debug(f"🔮 Especulación descartada ({outcome}): ~{tokens} tokens")
+
+    @staticmethod
+    def _pending_atendida(user_text: str) -> bool:
+        """¿La respuesta del usuario atiende la pending_question?"""
+        return bool(user_text) and (len(user_text) > 3 or any(
+            kw in user_text.lower() for kw in ["sí", "no", "pronto", "fecha"]))
+
+    def _pending_tras(self, user_text: str) -> Optional[str]:
+        """pending_question que dejará la limpieza de process_gpt_response (sin tocar estado)."""
+        pending = getattr(self, "pending_question", None)
+        if not pending or self._pending_atendida(user_text):
+            return None
+        return None if getattr(self, "pending_turns", 0) + 1 > 3 else pending
 
+    async def _limpiar_tras_barge_in(self, tts_client) -> None:
+        """Parte asíncrona del barge-in: clear a Twilio y cierre del WS de TTS."""
+        try:
+            if self.outbound:
+                await self.outbound.clear()
+            if tts_client:
+                await tts_client.close()
+        except Exception as e:
+            logger.debug(f"Limpieza tras barge-in incompleta: {e}")
 
 
     async def _reactivar_stt_si_posible(self, log_prefix: str):
@@ -951,8 +1227,7 @@ class TwilioWebSocketManager:
 
         # Limpieza avanzada de pending_question
         if self.pending_question:
-            if user_text and (len(user_text) > 3 or any(
-                    kw in user_text.lower() for kw in ["sí", "no", "pronto", "fecha"])):
+            if self._pending_atendida(user_text):
                 self.pending_question = None
                 logger.info("✅ Pending question atendida por respuesta")
                 self.pending_turns = 0
@@ -972,25 +1247,48 @@ class TwilioWebSocketManager:
             if (not getattr(self, "dg_tts_client", None) or
                     getattr(self.dg_tts_client, "_ws_close", None) and
                     self.dg_tts_client._ws_close.is_set()):
-                from eleven_ws_tts_client import ElevenLabsWSClient
-                self.dg_tts_client = ElevenLabsWSClient()
-                logger.debug("🔌 ElevenLabs WS creado (legacy)")
+                self.dg_tts_client = new_tts_client()
+                logger.debug("🔌 ElevenLabs WS creado / tomado del pool")
         except Exception as e:
             logger.error("❌ Error creando WS ElevenLabs: %s", e)
 
         # ── ❸ Llamada a GPT: función pura, retorna tupla  ────────────────────────
-        try:
-            respuesta, nuevo_modo, nueva_pending = await generate_openai_response_main(
-                history=self.conversation_history,
-                modo=self.modo,
-                pending_question=self.pending_question,
-                model=config("CHATGPT_MODEL", default="gpt-4.1-mini"),
-            )
-        except Exception as e:
-            logger.error(f"❌ Error en generate_openai_response_main: {e}", exc_info=True)
-            respuesta = "Disculpe, tuve un problema técnico. ¿Podría repetir?"
-            nuevo_modo = self.modo
-            nueva_pending = self.pending_question
+        # Si hubo especulación sobre este mismo turno, se reutiliza su respuesta.
+        # El stream de TTS se reinicia siempre: el del turno anterior no sirve a este.
+        self._reset_tts_stream()
+        respuesta = None
+        spec = self._tomar_especulacion(user_text)
+        if spec is not None:
+            try:
+                respuesta, nuevo_modo, nueva_pending = await spec
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Especulación falló, se llama a GPT de nuevo: {e}")
+                respuesta = SPECULATION_ABORTED
+            if respuesta == SPECULATION_ABORTED:
+                self._contar_especulacion("aborted", wasted=True)
+                respuesta = None
+            else:
+                self._contar_especulacion("hit", wasted=False)
+                for name, args, result in self.spec_tool_records:
+                    remember_tool_result(self.call_ctx.state, name, args, result)
+                logger.info("🔮 Especulación acertada: respuesta de GPT ya disponible")
+
+        if respuesta is None:
+            try:
+                respuesta, nuevo_modo, nueva_pending = await generate_openai_response_main(
+                    history=self.conversation_history,
+                    modo=self.modo,
+                    pending_question=self.pending_question,
+                    model=config("CHATGPT_MODEL", default="gpt-4.1-mini"),
+                    on_text=self._tts_stream_delta if TTS_STREAMING else None,
+                )
+            except Exception as e:
+                logger.error(f"❌ Error en generate_openai_response_main: {e}", exc_info=True)
+                respuesta = TECH_ERROR_PHRASE
+                nuevo_modo = self.modo
+                nueva_pending = self.pending_question
 
         # Actualizar modo solo si realmente cambia (y nunca perder el anterior)
         if nuevo_modo is not None and nuevo_modo != self.modo:
@@ -1000,6 +1298,8 @@ class TwilioWebSocketManager:
 
         # Manejar caso especial __END_CALL__
         if respuesta == "__END_CALL__":
+            if self.tts_stream_ws:
+                await self.dg_tts_client.finalize_stream()   # lo ya dicho antes de la tool
             logger.info("🔚 IA solicitó colgar")
             await utils.cierre_con_despedida(self, reason="user_request", delay=5.0)
             return
@@ -1009,8 +1309,13 @@ class TwilioWebSocketManager:
             {"role": "assistant", "content": respuesta}
         )
 
-        # Procesar la respuesta (TTS/audio/texto)
-        await self.handle_tts_response(respuesta, last_final_ts)
+        # Procesar la respuesta (TTS/audio/texto); si ya se empezó a hablar en streaming, se cierra ese stream
+        if self.tts_stream_ws is not None:
+            await self._cerrar_tts_stream(respuesta)
+        else:
+            await self.handle_tts_response(
+                respuesta, last_final_ts, cache=(respuesta == TECH_ERROR_PHRASE)
+            )
 
         # Reset de modo si corresponde (por ejemplo, finalización de ciclo)
         if self.modo and "¿Le puedo ayudar en algo más?" in respuesta:
@@ -1027,68 +1332,60 @@ class TwilioWebSocketManager:
 
 
 
-    async def handle_tts_response(self, texto: str, last_final_ts: Optional[float]):
-        """Convierte respuesta GPT a TTS con ElevenLabs WS + fallback a ElevenLabs HTTP"""
+    async def handle_tts_response(self, texto: str, last_final_ts: Optional[float], cache: bool = False):
+        """
+        Convierte respuesta GPT a TTS con ElevenLabs WS + fallback a ElevenLabs HTTP.
+        cache=True solo para frases fijas (despedida, errores): se sirven desde tts_cache.
+        """
         if self.call_ended:
             logger.warning("🔇 handle_tts_response abortado: llamada terminada.")
             return
 
         try:
             # ── 1️⃣  Cancela el temporizador de audio-espera si está corriendo ──
-            if self.audio_espera_task and not self.audio_espera_task.done():
-                self.audio_espera_task.cancel()
-                self.audio_espera_task = None
+            if self.audio_espera_timer:
+                self.audio_espera_timer.cancel()
+                self.audio_espera_timer = None
 
             # ── 2️⃣  Marca que estamos hablando (silencia STT) ──────────────────
             self.tts_en_progreso = True
             self.ignorar_stt     = True
+            self.tts_descartar_audio = False
+            self.bot_turn_ts = self._now()
 
             # ── 3️⃣  Programa el cronómetro failsafe ───────────────────────────
             duracion_max = estimar_duracion_tts(texto)
-            if self.tts_timeout_task and not self.tts_timeout_task.done():
-                self.tts_timeout_task.cancel()
-            self.tts_timeout_task = asyncio.create_task(
-                self._timeout_reactivar_stt(duracion_max),
+            if self.tts_timeout_timer:
+                self.tts_timeout_timer.cancel()
+            self.tts_timeout_timer = get_timers().call_later(
+                duracion_max, self._timeout_reactivar_stt, duracion_max,
                 name=f"TTS_TO_{self.call_sid or id(self)}"
             )
 
             # 🧹 Vacía el búfer de audio que Twilio pudiera tener
-            await self.websocket.send_text(json.dumps({
-                "event": "clear",
-                "streamSid": self.stream_sid
-            }))
+            await self.outbound.clear()
+            self.outbound.notify_next_media(self._on_first_media_sent)
 
             # ── 4️⃣  Envía el TTS a Twilio (ElevenLabs WS + fallback) ────────────
             logger.info(f"⏱️ [LATENCIA-3-START] TTS request iniciado para: '{texto[:30]}...'")
             ts_tts_start = self._now()
+            self.tracer.mark("tts_request", ts_tts_start)
 
-            # REEMPLAZA LA FUNCIÓN _send_chunk CON ESTA VERSIÓN:
-            async def _send_chunk(chunk: bytes):
-                await self.websocket.send_text(json.dumps({
-                    "event": "media",
-                    "streamSid": self.stream_sid,
-                    "media": {
-                        "payload": base64.b64encode(chunk).decode()
-                    },
-                }))
-                # ACTUALIZA EL TIMESTAMP DEL ÚLTIMO CHUNK
-                self.last_chunk_time = self._now()
-
+            TTS_REQUESTS.labels("response").inc()
             try:
                 ok = await self.dg_tts_client.speak(
                     texto,
-                    on_chunk=_send_chunk,
+                    on_chunk=self._enqueue_tts_chunk,
                     on_end=self._reactivar_stt_despues_de_envio,
                     timeout_first_chunk=3.0,
+                    cache=cache,
                 )
 
                 if not ok:
                     raise RuntimeError("ElevenLabs WS tardó demasiado en dar el primer chunk")
 
                 # INICIAR DETECTOR DE STALLS PARA LA RESPUESTA
-                self.stall_detector_task = asyncio.create_task(
-                    self._start_stall_detector()
-                )
+                self._start_stall_detector()
 
                 ts_tts_end = self._now()
                 logger.info(
@@ -1099,11 +1396,17 @@ class TwilioWebSocketManager:
                 logger.error(f"ElevenLabs WS falló: {e_dg}. Cambiando a ElevenLabs HTTP.")
                 logger.info("🔴 Fallback (respuesta): ElevenLabs WS no entregó audio a tiempo → se llama ElevenLabs HTTP.")
                 ts_tts_start = self._now()
-                await send_tts_http_to_twilio(
+                ok_http = await send_tts_http_to_twilio(
                     text=texto,
                     stream_sid=self.stream_sid,
                     websocket_send=self.websocket.send_text,
+                    outbound=self.outbound,
+                    cache=cache,
                 )
+                TTS_HTTP_FALLBACKS.labels("response", "ok" if ok_http else "failed").inc()
+                if not ok_http:
+                    logger.warning("🔴 ElevenLabs HTTP también falló → mensaje de error pregrabado.")
+                    await self._play_clip(AUDIO_BANK.get(ERROR_MESSAGE_CLIP), wait=False)
                 ts_tts_end = self._now()
                 logger.info(
                     f"📦 ElevenLabs HTTP TTS→Twilio emitido en {(ts_tts_end - ts_tts_start) * 1000:.1f} ms"
@@ -1123,6 +1426,119 @@ class TwilioWebSocketManager:
 
 
 
+    # --- TTS en streaming (GPT → segmentador → ElevenLabs WS) ---
+
+    def _reset_tts_stream(self) -> None:
+        self.tts_segmenter = ClauseSegmenter()
+        self.tts_stream_ws = None
+        self.tts_stream_texto = ""
+        self.tts_stream_enviados = 0
+        self.tts_stream_resto = []
+
+    async def _tts_stream_delta(self, delta: str) -> None:
+        """on_text de GPT: cada frase/cláusula completa sale hacia ElevenLabs al momento."""
+        self.tts_stream_texto += delta
+        for segmento in self.tts_segmenter.feed(delta):
+            await self._tts_stream_segmento(segmento)
+
+    async def _tts_stream_segmento(self, segmento: str) -> None:
+        if self.call_ended:
+            return
+        if self.tts_stream_ws is None:
+            self.tts_stream_ws = await self._abrir_tts_stream()
+        if self.tts_stream_ws:
+            if await self.dg_tts_client.add_text_chunk(segmento):
+                self.tts_stream_enviados += 1
+                return
+            self.tts_stream_ws = False
+        # WS no disponible (o caído a mitad): esta frase irá por HTTP al cerrar
+        self.tts_stream_resto.append(segmento)
+
+    async def _abrir_tts_stream(self) -> bool:
+        """Primera frase de la respuesta: el bot empieza a hablar (como handle_tts_response)."""
+        if self.audio_espera_timer:
+            self.audio_espera_timer.cancel()
+            self.audio_espera_timer = None
+
+        self.tts_en_progreso = True
+        self.ignorar_stt = True
+        self.tts_descartar_audio = False
+        self.bot_turn_ts = self._now()
+
+        # Failsafe provisional: se re-arma con la duración real al cerrar el stream
+        duracion_max = estimar_duracion_tts("x" * TTS_STREAM_MAX_CHARS)
+        if self.tts_timeout_timer:
+            self.tts_timeout_timer.cancel()
+        self.tts_timeout_timer = get_timers().call_later(
+            duracion_max, self._timeout_reactivar_stt, duracion_max,
+            name=f"TTS_TO_{self.call_sid or id(self)}"
+        )
+
+        await self.outbound.clear()
+        self.outbound.notify_next_media(self._on_first_media_sent)
+        logger.info("⏱️ [LATENCIA-3-START] TTS streaming iniciado con la primera frase de GPT")
+        self.tracer.mark("tts_request")
+        TTS_REQUESTS.labels("response").inc()
+
+        if not self.dg_tts_client:
+            return False
+        try:
+            return await self.dg_tts_client.begin_stream(
+                on_chunk=self._enqueue_tts_chunk,
+                on_end=self._reactivar_stt_despues_de_envio,
+            )
+        except Exception as e:
+            logger.error(f"❌ ElevenLabs WS no pudo abrir el stream: {e}")
+            return False
+
+    async def _cerrar_tts_stream(self, respuesta: str) -> None:
+        """
+        GPT terminó: manda lo que quede al segmentador, cierra el stream (EOS) y
+        si ElevenLabs WS falló, completa por HTTP lo que no llegó a sintetizar.
+        """
+        # Si la respuesta no es la continuación de lo emitido (error de GPT a medias) se dice entera
+        fed = self.tts_stream_texto
+        cola = respuesta[len(fed):] if respuesta.startswith(fed) else respuesta
+        segmentos = self.tts_segmenter.feed(cola) if cola else []
+        resto = self.tts_segmenter.flush()
+        for segmento in segmentos + ([resto] if resto else []):
+            await self._tts_stream_segmento(segmento)
+
+        try:
+            ok = False      # ¿ElevenLabs WS entregó audio de esta respuesta?
+            if self.tts_stream_enviados:
+                if self.tts_stream_ws:
+                    await self.dg_tts_client.finalize_stream()
+                if self.tts_timeout_timer:
+                    self.tts_timeout_timer.reschedule(estimar_duracion_tts(respuesta))
+                ok = await self.dg_tts_client.wait_first_chunk(3.0)
+                if not ok:
+                    # Nada se oyó: que el WS no entregue tarde; se repite todo por HTTP
+                    self.dg_tts_client.cancel_utterance()
+            if ok and not self.tts_stream_resto:
+                self._start_stall_detector()
+                return
+
+            texto_http = " ".join(self.tts_stream_resto) if ok else respuesta
+            logger.info(f"🔴 Fallback (stream): ElevenLabs WS no sintetizó {len(texto_http)} chars → ElevenLabs HTTP.")
+            ok_http = await send_tts_http_to_twilio(
+                text=texto_http,
+                stream_sid=self.stream_sid,
+                websocket_send=self.websocket.send_text,
+                outbound=self.outbound,
+            )
+            TTS_HTTP_FALLBACKS.labels("response", "ok" if ok_http else "failed").inc()
+            if not ok_http and not ok:
+                await self._play_clip(AUDIO_BANK.get(ERROR_MESSAGE_CLIP), wait=False)
+            # Sin isFinal de ElevenLabs WS: se reactiva STT aquí mismo (como en handle_tts_response)
+            await self._reactivar_stt_despues_de_envio()
+        except asyncio.CancelledError:
+            logger.info("🚫 TTS streaming cancelado (normal en shutdown / barge-in).")
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error cerrando TTS streaming: {e}", exc_info=True)
+            await self._reactivar_stt_despues_de_envio()
+
     async def should_play_hold_audio(self, last_final_ts: Optional[float]) -> bool:
         """Devuelve True si la latencia excede el umbral y hay audio de espera cargado."""
         if last_final_ts is None or self.call_ended:
@@ -1133,7 +1549,7 @@ class TwilioWebSocketManager:
         threshold = LATENCY_THRESHOLD_FOR_HOLD_MESSAGE
 
         if real_latency > threshold:
-            if self.hold_audio_mulaw_bytes:
+            if self.hold_clip:
                 logger.info(f"⏱️ Latencia {real_latency:.2f}s > umbral {threshold}s → se usará mensaje de espera.")
                 return True
             else:
@@ -1146,21 +1562,19 @@ class TwilioWebSocketManager:
 
 
 
-    async def _iniciar_temporizador_audio_espera(self, ts_final: Optional[float]):
+    async def _reproducir_audio_espera(self, ts_final: Optional[float]):
         """
-        Inicia un temporizador para reproducir el audio de espera si GPT tarda mucho.
-        Se cancela automáticamente si TTS comienza antes del umbral.
+        Plazo del audio de espera: se dispara LATENCY_THRESHOLD_FOR_HOLD_MESSAGE s
+        después del final si GPT sigue pensando. Se cancela si TTS comienza antes.
         """
         if ts_final is None:
             return
 
-        threshold = LATENCY_THRESHOLD_FOR_HOLD_MESSAGE
         try:
-            await asyncio.sleep(threshold)
             if self.call_ended or self.tts_en_progreso:
                 return
             if await self.should_play_hold_audio(ts_final):
-                await self._play_audio_bytes(self.hold_audio_mulaw_bytes)
+                await self._play_clip(self.hold_clip)
         except asyncio.CancelledError:
             # Normal si la tarea fue cancelada porque llegó TTS
             pass
@@ -1185,47 +1599,43 @@ class TwilioWebSocketManager:
 
     # --- Funciones Auxiliares 
 
-    async def _play_audio_bytes(self, pcm_ulaw_bytes: bytes) -> None:
+    async def _play_clip(self, clip: Optional[AudioClip], wait: bool = True) -> None:
             """
-            Envía audio μ-law (8 kHz, mono) al <Stream> de Twilio.
-
-            • Divide en frames de 160 bytes = 20 ms.  
-            • Añade 'streamSid' a cada JSON; sin él Twilio lanza 31951.
+            Reproduce un clip del banco de audio (ya partido y en base64).
+            Con wait=False solo lo encola; lo que se encole después sale detrás.
             """
-            if not pcm_ulaw_bytes or not self.websocket or not self.stream_sid:
+            if not clip or not self.outbound or not self.stream_sid:
                 return
 
-            # Ya no se arranca el feeder de silencio aquí.
-            # El keepalive de ElevenLabs se manejará por el SDK.
+            self.outbound.enqueue_encoded(clip.payloads)
+            logger.info(f"🔊 PLAY_CLIP '{clip.name}' encolado ({clip.duration_ms} ms).")
+            if not wait:
+                return
 
             self.is_speaking = True
-            CHUNK = 160                               # 20 ms @ 8 kHz μ-law
-            total_sent = 0
-
             try:
-                for i in range(0, len(pcm_ulaw_bytes), CHUNK):
-                    if self.call_ended:
-                        break
-
-                    chunk = pcm_ulaw_bytes[i:i + CHUNK]
+                await self.outbound.flush()
+            finally:
+                self.is_speaking = False
+                self.last_activity_ts = self._now()
 
-                    # LOG opcional (ayuda a depurar si vuelve a salir 31951)
-                    #logger.debug("➡️ SEND → %s bytes", len(chunk))
 
-                    await self.websocket.send_json({
-                        "streamSid": self.stream_sid,          # 👈 OBLIGATORIO
-                        "event": "media",
-                        "media": {
-                            "payload": base64.b64encode(chunk).decode("ascii")
-                        }
-                    })
+    async def _play_audio_bytes(self, pcm_ulaw_bytes: bytes) -> None:
+            """
+            Envía audio μ-law (8 kHz, mono) al <Stream> de Twilio.
 
-                    total_sent += len(chunk)
-                    await asyncio.sleep(0.02)                 # 20 ms
+            • El planificador de salida lo parte en frames de 20 ms y lo
+              envía con ritmo de tiempo real; aquí solo se espera a que salga.
+            """
+            if not pcm_ulaw_bytes or not self.outbound or not self.stream_sid:
+                return
 
-                logger.info(f"🔊 PLAY_AUDIO Fin reproducción. Enviados {total_sent} bytes.")
+            self.is_speaking = True
+            try:
+                self.outbound.enqueue(pcm_ulaw_bytes)
+                await self.outbound.flush()
+                logger.info(f"🔊 PLAY_AUDIO Fin reproducción. Encolados {len(pcm_ulaw_bytes)} bytes.")
             finally:
-                # Ya no se necesita manejo de silencio aquí.
                 self.is_speaking = False
                 self.last_activity_ts = self._now()
 
@@ -1253,39 +1663,44 @@ class TwilioWebSocketManager:
 
 
 
-    async def _monitor_call_timeout(self):
-        """Tarea en segundo plano que monitoriza duración y silencio."""
+    def _arm_call_monitor(self) -> None:
+        """Programa los plazos de duración máxima y de silencio prolongado."""
         ts_monitor_start = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
         logger.info(f"⏱️ TS:[{ts_monitor_start}] MONITOR Iniciando...")
-        while not self.call_ended:
-            
-            await asyncio.sleep(5) # Revisar cada 5 segundos
-            
-            if self.call_ended: break 
+        timers = get_timers()
+        restante = CALL_MAX_DURATION - (self._now() - self.stream_start_time)
+        self.duration_timer = timers.call_later(
+            restante, self._on_max_duration, name=f"MaxDuration_{self.call_sid or id(self)}"
+        )
+        self.silence_timer = timers.call_later(
+            CALL_SILENCE_TIMEOUT, self._check_silence, name=f"Silence_{self.call_sid or id(self)}"
+        )
 
-            now_pc = self._now()
-            now_dt_str = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
-            #logger.debug(f"⏱️ TS:[{now_dt_str}] MONITOR Check...")
-            
-            # Timeout por duración máxima
-            call_duration = now_pc - self.stream_start_time
-            if call_duration >= CALL_MAX_DURATION:
-                logger.warning(f"⏰ TS:[{now_dt_str}] MONITOR Duración máxima ({CALL_MAX_DURATION}s) excedida (actual: {call_duration:.1f}s).")
-                await self._shutdown(reason="Max Call Duration")
-                break 
-
-            # Timeout por silencio prolongado (basado en last_activity_ts)
-            # Solo si no estamos ocupados (GPT/TTS)
-            if not self.ignorar_stt and not self.is_speaking:
-                silence_duration = now_pc - self.last_activity_ts
-                if silence_duration >= CALL_SILENCE_TIMEOUT:
-                    logger.warning(f"⏳ TS:[{now_dt_str}] MONITOR Silencio prolongado ({CALL_SILENCE_TIMEOUT}s) detectado (actual: {silence_duration:.1f}s).")
-                    await self._shutdown(reason="User Silence Timeout")
-                    break
-            # else:
-                 # logger.debug(f"   MONITOR Ignorando chequeo silencio (ignorar_stt={self.ignorar_stt}, is_speaking={self.is_speaking})")
+    async def _on_max_duration(self):
+        """Plazo de duración máxima de la llamada."""
+        if self.call_ended:
+            return
+        call_duration = self._now() - self.stream_start_time
+        logger.warning(f"⏰ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] MONITOR Duración máxima ({CALL_MAX_DURATION}s) excedida (actual: {call_duration:.1f}s).")
+        await self._shutdown(reason="Max Call Duration")
 
-        logger.info(f"⏱️ MONITOR Finalizado (CallEnded={self.call_ended}).")
+    def _check_silence(self):
+        """
+        Plazo de silencio: si hubo actividad desde que se programó, se re-arma
+        al nuevo límite; si el bot está ocupado (GPT/TTS) se revisa más tarde.
+        """
+        if self.call_ended:
+            return None
+        # Solo si no estamos ocupados (GPT/TTS)
+        if self.ignorar_stt or self.is_speaking:
+            self.silence_timer.reschedule(MONITOR_RECHECK)
+            return None
+        silence_duration = self._now() - self.last_activity_ts
+        if silence_duration >= CALL_SILENCE_TIMEOUT:
+            logger.warning(f"⏳ TS:[{datetime.now().strftime(LOG_TS_FORMAT)[:-3]}] MONITOR Silencio prolongado ({CALL_SILENCE_TIMEOUT}s) detectado (actual: {silence_duration:.1f}s).")
+            return self._shutdown(reason="User Silence Timeout")   # el scheduler la corre como tarea
+        self.silence_timer.reschedule(CALL_SILENCE_TIMEOUT - silence_duration)
+        return None
 
 
     
@@ -1319,14 +1734,16 @@ class TwilioWebSocketManager:
             # --- Cancelar otras tareas activas ---
             # (Tu código original para cancelar PausaTimer y GPTTask estaba bien,
             # solo me aseguro que se limpien las referencias)
+            self._cancel_timers()
+            self._descartar_especulacion("miss")
             tasks_to_cancel_map = {
-                "PausaTimer": "temporizador_pausa",
-                "GPTTask": "current_gpt_task"
+                "GPTTask": "current_gpt_task",
+                "DeepgramStart": "_dg_start_task",
             }
 
             for task_name_log, attr_name in tasks_to_cancel_map.items():
                 task_instance = getattr(self, attr_name, None)
-                if task_instance and not task_instance.done():
+                if task_instance and not task_instance.done() and task_instance is not asyncio.current_task():
                     logger.debug(f"🔴 SHUTDOWN: Cancelando Tarea {task_name_log}...")
                     task_instance.cancel()
                     try:
@@ -1352,7 +1769,7 @@ class TwilioWebSocketManager:
                     self.stt_streamer = None
 
 
-            # --- Cerrar ElevenLabs TTS streamer explícitamente ---
+            # --- Cerrar ElevenLabs TTS (si es del pool, el socket vuelve al pool) ---
             if getattr(self, "dg_tts_client", None):
                 try:
                     await self.dg_tts_client.close()   # cierre limpio
@@ -1363,6 +1780,18 @@ class TwilioWebSocketManager:
 
 
 
+            # --- Detener el envío de audio a Twilio ---
+            if self.outbound:
+                logger.info(f"📤 SHUTDOWN: Stats audio saliente: {self.outbound.stats()}")
+                await self.outbound.close()
+            logger.info(f"⚡ SHUTDOWN: Stats caché TTS: {TTS_CACHE.stats()}")
+            if self.vad is not None:
+                logger.info(f"🎙️ SHUTDOWN: Stats VAD: {self.vad.stats()}")
+            logger.info(f"🗣️ SHUTDOWN: Stats fin de turno: {self.eot.stats()}")
+            if SPECULATIVE_GPT:
+                logger.info(f"🔮 SHUTDOWN: Stats GPT especulativo: {self.spec_stats}")
+            self.tracer.flush_to_file()
+
             # --- Cerrar WebSocket de Twilio ---
             await self._safe_close_websocket(code=1000, reason=self.shutdown_reason)
 
@@ -1372,7 +1801,10 @@ class TwilioWebSocketManager:
             if hasattr(self, 'audio_buffer_twilio'):
                 async with self.audio_buffer_lock:
                     self.audio_buffer_twilio.clear()
-                    self.audio_buffer_current_bytes = 0
+
+            # --- Sacar la llamada del registro (idempotente) ---
+            if getattr(self, "call_ctx", None):
+                end_call(self.call_ctx)
 
             ts_shutdown_end = datetime.now().strftime(LOG_TS_FORMAT)[:-3]
             logger.info(f"🏁 TS:[{ts_shutdown_end}] SHUTDOWN Completado (Razón: {self.shutdown_reason}).")
@@ -0,0 +1,95 @@
+# twilio_frames.py
+# -*- coding: utf-8 -*-
+"""
+Decodificador rápido de frames del <Stream> de Twilio
+──────────────────────────────────────────────────────
+• Twilio manda ~50 mensajes "media" por segundo y por llamada, todos con la
+  misma forma:
+      {"event":"media","sequenceNumber":"4","media":{...,"payload":"<b64>"},"streamSid":"MZ…"}
+• Para esos frames NO hacemos json.loads: se reconoce el prefijo, se ubica
+  el payload con str.find y se decodifica con binascii.
+• Cualquier otro evento (connected/start/stop/mark) o un frame media con
+  forma inesperada cae al camino genérico con json.loads.
+"""
+
+from __future__ import annotations
+
+import binascii
+import json
+import logging
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger("twilio_frames")
+
+# Twilio serializa "event" como primera clave y sin espacios.
+_MEDIA_PREFIX = '{"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+
+
+class TwilioFrame(NamedTuple):
+    """Resultado de decodificar un mensaje de Twilio."""
+    event: Optional[str]
+    payload: Optional[bytes] = None   # audio μ-law ya decodificado (solo "media")
+    data: Optional[dict] = None       # JSON completo (solo camino genérico)
+
+
+class TwilioFrameDecoder:
+    """
+    Decodificador por llamada. Mantiene contadores para saber cuántos frames
+    tomaron el camino rápido y cuántos el genérico.
+    """
+
+    __slots__ = ("fast_frames", "slow_frames", "bad_frames")
+
+    def __init__(self) -> None:
+        self.fast_frames = 0
+        self.slow_frames = 0
+        self.bad_frames = 0
+
+    def decode(self, raw: str) -> TwilioFrame:
+        """
+        Decodifica un mensaje de texto de Twilio.
+        Lanza ValueError si el mensaje no es JSON válido.
+        """
+        if raw.startswith(_MEDIA_PREFIX):
+            start = raw.find(_PAYLOAD_KEY, len(_MEDIA_PREFIX))
+            if start != -1:
+                start += len(_PAYLOAD_KEY)
+                end = raw.find('"', start)
+                if end != -1:
+                    try:
+                        payload = binascii.a2b_base64(raw[start:end])
+                    except (binascii.Error, ValueError):
+                        payload = None
+                    if payload is not None:
+                        self.fast_frames += 1
+                        return TwilioFrame("media", payload or None)
+
+        return self._decode_generic(raw)
+
+    def _decode_generic(self, raw: str) -> TwilioFrame:
+        """Camino lento: JSON completo (start/stop/mark o media con forma rara)."""
+        self.slow_frames += 1
+        data = json.loads(raw)
+        event = data.get("event")
+        if event != "media":
+            return TwilioFrame(event, None, data)
+
+        payload_b64 = data.get("media", {}).get("payload")
+        if not payload_b64:
+            return TwilioFrame("media", None, data)
+        try:
+            return TwilioFrame("media", binascii.a2b_base64(payload_b64), data)
+        except (binascii.Error, ValueError) as e:
+            self.bad_frames += 1
+            logger.warning(f"⚠️ Payload media inválido descartado: {e}")
+            return TwilioFrame("media", None, data)
+
+    def stats(self) -> dict:
+        total = self.fast_frames + self.slow_frames
+        return {
+            "fast_frames": self.fast_frames,
+            "slow_frames": self.slow_frames,
+            "bad_frames": self.bad_frames,
+            "fast_ratio": (self.fast_frames / total) if total else 0.0,
+        }
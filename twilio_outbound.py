@@ -0,0 +1,304 @@
+# twilio_outbound.py
+# -*- coding: utf-8 -*-
+"""
+Planificador único de audio saliente hacia Twilio (uno por llamada)
+───────────────────────────────────────────────────────────────────
+• Es el ÚNICO lugar que envía "media"/"mark"/"clear" al <Stream> de Twilio.
+• Agrupa el audio en múltiplos de 20 ms (160 bytes μ-law) y manda hasta
+  `group_frames` frames por mensaje → menos mensajes WebSocket.
+• Ritmo contra un reloj corregido por deriva: cada envío se programa según
+  el audio ya enviado desde el ancla (no con sleep(0.02) acumulativos) y
+  nunca se adelanta más de `max_ahead_ms` al tiempo real.
+• clear() descarta lo pendiente y vacía el buffer de Twilio (interrupciones).
+• enqueue_encoded() acepta paquetes ya en base64 (banco de audio) y los
+  manda tal cual, con el mismo ritmo.
+• flush() espera a que todo lo encolado haya salido.
+• stats() expone la contrapresión: audio en cola y tiempo de send_text.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Sequence
+
+logger = logging.getLogger("twilio_outbound")
+
+FRAME_BYTES = 160          # 20 ms @ 8 kHz μ-law
+FRAME_MS = 20
+GROUP_FRAMES = 5           # máx. 100 ms por mensaje (recomendación de Twilio)
+MAX_AHEAD_MS = 200         # pre-buffer máximo en Twilio
+SILENCE = b"\xff"          # 0xFF = silencio μ-law
+
+WebSocketSend = Callable[[str], Awaitable[None]]
+
+_AUDIO = 0
+_MARK = 1
+_ENCODED = 2
+
+
+def _b64_len(payload: str) -> int:
+    """Bytes decodificados de un payload base64 sin decodificarlo."""
+    return len(payload) * 3 // 4 - payload.count("=", -2)
+
+
+class OutboundAudioScheduler:
+    """Cola + tarea de envío con ritmo de tiempo real para una llamada."""
+
+    def __init__(
+        self,
+        websocket_send: WebSocketSend,
+        stream_sid: Optional[str] = None,
+        *,
+        group_frames: int = GROUP_FRAMES,
+        max_ahead_ms: int = MAX_AHEAD_MS,
+    ) -> None:
+        self._send = websocket_send
+        self.stream_sid = stream_sid
+        self.group_frames = max(1, group_frames)
+        self.max_ahead_ms = max_ahead_ms
+
+        # [_AUDIO, bytearray] | [_MARK, nombre] | [_ENCODED, payloads, índice]
+        self._items: deque = deque()
+        self._queued_bytes = 0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._flush_requested = False
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._on_next_media: Optional[Callable[[], None]] = None
+
+        # Reloj de reproducción: ancla + ms de audio enviados desde el ancla
+        self._clock_t0: Optional[float] = None
+        self._clock_sent_ms = 0.0
+
+        # Métricas
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.clock_resets = 0
+        self.clears = 0
+        self.send_time_max_ms = 0.0
+        self.send_time_total_ms = 0.0
+
+    # ─────────────────────────────── API pública ───────────────────────────────
+
+    def enqueue(self, audio) -> None:
+        """Encola audio μ-law (cualquier tamaño). No bloquea."""
+        if self._closed or not audio:
+            return
+        if self._items and self._items[-1][0] == _AUDIO:
+            self._items[-1][1].extend(audio)
+        else:
+            self._items.append([_AUDIO, bytearray(audio)])
+        self._queued_bytes += len(audio)
+        self._kick()
+
+    def enqueue_encoded(self, payloads: Sequence[str]) -> None:
+        """
+        Encola paquetes μ-law ya codificados en base64, cada uno con un número
+        entero de frames de 160 bytes (ver audio_bank.build_clip).
+        """
+        if self._closed or not payloads:
+            return
+        self._items.append([_ENCODED, payloads, 0])
+        self._queued_bytes += sum(_b64_len(p) for p in payloads)
+        self._kick()
+
+    def send_mark(self, name: str) -> None:
+        """Encola un evento mark; sale después de todo el audio previo."""
+        if self._closed:
+            return
+        self._items.append([_MARK, name])
+        self._kick()
+
+    def notify_next_media(self, callback: Callable[[], None]) -> None:
+        """Llama a `callback` (una sola vez) al enviar el próximo frame de audio."""
+        self._on_next_media = callback
+
+    async def flush(self) -> None:
+        """Espera a que todo lo encolado (incluido un frame parcial) se envíe."""
+        if self._closed or not self._items:
+            return
+        self._flush_requested = True
+        self._kick()
+        await self._idle.wait()
+
+    async def clear(self) -> None:
+        """Descarta el audio pendiente y pide a Twilio vaciar su buffer."""
+        self._items.clear()
+        self._queued_bytes = 0
+        self._clock_t0 = None
+        self._clock_sent_ms = 0.0
+        self._idle.set()
+        self.clears += 1
+        if self._closed or not self.stream_sid:
+            return
+        await self._send_text(json.dumps({"event": "clear", "streamSid": self.stream_sid}))
+
+    async def close(self) -> None:
+        """Detiene la tarea de envío y descarta lo pendiente."""
+        self._closed = True
+        self._items.clear()
+        self._queued_bytes = 0
+        self._idle.set()
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.debug(f"Tarea de envío terminó con error al cerrar: {e}")
+        self._task = None
+
+    @property
+    def queued_ms(self) -> float:
+        """Audio encolado y aún no enviado (ms)."""
+        return self._queued_bytes / FRAME_BYTES * FRAME_MS
+
+    def stats(self) -> dict:
+        return {
+            "messages_sent": self.messages_sent,
+            "audio_sent_ms": self.bytes_sent / FRAME_BYTES * FRAME_MS,
+            "queued_ms": self.queued_ms,
+            "clock_resets": self.clock_resets,
+            "clears": self.clears,
+            "send_time_max_ms": round(self.send_time_max_ms, 2),
+            "send_time_avg_ms": round(self.send_time_total_ms / self.messages_sent, 2) if self.messages_sent else 0.0,
+        }
+
+    # ─────────────────────────────── Internos ──────────────────────────────────
+
+    def _kick(self) -> None:
+        self._idle.clear()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="TwilioOutbound")
+
+    def _pace_delay(self, frames: int) -> float:
+        """Segundos a esperar antes de mandar `frames` sin exceder el look-ahead."""
+        now = time.perf_counter()
+        if self._clock_t0 is None or (now - self._clock_t0) * 1000 > self._clock_sent_ms:
+            # Primera vez o Twilio ya reprodujo todo lo enviado: re-anclar el reloj
+            if self._clock_t0 is not None:
+                self.clock_resets += 1
+            self._clock_t0 = now
+            self._clock_sent_ms = 0.0
+            return 0.0
+        ahead_ms = self._clock_sent_ms + frames * FRAME_MS - (now - self._clock_t0) * 1000
+        if ahead_ms > self.max_ahead_ms:
+            return (ahead_ms - self.max_ahead_ms) / 1000
+        return 0.0
+
+    async def _run(self) -> None:
+        try:
+            while not self._closed:
+                if not self._items:
+                    self._flush_requested = False
+                    self._idle.set()
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                item = self._items[0]
+                if item[0] == _MARK:
+                    self._items.popleft()
+                    if self.stream_sid:
+                        await self._send_text(json.dumps({
+                            "event": "mark",
+                            "streamSid": self.stream_sid,
+                            "mark": {"name": item[1]},
+                        }))
+                    continue
+
+                if item[0] == _ENCODED:
+                    payload = item[1][item[2]]
+                    n = _b64_len(payload)
+                    frames = n // FRAME_BYTES
+                    delay = self._pace_delay(frames)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                        continue
+                    item[2] += 1
+                    if item[2] >= len(item[1]):
+                        self._items.popleft()
+                    self._queued_bytes -= n
+                    await self._send_media(payload, n)
+                    self._clock_sent_ms += frames * FRAME_MS
+                    continue
+
+                buf: bytearray = item[1]
+                frames = len(buf) // FRAME_BYTES
+                if frames == 0:
+                    if len(self._items) > 1 or self._flush_requested:
+                        # Cola del audio: completar el último frame con silencio
+                        pad = FRAME_BYTES - len(buf)
+                        buf.extend(SILENCE * pad)
+                        self._queued_bytes += pad
+                        frames = 1
+                    else:
+                        # Esperar más audio para completar el frame
+                        self._wakeup.clear()
+                        await self._wakeup.wait()
+                        continue
+                frames = min(frames, self.group_frames)
+
+                delay = self._pace_delay(frames)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue   # re-evaluar: pudo llegar un clear() durante la espera
+
+                n = frames * FRAME_BYTES
+                payload = base64.b64encode(memoryview(buf)[:n]).decode("ascii")
+                del buf[:n]
+                self._queued_bytes -= n
+                if not buf:
+                    self._items.popleft()
+
+                await self._send_media(payload, n)
+                self._clock_sent_ms += frames * FRAME_MS
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error en el envío de audio a Twilio: {e}", exc_info=True)
+            self._items.clear()
+            self._queued_bytes = 0
+            self._idle.set()
+
+    async def _send_media(self, payload: str, n_bytes: int) -> None:
+        if not self.stream_sid:
+            return
+        await self._send_text(
+            '{"event":"media","streamSid":"%s","media":{"payload":"%s"}}'
+            % (self.stream_sid, payload)
+        )
+        self.bytes_sent += n_bytes
+        if self._on_next_media is not None:
+            callback, self._on_next_media = self._on_next_media, None
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Callback de primer audio falló: {e}")
+
+    async def _send_text(self, message: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            await self._send(message)
+        except Exception as e:
+            # WS cerrado: no tiene caso seguir enviando nada de esta llamada
+            logger.warning(f"⚠️ websocket_send falló: {e}")
+            self._closed = True
+            self._items.clear()
+            self._queued_bytes = 0
+            self._idle.set()
+            return
+        dt_ms = (time.perf_counter() - t0) * 1000
+        self.messages_sent += 1
+        self.send_time_total_ms += dt_ms
+        if dt_ms > self.send_time_max_ms:
+            self.send_time_max_ms = dt_ms
@@ -425,11 +425,12 @@ async def cierre_con_despedida(manager, reason: str, delay: float = 5.0):
         # --- MODIFICACIÓN ---
         # Activamos el modo "ignorar STT" inmediatamente
         manager.ignorar_stt = True
+        manager.finalizar_llamada_pendiente = True   # la despedida no admite barge-in
         logger.info("🤫 Activando ignorar_stt para la secuencia de cierre.")
         # --- FIN DE LA MODIFICACIÓN ---
 
         # 1️⃣  Despedida
-        await manager.handle_tts_response(FAREWELL, None)
+        await manager.handle_tts_response(FAREWELL, None, cache=True)
 
         # 2️⃣  Pausa
         logger.info("⏳ Esperando %.1fs antes de colgar…", delay)
@@ -0,0 +1,126 @@
+# vad.py
+# -*- coding: utf-8 -*-
+"""
+Detector de actividad de voz (VAD) local sobre audio μ-law 8 kHz
+─────────────────────────────────────────────────────────────────
+• Decodifica μ-law con una tabla de 256 entradas (NumPy, sin audioop) y
+  calcula energía y cruces por cero de TODOS los frames de 20 ms del
+  payload en una sola pasada vectorizada.
+• Un frame es voz si su energía supera el piso de ruido por VAD_MARGIN_DB
+  (y el mínimo absoluto VAD_MIN_DB) y su tasa de cruces por cero no es de
+  siseo/ruido blanco. El piso de ruido se aprende de los frames sin voz.
+• Histéresis: "speech_start" tras START_FRAMES frames de voz seguidos,
+  "speech_end" tras HANGOVER_FRAMES frames sin voz.
+• Un VoiceActivityDetector por llamada (guarda estado entre payloads).
+"""
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+FRAME_BYTES = 160            # 20 ms a 8 kHz
+FRAME_MS = 20
+
+VAD_MIN_DB = -50.0           # dBFS: por debajo nunca es voz
+VAD_MARGIN_DB = 10.0         # dB sobre el piso de ruido
+VAD_ZCR_MAX = 0.45           # cruces por cero/muestra; más alto = siseo
+START_FRAMES = 3             # 60 ms de voz para abrir
+HANGOVER_FRAMES = 15         # 300 ms de silencio para cerrar
+NOISE_FLOOR_INIT = -60.0
+NOISE_FLOOR_RANGE = (-80.0, -30.0)
+NOISE_RISE = 0.02            # el piso sube despacio (no aprender la voz)…
+NOISE_FALL = 0.3             # …y baja rápido
+
+SPEECH_START = "speech_start"
+SPEECH_END = "speech_end"
+
+_NO_EVENTS: Tuple[str, ...] = ()
+
+
+def _mulaw_table() -> np.ndarray:
+    """Tabla G.711 μ-law → PCM lineal int16 (256 entradas)."""
+    u = (~np.arange(256, dtype=np.uint8)).astype(np.int32)
+    exponent = (u >> 4) & 0x07
+    mantissa = u & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(u & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+MULAW_TO_PCM = _mulaw_table()
+_FULL_SCALE_SQ = 32768.0 * 32768.0
+
+
+def frame_features(mulaw: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    mulaw: uint8 con forma (n_frames, FRAME_BYTES).
+    Devuelve (energía en dBFS, tasa de cruces por cero) por frame.
+    """
+    pcm = MULAW_TO_PCM[mulaw].astype(np.float32)
+    power = np.mean(pcm * pcm, axis=1)
+    energy_db = 10.0 * np.log10(power / _FULL_SCALE_SQ + 1e-12)
+    crossings = np.count_nonzero(np.diff(np.signbit(pcm), axis=1), axis=1)
+    return energy_db, crossings / (FRAME_BYTES - 1)
+
+
+class VoiceActivityDetector:
+    """VAD por energía + cruces por cero con histéresis y piso de ruido adaptativo."""
+
+    def __init__(self) -> None:
+        self.speaking = False
+        self.noise_floor_db = NOISE_FLOOR_INIT
+        self.silence_ms = 0          # desde el último frame con voz
+        self.speech_frames = 0
+        self.frames = 0
+        self._run = 0                # frames seguidos en el estado contrario
+        self._carry = b""            # resto < FRAME_BYTES del payload anterior
+
+    def process(self, payload: bytes) -> Tuple[str, ...]:
+        """Analiza un payload μ-law y devuelve los eventos ocurridos (normalmente ninguno)."""
+        if self._carry:
+            payload = self._carry + payload
+        n = len(payload) // FRAME_BYTES
+        self._carry = bytes(payload[n * FRAME_BYTES:])
+        if not n:
+            return _NO_EVENTS
+
+        frames = np.frombuffer(payload, dtype=np.uint8, count=n * FRAME_BYTES).reshape(n, FRAME_BYTES)
+        energy_db, zcr = frame_features(frames)
+
+        events = _NO_EVENTS
+        for db, rate in zip(energy_db.tolist(), zcr.tolist()):
+            event = self._step(db, rate)
+            if event:
+                events = events + (event,)
+        return events
+
+    def _step(self, db: float, zcr: float) -> str:
+        self.frames += 1
+        is_voice = db >= max(VAD_MIN_DB, self.noise_floor_db + VAD_MARGIN_DB) and zcr <= VAD_ZCR_MAX
+
+        if is_voice:
+            self.speech_frames += 1
+            self.silence_ms = 0
+        else:
+            self.silence_ms += FRAME_MS
+            alpha = NOISE_RISE if db > self.noise_floor_db else NOISE_FALL
+            lo, hi = NOISE_FLOOR_RANGE
+            self.noise_floor_db = min(hi, max(lo, self.noise_floor_db + alpha * (db - self.noise_floor_db)))
+
+        if is_voice != self.speaking:
+            self._run += 1
+            if self._run >= (START_FRAMES if is_voice else HANGOVER_FRAMES):
+                self.speaking = is_voice
+                self._run = 0
+                return SPEECH_START if is_voice else SPEECH_END
+        else:
+            self._run = 0
+        return ""
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "speech_ratio": round(self.speech_frames / self.frames, 3) if self.frames else 0.0,
+            "noise_floor_db": round(self.noise_floor_db, 1),
+        }